@@ -12,6 +12,7 @@ py main_bag_to_csv_py3.py -s 'D:/MappingVanData/RawBags/TestTrack/Scenario 1.6/2
 py main_bag_to_csv_py3.py -s 'D:/MappingVanData/RawBags/TestTrack/Scenario 1.6/2024-09-17' -d 'C:/Users/snb10/Desktop/SourceTree_Repos/IVSG/FeatureExtraction/DataClean/LargeData/ParsedBags/TestTrack/Scenario 1.6/2024_09_17' -a
 py main_bag_to_csv_py3.py -s 'D:/ParseTestInput' -d 'D:/ParseTestOutput' -b mapping_van_2024-07-10-19-35-02_2.bag
 py main_bag_to_csv_py3.py -s 'D:/ParseTestInput' -d 'D:/ParseTestOutput' -a
+py main_bag_to_csv_py3.py -s 'D:/ParseTestInput' -d 'D:/ParseTestOutput' -a -j 16
 
 Notes: flag_camera_parsing =1 if you want to parse camera topics into csv.
 
@@ -42,6 +43,17 @@ VERSIONS:
 -- Both packet_time and column_time are nanoseconds, but packet_time uses UTC_Time, 
 -- while column_time uses the internal clock of the sensor (sensor_time)
 -- These two times are added to track the time for each single packet or each single point to fix the motion distortion
+2026-10-18
+-- Add flag_single_pass, all csv, Sick and velodyne_points topics are written from a single read of the bag (see topicWriters.py)
+-- Get the list of topics from the bag index (parseUtilities.getBagTopicInfo) instead of reading every message
+-- Add optional input -j, the number of bag files parsed at the same time, each in its own process (see parseBagFile)
+-- Add flag_ply_binary, LiDAR scans are saved to binary_little_endian PLY files (see parseUtilities.writePLY)
+-- Velodyne packets are decoded in the same read of the bag as the other topics, instead of reading /velodyne_packets twice (see velodynePacketsTopicWriter)
+-- Add flag_scan_archive, LiDAR scans of a bag can be packed into one file with an md5 index (see scanArchive.py)
+-- Fields of the csv topics are taken out by a messageExtractor built from the message class, instead of splitting str(msg) (see topicWriters.py)
+-- Add flag_columnar_output, csv topics can be written as Parquet or Arrow IPC files with typed columns (see columnarTopicWriter)
+-- Add flag_camera_pass_through, camera frames are saved with their original jpeg bytes (see parseCamera.saveMD5JPEG)
+-- Add a parse journal, outputs are written under temporary names and a stopped run resumes where it stopped (see parseJournal.py)
 
 TO-DO ITEMS:
 2024-10-06 - Added by S. Brennan
@@ -58,7 +70,11 @@ import shutil #for file management, copy file
 import velodyne_decoder as vd
 import numpy as np
 import hashlib
+import parseUtilities
 from parseCamera import parseCamera
+from scanArchive import scanArchiveWriter
+from parseJournal import parseJournal, partName, commitFile
+from topicWriters import csvTopicWriter, columnarTopicWriter, sickTopicWriter, velodynePointsTopicWriter, velodynePacketsTopicWriter, demultiplexBag
 from sensor_msgs.msg import PointCloud2
 from ouster.sdk import client
 from ouster.sdk import bag as ouster_bag
@@ -67,6 +83,7 @@ import matplotlib.pyplot as plt  # type: ignore
 from ouster.sdk.examples.colormaps import normalize
 from pathlib import Path
 import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 ###################################################################
 #   _    _                  _____      _   _   _                 
@@ -103,6 +120,7 @@ argParser.add_argument('-s', '--sourcePath', required=True, help='Directory to t
 argParser.add_argument('-d', '--destinationPath', required=True, help='Directory to the destination folder.',type = str)
 argParser.add_argument('-b', '--bagName', required=False, help='Bag name of specific file that user wants to parse.')
 argParser.add_argument('-a', '--allBagFiles', required=False, action='store_true', help='Parse all bag files in source path and its subfolders.')
+argParser.add_argument('-j', '--jobs', required=False, default=1, type=int, help='Number of bag files to parse at the same time, each in its own process.')
 
 # NOTE: The following need to be deleted later
 ## For Xinyu's computer
@@ -113,37 +131,55 @@ argParser.add_argument('-a', '--allBagFiles', required=False, action='store_true
 # sourcePathForBagFiles = "D:/MappingVanData/RawBags/TestTrack/BaseMap/2024-08-05"
 # destinationPathForParsedOutputs = "C:/Users/snb10/Desktop/SourceTree_Repos/IVSG/FeatureExtraction/DataClean/LargeData/ParsedBags/TestTrack/BaseMap/2024_08_05"
 
-userInputArgs = argParser.parse_args()
-sourcePathForBagFiles = userInputArgs.sourcePath
-destinationPathForParsedOutputs = userInputArgs.destinationPath
-
-# Check whether arguments are strings, if not change to string
-# if not isinstance(sourcePathForBagFiles, str):
-# 	sourcePathForBagFiles = str(sourcePathForBagFiles)
-
-# if not isinstance(destinationPathForParsedOutputs, str):
-# 	destinationPathForParsedOutputs = str(destinationPathForParsedOutputs)
-# print (sourcePathForBagFiles)
 # Initialize hash tree names for Velodyne LiDAR and cameras. A standard format in the team is to put the date onto the hash table name. 
 # The hash table is named according to the sourcePathForBagFiles
 # Example: sourcePathForBagFiles = "F:/GIT Files/FieldDataCollection_DataCollectionProcedures_ParseRawDataToDatabase/LargeData/Bad Bag Files"
 # hash trees will be 'hashVelodyne_Bad_Bag_Files' and 'hashCameras_Bad_Bag_Files'
 # The hash trees are put as subdirectories in destinationPathForParsedOutputs.
 
-siteFolderName = os.path.basename(sourcePathForBagFiles)
-siteFolderName_nonSpace = siteFolderName.replace(" ", "_")
-hashName_Velodyne = "hashVelodyne_" + siteFolderName_nonSpace
-hashName_Cameras = "hashCameras_" + siteFolderName_nonSpace
-hashName_OusterO1 = "hashOusterO1_" + siteFolderName_nonSpace
+def getHashNames(sourcePathForBagFiles):
+	siteFolderName = os.path.basename(sourcePathForBagFiles)
+	siteFolderName_nonSpace = siteFolderName.replace(" ", "_")
+	hashName_Velodyne = "hashVelodyne_" + siteFolderName_nonSpace
+	hashName_Cameras = "hashCameras_" + siteFolderName_nonSpace
+	hashName_OusterO1 = "hashOusterO1_" + siteFolderName_nonSpace
+	return hashName_Velodyne, hashName_Cameras, hashName_OusterO1
 
 # NOTE: for bag files that do not contain camera images, no images are produced. But even if flag_parse_camera is set to zero, an image-containing bag will still be parsed for the topics.
 # NOTE: setting the flag = 1 for the camera or lidar will produce a hash table
 # NOTE: for bag files with camera data, they usually ONLY contain camera data. There are generally no LIDAR, GPS, etc. topics - the only topic will be camera data.
 flag_parse_camera = 0
+
+# NOTE: with flag_camera_pass_through = 1, the jpeg bytes of each camera frame are hashed and saved into the camera hash table as they were recorded.
+# With flag_camera_pass_through = 0, each frame is decoded, hashed from its pixels and re-encoded with quality 100 (larger files, much slower).
+# The two modes give different hashes for the same frame, so the default stays 0 to keep the hashes of the frames already in the camera hash table.
+flag_camera_pass_through = 0
 flag_parse_velodyne = 1
 flag_parse_sick = 0
 flag_parse_ouster = 0
 
+# NOTE: with flag_single_pass = 1, the bag is read once and every message is sent to the writer of its topic (csv, Sick, velodyne_points, velodyne_packets).
+# With flag_single_pass = 0, the bag is read again for each topic. The Ouster and camera topics are still read on their own.
+flag_single_pass = 1
+
+# NOTE: with flag_ply_binary = 1, each LiDAR scan is written into a binary_little_endian PLY file straight from the numpy buffer.
+# With flag_ply_binary = 0, the scans are written as ascii PLY files, which are 3~4 times larger and much slower to write.
+flag_ply_binary = 1
+
+# NOTE: with flag_scan_archive = 1, the LiDAR scans of each bag are appended into one <bagName>.pack file in the hash folder, with a
+# <bagName>.index.json index (md5 -> offset, length, number of points, dtype), instead of one PLY file per scan. See scanArchive.py
+flag_scan_archive = 0
+
+# NOTE: flag_columnar_output selects the file format of the csv topics (GPS, encoder, trigger, ...)
+# 0: csv files, 1: Parquet files (zstd), 2: Arrow IPC files (.arrow), which can be memory mapped when they are read.
+# The Parquet and Arrow IPC files keep the type of each field and need polars (see columnarTopicWriter in topicWriters.py)
+flag_columnar_output = 0
+columnarExtensions = {1 : '.parquet', 2 : '.arrow'}
+
+# NOTE: the topics that have been parsed are recorded in this SQLite file in the destination folder. When the script is run again,
+# finished topics are skipped and topics that were stopped in the middle are parsed again. Delete the file to parse everything again.
+journalFileName = 'parseJournal.sqlite'
+
 ###################################################################
 #    _____          _         _____ _             _         _    _               
 #   / ____|        | |       / ____| |           | |       | |  | |              
@@ -156,89 +192,32 @@ flag_parse_ouster = 0
 # https://patorjk.com/software/taag/#p=display&f=Big&t=Code%20Starts%20Here
 ###################################################################
 
-###########################################################################
-#   _____      _   _        _____ _               _    
-#  |  __ \    | | | |      / ____| |             | |   
-#  | |__) |_ _| |_| |__   | |    | |__   ___  ___| | __
-#  |  ___/ _` | __| '_ \  | |    | '_ \ / _ \/ __| |/ /
-#  | |  | (_| | |_| | | | | |____| | | |  __/ (__|   < 
-#  |_|   \__,_|\__|_| |_|  \_____|_| |_|\___|\___|_|\_\              
-# To create this FIGlet, see:
-# https://patorjk.com/software/taag/#p=display&f=Big&t=Path%20Check
-###################################################################
-
-# For source path, we want to check whether the path exist
-if not os.path.exists(sourcePathForBagFiles):
-	print ('Warning: The source path does not exist or has incorrect file separators.')
-# After than check whether there are '\' used in the string, if exists, we should replace '\' with '/'
-
-if '\\' in sourcePathForBagFiles:
-	print ('Fixing file separators in sourcePath.')
-	sourcePathForBagFiles = sourcePathForBagFiles.replace('\\','/')
-
-# Check the path again after the replacement
-if not os.path.exists(sourcePathForBagFiles):
-	raise FileNotFoundError('The source path does not exist')
-
-# For destination path, we just want to make sure only '/' is used
-if '\\' in destinationPathForParsedOutputs:
-	print ('Fixing file separators in destinationPath.')
-	destinationPathForParsedOutputs = destinationPathForParsedOutputs.replace('\\','/')
-
-
-
-#verify correct input arguments: 5 or 6
-if (len(sys.argv) > 8):
-	print ("invalid number of arguments:   " + str(len(sys.argv)))
-	print ("should be 5: main_bag_to_csv_py3.py -s sourcePath -d destinationPath")
-	print ("or 6 : main_bag_to_csv_py3.py -s sourcePath -d destinationPath -a")
-	print ("or 7 : main_bag_to_csv_py3.py -s sourcePath -d destinationPath -b bagName")
-	sys.exit(1)
-elif (len(sys.argv) == 7):
-	inputBagName = userInputArgs.bagName
-	if not isinstance(inputBagName, str):
-		inputBagName = str(inputBagName)
-	listOfBagFiles = [inputBagName]
-	numberOfFiles = "1"
-	print ("reading only 1 bagfile: " + str(listOfBagFiles[0]))
-elif (len(sys.argv) == 6):
-	root_path = Path(sourcePathForBagFiles)
-	listOfBagFiles = [str(p.relative_to(root_path)) for p in root_path.rglob("*") if p.suffix in [".bag", ".active"]]
-	numberOfFiles = str(len(listOfBagFiles))
-	print ("reading all " + numberOfFiles + " bagfiles in current directory: \n")
-	for f in listOfBagFiles:
-		print (f)
-	print ("\n press ctrl+c in the next 5 seconds to cancel \n")
-	time.sleep(5)
-
-elif (len(sys.argv) == 5):
-	listOfBagFiles = [f for f in os.listdir(sourcePathForBagFiles) if f.endswith(".bag") or f.endswith(".active")]	#get list of only bag files in current dir.
-	numberOfFiles = str(len(listOfBagFiles))
-	print ("reading all " + numberOfFiles + " bagfiles in current directory: \n")
-	for f in listOfBagFiles:
-		print (f)
-	print ("\n press ctrl+c in the next 5 seconds to cancel \n")
-	time.sleep(5)
-else:
-	print ("bad argument(s): " + str(sys.argv))	#shouldnt really come up
-	sys.exit(1)
-
-
-
 # Choose timer to use
 # if sys.platform.startswith('win'):
 # 	default_timer = time.clock
 # else:
 default_timer = time.time
 
-total_start = default_timer()
-
 
-count_of_bagFile = 0
-for bagFile in listOfBagFiles:
-	count_of_bagFile += 1
+'''
+	============================= Function parseBagFile() ====================================
+	#	Purpose:
+	#		parse one bag file into the destination folder. This is the work done for
+	#		each bag, it can run in its own process since it opens its own rosbag and
+	#		writes to its own output folder
+	#
+	#	Input Variable:
+	#		bagFile								bag file name, relative to the source folder
+	#		sourcePathForBagFiles				directory to the source folder
+	#		destinationPathForParsedOutputs		directory to the destination folder
+	#
+	#	Output/Return:
+	#		bagFile, elapsed time in seconds
+	================================================================================
+'''
+def parseBagFile(bagFile, sourcePathForBagFiles, destinationPathForParsedOutputs):
 	start = default_timer()
-	print ("reading file " + str(count_of_bagFile) + " of  " + numberOfFiles + ": " + bagFile + "...")
+	hashName_Velodyne, hashName_Cameras, hashName_OusterO1 = getHashNames(sourcePathForBagFiles)
 
 	# If the bagFile contains the string "velodynePoints", we do not want to parse the file.
 	# These are bagFiles only collected for playback to check data on the mappingVan during data collection.
@@ -251,13 +230,10 @@ for bagFile in listOfBagFiles:
 			bag = rosbag.Bag(bagFilePath,'r')
 		except rosbag.ROSBagUnindexedException:
 			print(f"The bag file {bagFile} is unindexed, it won't be parsed")
-			continue
+			return bagFile, default_timer() - start
 		except Exception as e:
 			print(f"Error running rosbag command: {e}")
-			continue
-
-		bagContents = bag.read_messages()
-		bagName = bag.filename
+			return bagFile, default_timer() - start
 
 		#create a new directory
 		# folder = string.rstrip(bagName, ".bag")
@@ -272,20 +248,20 @@ for bagFile in listOfBagFiles:
 		#shutil.copyfile(bagName, folder + '/' + bagName)
 
 
-		#get list of topics from the bag
-		listOfTopics = []
-		for topic, msg, t in bagContents:
-			if topic not in listOfTopics:
-				listOfTopics.append(topic)
+		#get list of topics from the bag index, no message is read here
+		listOfTopics = list(parseUtilities.getBagTopicInfo(bag).keys())
+
+		# Topics that were finished by an earlier run are skipped, see parseJournal.py
+		journal = parseJournal(destinationPathForParsedOutputs + '/' + journalFileName)
 
 		
-		PC = parseCamera(destinationPathForParsedOutputs,bag,hashName_Cameras)
+		PC = parseCamera(destinationPathForParsedOutputs,bag,hashName_Cameras, passThrough = (flag_camera_pass_through == 1))
 		if flag_parse_camera == 1:
 			if '/rear_left_camera/image_rect_color/compressed' in listOfTopics:
 				time_start = time.time()
 				rear_left_image_topic = '/rear_left_camera/image_rect_color/compressed'
 				OutputFileName = PathForCurrentBag + '/' + rear_left_image_topic.replace('/', '_slash_') + '.txt'
-				PC.parseCamera(rear_left_image_topic, OutputFileName)
+				journal.runTopic(bagFile, rear_left_image_topic, OutputFileName, PC.parseCamera, rear_left_image_topic, OutputFileName)
 				listOfTopics.remove(rear_left_image_topic)
 				time_end = time.time()
 				time_elpased = time_end - time_start
@@ -295,7 +271,7 @@ for bagFile in listOfBagFiles:
 				time_start = time.time()
 				rear_center_image_topic = '/rear_center_camera/image_rect_color/compressed'
 				OutputFileName = PathForCurrentBag + '/' + rear_center_image_topic.replace('/', '_slash_') + '.txt'
-				PC.parseCamera(rear_center_image_topic, OutputFileName)
+				journal.runTopic(bagFile, rear_center_image_topic, OutputFileName, PC.parseCamera, rear_center_image_topic, OutputFileName)
 				listOfTopics.remove(rear_center_image_topic)
 				print("'rear_center_camera' has been parsed.")
 				time_end = time.time()
@@ -304,7 +280,7 @@ for bagFile in listOfBagFiles:
 				time_start = time.time()
 				rear_right_image_topic = '/rear_right_camera/image_rect_color/compressed'
 				OutputFileName = PathForCurrentBag + '/' + rear_right_image_topic.replace('/', '_slash_') + '.txt'
-				PC.parseCamera(rear_right_image_topic, OutputFileName)
+				journal.runTopic(bagFile, rear_right_image_topic, OutputFileName, PC.parseCamera, rear_right_image_topic, OutputFileName)
 				listOfTopics.remove(rear_right_image_topic)
 				print("'rear_right_camera' has been parsed.")
 				time_end = time.time()
@@ -313,19 +289,19 @@ for bagFile in listOfBagFiles:
 			if '/front_left_camera/image_rect_color/compressed' in listOfTopics:
 				front_left_image_topic = '/front_left_camera/image_rect_color/compressed'
 				OutputFileName = PathForCurrentBag + '/' + front_left_image_topic.replace('/', '_slash_') + '.txt'
-				PC.parseCamera(front_left_image_topic, OutputFileName)
+				journal.runTopic(bagFile, front_left_image_topic, OutputFileName, PC.parseCamera, front_left_image_topic, OutputFileName)
 				listOfTopics.remove(front_left_image_topic)
 				print("'front_left_camera' has been parsed.")
 			if '/front_center_camera/image_rect_color/compressed' in listOfTopics:
 				front_center_image_topic = '/front_center_camera/image_rect_color/compressed'
 				OutputFileName = PathForCurrentBag + '/' + front_center_image_topic.replace('/', '_slash_') + '.txt'
-				PC.parseCamera(front_center_image_topic, OutputFileName)
+				journal.runTopic(bagFile, front_center_image_topic, OutputFileName, PC.parseCamera, front_center_image_topic, OutputFileName)
 				listOfTopics.remove(front_center_image_topic)
 				print("'front_center_camera' has been parsed.")
 			if '/front_right_camera/image_rect_color/compressed' in listOfTopics:
 				front_right_image_topic = '/front_right_camera/image_rect_color/compressed'
 				OutputFileName = PathForCurrentBag + '/' + front_right_image_topic.replace('/', '_slash_') + '.txt'
-				PC.parseCamera(front_right_image_topic, OutputFileName)
+				journal.runTopic(bagFile, front_right_image_topic, OutputFileName, PC.parseCamera, front_right_image_topic, OutputFileName)
 				listOfTopics.remove(front_right_image_topic)
 				print("'front_right_camera' has been parsed.")
 
@@ -393,6 +369,7 @@ for bagFile in listOfBagFiles:
 
 		print ('For "{}", these {} topics will be parsed: \n{}'.format(bagFile,len(listOfTopics),listOfTopics))
 		
+		topicWritersForBag = {}
 		for topicName in listOfTopics:
 			# Create a new CSV file for each topic except LiDARs and cameras
 
@@ -402,165 +379,38 @@ for bagFile in listOfBagFiles:
 				
 			else:
 			
-				filename = PathForCurrentBag + '/' + topicName.replace('/', '_slash_') + '.csv'
+				filename = PathForCurrentBag + '/' + topicName.replace('/', '_slash_') + columnarExtensions.get(flag_columnar_output, '.csv')
 
-			if not os.path.exists(filename):
+			if not journal.isDone(bagFile, topicName):
 
 				if topicName == '/sick_lms_5xx/scan': #convert this topic into txt file 
 					if flag_parse_sick == 1:
 						OutputFileName = PathForCurrentBag + '/' + topicName.replace('/', '_slash_') + '.txt'
-						File = open(OutputFileName,"w")
-						#print("Parsing Laser...")
-						for topic, msg, t in bag.read_messages(topicName):
-						#	print msg
-							File.write(str(msg.header.seq))
-							File.write(',')
-							File.write(str(msg.header.stamp.secs))
-							File.write(',')
-							File.write(str(msg.header.stamp.nsecs))
-							File.write(',')
-							File.write(str(msg.angle_min))
-							File.write(',')
-							File.write(str(msg.angle_max))
-							File.write(',')
-							File.write(str(msg.angle_increment))
-							File.write(',')
-							File.write(str(msg.time_increment))
-							File.write(',')
-							File.write(str(msg.scan_time))
-							File.write(',')
-							File.write(str(msg.range_min))
-							File.write(',')
-							File.write(str(msg.range_max))
-							File.write(',')
-							File.write(', '.join(map(str,msg.ranges))) # This removes the leading and lagging parenthese from this message
-							File.write(',')
-							File.write(', '.join(map(str,msg.intensities))) # This removes the leading and lagging parenthese from this message
-							File.write('\n')
-
-						File.close()
+						topicWritersForBag[topicName] = sickTopicWriter(OutputFileName)
 					else:
 						print ('Sick LiDAR will not be parsed')
 				# Mose bag files do not contain /velodyne_points topics, keeping here just in case some old bag files need to be parsed
 				elif topicName == '/velodyne_points':
 					if flag_parse_velodyne==1:
 						OutputFileName = PathForCurrentBag + '/' + topicName.replace('/', '_slash_') + '.txt'
-						File = open(OutputFileName,"w")
 						VelodyneInfoFile = PathForCurrentBag +'/'+'velodyne_info.txt'
-						InfoFile = open(VelodyneInfoFile,'w')
-						for topic, msg, t in bag.read_messages(topicName):
-							InfoFile.write(', '.join(map(str,msg.fields))) # This removes the leading and lagging parenthese from this message
-							InfoFile.write('\n')
-							File.write(str(msg.header.seq))
-							File.write(',')
-							File.write(str(msg.header.stamp.secs))
-							File.write(',')
-							File.write(str(msg.header.stamp.nsecs))
-							File.write(',')
-							File.write(str(msg.height))
-							File.write(',')
-							File.write(str(msg.width))
-							File.write(',')
-							File.write(str(msg.is_bigendian))
-							File.write(',')
-							File.write(str(msg.point_step))
-							File.write(',')
-							File.write(str(msg.row_step))
-							File.write(',')
-							File.write(str(msg.is_dense))
-							File.write('\n')
-
-						File.close()
-						InfoFile.close()
+						topicWritersForBag[topicName] = velodynePointsTopicWriter(OutputFileName, VelodyneInfoFile)
 					else:
 						print ('Velodyne LiDAR velodyne_points topic will not be parsed')
 
 				elif topicName == '/velodyne_packets':
 
-					timestamp_first_packet = None
 					if flag_parse_velodyne==1:
-
-						LiDAR_Bag_Time = []
-						LiDAR_Header_Time = []
-						for topic, msg, bag_timestamp in bag.read_messages(topicName):
-
-							if timestamp_first_packet is None and len(msg.packets) > 0:
-								headerTimeSecs = msg.header.stamp.to_sec()
-								packetTimeSecs = msg.packets[0].stamp.to_sec()
-								timestamp_first_packet = (abs(headerTimeSecs - packetTimeSecs) < 0.05)
-
-							headerTime = msg.header.stamp.secs*10**(9) + msg.header.stamp.nsecs
-							LiDAR_Bag_Time.append(bag_timestamp.secs*10**(9) + bag_timestamp.nsecs)
-							LiDAR_Header_Time.append(headerTime)
-							
-
-						count_of_LiDARScan = 1
+						# The scans are decoded while the bag is read, together with the bag time and header time of each message
 						velodyne_folder = destinationPathForParsedOutputs + '/' + hashName_Velodyne
-						config = vd.Config(model = vd.Model.PuckHiRes)
-						config.timestamp_first_packet = timestamp_first_packet
-						try:	#else already exists
-							os.makedirs(velodyne_folder)
-						except:
-							pass
-							# print ('this folder already exists:', velodyne_folder)
-						lidar_topics = [topicName]
-						cloud_arrays = []
 						OutputFileName = PathForCurrentBag + '/' + topicName.replace('/', '_slash_') + '.txt'
-						# Open txt file
-						File = open(OutputFileName,"w")
-						# Write header to the txt file
-						# Header_Time is the time when the message is generated, ROS_Bag_Time is the timestamp when the message is recorded in the bags
-						LiDAR_info_header = "LiDAR Index, ROS_Bag_Time (nanoseconds), Header_Time (nanoseconds), Host Time (nanoseconds), Device Time (nanoseconds), LiDAR Hashtag"
-						File.write(LiDAR_info_header + "\n")
-						
-						
-						for stamp, points, topic, scan_frame_id in vd.read_bag(bagName, config, topicName, as_pcl_structs = True):
-			
-							points = np.ascontiguousarray(points)
-							num_points = np.shape(points)[0]
-							md5_scan = hashlib.md5(points).hexdigest()
-							hash_branch = velodyne_folder + '/' + md5_scan[0:2] + '/' + md5_scan[2:4] + '/'
-							points_file = hash_branch + str(md5_scan) + '.txt'
-							ply_file =  hash_branch + str(md5_scan) + '.ply'
-							try:
-								os.makedirs(hash_branch)
-							except:
-								pass
-								# print ('this folder already exists:', hash_branch)
-							File.write(str(count_of_LiDARScan))
-							File.write(',')
-							File.write(str(LiDAR_Bag_Time[count_of_LiDARScan-1]))
-							File.write(',')
-							File.write(str(LiDAR_Header_Time[count_of_LiDARScan-1]))
-							File.write(',')
-							File.write(str(int(stamp.host*10**(9))))
-							File.write(',')
-							File.write(str(int(stamp.device*10**(9))))
-							File.write(',')
-							File.write(str(md5_scan))
-							File.write('\n')
-							with open(ply_file, 'w') as f:
-								f.write(f"""ply
-									format ascii 1.0
-									element vertex {num_points}
-									property float x
-									property float y
-									property float z
-									property float intensity
-									property float time
-									property int column
-									property int ring
-									property int return_type
-									end_header
-									""")
-								np.savetxt(f, points, fmt ="%.8f %.8f %.8f %.8f %.8f %d %d %d")
-							# np.savetxt(points_file, points, delimiter=',')
-
-							# cloud_arrays.append(points)
-
-							count_of_LiDARScan += 1
-							
-						File.close()
+						scanArchive = None
+						if flag_scan_archive == 1:
+							# With -a, bagFolder has the subfolders of the bag, which the archive keeps so bags with the same name don't collide
+							packPath = velodyne_folder + '/' + bagFolder + '.pack'
+							os.makedirs(os.path.dirname(packPath), exist_ok = True)
+							scanArchive = scanArchiveWriter(packPath)
+						topicWritersForBag[topicName] = velodynePacketsTopicWriter(OutputFileName, velodyne_folder, flag_ply_binary == 1, scanArchive)
 					else:
 						print ('Velodyne LiDAR will not be parsed')
 
@@ -569,44 +419,22 @@ for bagFile in listOfBagFiles:
 						print ('Parsing function will be added later')
 					else:
 						print ('Ouster LiDAR will not be parsed')
+				elif flag_columnar_output in columnarExtensions:
+					topicWritersForBag[topicName] = columnarTopicWriter(filename, 'parquet' if flag_columnar_output == 1 else 'ipc')
 				else:
-					with open(filename, 'w+') as csvfile:
-						filewriter = csv.writer(csvfile, delimiter = ',')
-						firstIteration = True	#allows header row
-
-						for subtopic, msg, t in bag.read_messages(topicName):	# for each instant in time that has data for topicName
-							#parse data from this instant, which is of the form of multiple lines of "Name: value\n"
-
-							msgString = str(msg)
-
-							# msgList = string.split(msgString, '\n')
-							msgList = msgString.split('\n')
-							instantaneousListOfData = []
-							for nameValuePair in msgList:
-								# splitPair = string.split(nameValuePair, ':')
-								splitPair = nameValuePair.split(':')
-								for i in range(len(splitPair)):	#should be 0 to 1
-									# splitPair[i] = string.strip(splitPair[i])
-									splitPair[i] = splitPair[i].strip()
-								instantaneousListOfData.append(splitPair)
-							# print (instantaneousListOfData,t.secs,t.nsecs)
-							#write the first row from the first element of each pair
-							if firstIteration:	# header
-								headers = ["rosbagTimestamp"]	#first column header
-								for pair in instantaneousListOfData:
-									headers.append(pair[0])
-								filewriter.writerow(headers)
-								firstIteration = False
-							# write the value from each pair to the file
-							values = [str(t)]	#first column will have rosbag timestamp
-							for pair in instantaneousListOfData:
-								if len(pair) > 1:
-									values.append(pair[1])
-							filewriter.writerow(values)
+					topicWritersForBag[topicName] = csvTopicWriter(filename)
+
+				# Without the single pass flag, each topic is read from the bag on its own
+				if flag_single_pass == 0 and topicName in topicWritersForBag:
+					demultiplexBag(bag, {topicName : topicWritersForBag.pop(topicName)}, journal, bagFile)
 			else:
-				print ('This file has already existed:', filename)
+				print ('This topic has already been parsed:', topicName)
+
+		# With the single pass flag set, read the bag once and send each message to the writer of its topic
+		demultiplexBag(bag, topicWritersForBag, journal, bagFile)
 
 		bag.close()
+		journal.close()
 
 
 
@@ -630,16 +458,14 @@ for bagFile in listOfBagFiles:
 				bag = rosbag.Bag(bagFilePath)
 			except rosbag.ROSBagUnindexedException:
 				print(f"The bag file {bagFile} is unindexed, it won't be parsed")
-				continue
+				return bagFile, default_timer() - start
 			except Exception as e:
 				print(f"Error running rosbag command: {e}")
-				continue
+				return bagFile, default_timer() - start
 
-			bagContents = bag.read_messages()
-			listOfTopics = []
-			for topic, msg, t in bagContents:
-				if topic not in listOfTopics:
-					listOfTopics.append(topic)		
+			listOfTopics = list(parseUtilities.getBagTopicInfo(bag).keys())
+			# Topics that were finished by an earlier run are skipped, see parseJournal.py
+			journal = parseJournal(destinationPathForParsedOutputs + '/' + journalFileName)
 			current_path = os.getcwd()
 			parent_folder = os.path.dirname(current_path)
 			doc_folder = 'Documents'
@@ -686,7 +512,9 @@ for bagFile in listOfBagFiles:
 			# 			time_nsecs =t.nsecs
 			# 			current_row = [time_secs, time_nsecs, ax, ay, az, wx, wy, wz]
 			# 			filewriter.writerow(current_row)
-			if '/ousterO1/lidar_packets' in listOfTopics:
+			if '/ousterO1/lidar_packets' in listOfTopics and journal.isDone(bagFile, '/ousterO1/lidar_packets'):
+				print ('This topic has already been parsed:', '/ousterO1/lidar_packets')
+			elif '/ousterO1/lidar_packets' in listOfTopics:
 				topicName = '/ousterO1/lidar_packets'
 				LiDAR_Scans = iter(scanSource)		
 				# precompute xyzlut to save computation in a loop
@@ -710,12 +538,20 @@ for bagFile in listOfBagFiles:
 				# print (packet_count/64)
 				LiDARPacketFileName = PathForCurrentBag + '/' + topicName.replace('/', '_slash_') + '.txt'
 				# Open txt file
-				LiDARPacket_File = open(LiDARPacketFileName,"w")
+				journal.markStarted(bagFile, topicName, LiDARPacketFileName)
+				LiDARPacket_File = open(partName(LiDARPacketFileName),"w")
 				# Write header to the txt file
 				LiDAR_info_header = "LiDAR Frame ID, First Valid Packet Time, Last Packet Time, LiDAR Hashtag"
 				LiDARPacket_File.write(LiDAR_info_header + "\n")
+				ousterArchive = None
+				if flag_scan_archive == 1:
+					packPath = ousterO1_folder + '/' + bagFolder + '.pack'
+					os.makedirs(os.path.dirname(packPath), exist_ok = True)
+					ousterArchive = scanArchiveWriter(packPath)
 				# Each scan has 64 packets, and each packet has 16 columns, but not all packets or columns are valid
+				numberOfScans = 0
 				for idx, scan in enumerate(LiDAR_Scans):
+					numberOfScans += 1
 					xyz = xyzlut(scan.field(client.ChanField.RANGE))
 					reflectivity = scan.field(client.ChanField.REFLECTIVITY)
 					reflectivity_3d = reflectivity[..., np.newaxis]
@@ -749,13 +585,6 @@ for bagFile in listOfBagFiles:
 					xyzirt_contiguous = np.ascontiguousarray(xyzirt_reshpaed)
 					md5_scan = hashlib.md5(xyzirt_contiguous).hexdigest()
 					frame_id = scan.frame_id
-					hash_branch = ousterO1_folder + '/' + md5_scan[0:2] + '/' + md5_scan[2:4] + '/'
-					points_file = hash_branch + str(md5_scan) + '.txt'
-					# NOTE: To do save franem_id, packet_time, md5_scan
-					try:
-						os.makedirs(hash_branch)
-					except:
-						pass
 					LiDARPacket_File.write(str(frame_id))
 					LiDARPacket_File.write(',')
 					LiDARPacket_File.write(str(first_packet_time))
@@ -764,25 +593,30 @@ for bagFile in listOfBagFiles:
 					LiDARPacket_File.write(',')
 					LiDARPacket_File.write(str(md5_scan))
 					LiDARPacket_File.write('\n')
-					ply_file = hash_branch + str(md5_scan) + '.ply'
 					num_points = np.shape(xyzirt_reshpaed)[0]
-					with open(ply_file, 'w') as f:
-						f.write(f"""ply
-								format ascii 1.0
-								element vertex {num_points}
-								property float x
-								property float y
-								property float z
-								property float intensity
-								property int ringID
-								property int packet_time
-								property int column_time
-								end_header
-								""")
-						np.savetxt(f, xyzirt_reshpaed, fmt ="%.8f %.8f %.8f %.4f %d %d %d")
+					# Keep the property names and types of the ascii PLY files. packet_time and column_time are already float64 in xyzirt, so they are kept as double
+					ousterPoints = np.rec.fromarrays(xyzirt_reshpaed.T, dtype = [('x','f4'), ('y','f4'), ('z','f4'), ('intensity','f4'), ('ringID','i4'), ('packet_time','f8'), ('column_time','f8')])
+					if ousterArchive is not None:
+						ousterArchive.add(md5_scan, ousterPoints)
+					else:
+						hash_branch = ousterO1_folder + '/' + md5_scan[0:2] + '/' + md5_scan[2:4] + '/'
+						# NOTE: To do save franem_id, packet_time, md5_scan
+						try:
+							os.makedirs(hash_branch)
+						except:
+							pass
+						ply_file = hash_branch + str(md5_scan) + '.ply'
+						parseUtilities.writePLY(ply_file, ousterPoints, "%.8f %.8f %.8f %.4f %d %d %d", binary = (flag_ply_binary == 1))
 					# np.savetxt(points_file, xyzir_reshpaed, delimiter=',')
 	
+				# The scans are saved before the txt file gets its final name, so every hash in the txt file can be found
+				if ousterArchive is not None:
+					ousterArchive.close()
 				LiDARPacket_File.close()
+				commitFile(LiDARPacketFileName)
+				journal.markDone(bagFile, topicName, numberOfScans, LiDARPacketFileName)
+
+			journal.close()
 
 			
 
@@ -790,8 +624,104 @@ for bagFile in listOfBagFiles:
 		else:
 			print ("Ouster LiDAR won't be parsed")
 
-print ("Done reading all " + numberOfFiles + " bag files.")
+	return bagFile, default_timer() - start
 
-total_finish = default_timer()
 
-print ("Total time: " + str(total_finish-total_start) + " seconds.")
+###########################################################################
+#   _____      _   _        _____ _               _    
+#  |  __ \    | | | |      / ____| |             | |   
+#  | |__) |_ _| |_| |__   | |    | |__   ___  ___| | __
+#  |  ___/ _` | __| '_ \  | |    | '_ \ / _ \/ __| |/ /
+#  | |  | (_| | |_| | | | | |____| | | |  __/ (__|   < 
+#  |_|   \__,_|\__|_| |_|  \_____|_| |_|\___|\___|_|\_\              
+# To create this FIGlet, see:
+# https://patorjk.com/software/taag/#p=display&f=Big&t=Path%20Check
+###################################################################
+
+def main():
+	userInputArgs = argParser.parse_args()
+	sourcePathForBagFiles = userInputArgs.sourcePath
+	destinationPathForParsedOutputs = userInputArgs.destinationPath
+
+	# For source path, we want to check whether the path exist
+	if not os.path.exists(sourcePathForBagFiles):
+		print ('Warning: The source path does not exist or has incorrect file separators.')
+	# After than check whether there are '\' used in the string, if exists, we should replace '\' with '/'
+
+	if '\\' in sourcePathForBagFiles:
+		print ('Fixing file separators in sourcePath.')
+		sourcePathForBagFiles = sourcePathForBagFiles.replace('\\','/')
+
+	# Check the path again after the replacement
+	if not os.path.exists(sourcePathForBagFiles):
+		raise FileNotFoundError('The source path does not exist')
+
+	# For destination path, we just want to make sure only '/' is used
+	if '\\' in destinationPathForParsedOutputs:
+		print ('Fixing file separators in destinationPath.')
+		destinationPathForParsedOutputs = destinationPathForParsedOutputs.replace('\\','/')
+
+
+	if userInputArgs.bagName is not None:
+		inputBagName = userInputArgs.bagName
+		if not isinstance(inputBagName, str):
+			inputBagName = str(inputBagName)
+		listOfBagFiles = [inputBagName]
+		numberOfFiles = "1"
+		print ("reading only 1 bagfile: " + str(listOfBagFiles[0]))
+	elif userInputArgs.allBagFiles:
+		root_path = Path(sourcePathForBagFiles)
+		listOfBagFiles = [str(p.relative_to(root_path)) for p in root_path.rglob("*") if p.suffix in [".bag", ".active"]]
+		numberOfFiles = str(len(listOfBagFiles))
+		print ("reading all " + numberOfFiles + " bagfiles in current directory: \n")
+		for f in listOfBagFiles:
+			print (f)
+		print ("\n press ctrl+c in the next 5 seconds to cancel \n")
+		time.sleep(5)
+	else:
+		listOfBagFiles = [f for f in os.listdir(sourcePathForBagFiles) if f.endswith(".bag") or f.endswith(".active")]	#get list of only bag files in current dir.
+		numberOfFiles = str(len(listOfBagFiles))
+		print ("reading all " + numberOfFiles + " bagfiles in current directory: \n")
+		for f in listOfBagFiles:
+			print (f)
+		print ("\n press ctrl+c in the next 5 seconds to cancel \n")
+		time.sleep(5)
+
+
+	total_start = default_timer()
+
+	numberOfJobs = max(1, userInputArgs.jobs)
+	totalBagTime = 0
+	if numberOfJobs == 1:
+		count_of_bagFile = 0
+		for bagFile in listOfBagFiles:
+			count_of_bagFile += 1
+			print ("reading file " + str(count_of_bagFile) + " of  " + numberOfFiles + ": " + bagFile + "...")
+			bagFile, bagTime = parseBagFile(bagFile, sourcePathForBagFiles, destinationPathForParsedOutputs)
+			totalBagTime += bagTime
+	else:
+		# Each bag is parsed in its own process, with its own rosbag handle and output folder
+		print ("reading " + numberOfFiles + " bag files with " + str(numberOfJobs) + " processes...")
+		with ProcessPoolExecutor(max_workers = numberOfJobs) as executor:
+			futures = {executor.submit(parseBagFile, bagFile, sourcePathForBagFiles, destinationPathForParsedOutputs) : bagFile for bagFile in listOfBagFiles}
+			count_of_bagFile = 0
+			for future in as_completed(futures):
+				count_of_bagFile += 1
+				try:
+					bagFile, bagTime = future.result()
+					totalBagTime += bagTime
+					print ("Done with file " + str(count_of_bagFile) + " of  " + numberOfFiles + ": " + bagFile + " in " + str(bagTime) + " seconds.")
+				except Exception as e:
+					print ("Error parsing " + futures[future] + ": " + str(e))
+
+	print ("Done reading all " + numberOfFiles + " bag files.")
+
+	total_finish = default_timer()
+
+	print ("Total time: " + str(total_finish-total_start) + " seconds.")
+	if numberOfJobs > 1:
+		print ("Sum of the parse time of each bag file: " + str(totalBagTime) + " seconds.")
+
+
+if __name__ == '__main__':
+	main()
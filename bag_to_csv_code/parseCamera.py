@@ -20,6 +20,10 @@ import numpy as np
 import datetime
 import cv2
 import parseUtilities
+import threading
+from parseJournal import partName, commitFile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 class parseCamera:
 
@@ -56,10 +60,14 @@ class parseCamera:
 		================================================================================
 	'''
 
-	def __init__(self, destinationPath,bag_file, hashName_Cameras):
+	def __init__(self, destinationPath,bag_file, hashName_Cameras, passThrough=False, numThreads=None):
 		self.destinationPath = destinationPath
 		self.bag_file = bag_file
 		self.hashName_Cameras = hashName_Cameras
+		# With passThrough, the JPEG bytes of the message are hashed and saved as they are, see saveMD5JPEG()
+		self.passThrough = passThrough
+		# Number of threads that decode, hash and save the frames, one per core by default
+		self.numThreads = numThreads or os.cpu_count() or 1
 		
 		# self.output_file_name = output_file_name
 
@@ -146,10 +154,59 @@ class parseCamera:
 		
 
 		# from 0 to 100 (the higher is the better). Default value is 95.
-		cv2.imwrite(cameraHashLeaf, img, [int(cv2.IMWRITE_JPEG_QUALITY), 100])
+		success, jpegBuffer = cv2.imencode('.jpg', img, [int(cv2.IMWRITE_JPEG_QUALITY), 100])
+		self.writeHashFile(cameraHashLeaf, jpegBuffer)
 
 		return md5_filename
 
+	'''
+		============================= Method saveMD5JPEG() ====================================
+		Method Purpose:
+			save the compressed bytes of a CompressedImage message, without decoding
+			and re-encoding them, into the folder with hash value filename as .jpg format
+		Input Variable:
+			jpegBytes:	msg.data of a jpeg CompressedImage message
+
+		Output/Return:
+			md5 hash of the jpeg bytes
+
+		Restrictions/Notes:
+			The hash is computed from the jpeg bytes, not from the decoded pixels as in
+			saveMD5Image(), so the same frame gets a different hash in the two modes.
+			A frame that is already in the hash table is not written again.
+
+		================================================================================
+	'''
+
+	def saveMD5JPEG(self, jpegBytes):
+
+		md5_filename = hashlib.md5(jpegBytes).hexdigest()
+
+		# No sub folder for each camera, save all images in the same hash table
+		cameraHashBranch = self.destinationPath + '/' + self.hashName_Cameras + '/' + md5_filename[0:2] + '/' + md5_filename[2:4]
+		cameraHashLeaf = cameraHashBranch + '/' + md5_filename + '.jpg'
+		if not os.path.exists(cameraHashLeaf):
+			self.make_sure_path_exists(cameraHashBranch)
+			self.writeHashFile(cameraHashLeaf, jpegBytes)
+
+		return md5_filename
+
+	'''
+		============================= Method writeHashFile() ====================================
+		Method Purpose:
+			write an image into the hash table through a temporary file that is renamed
+			once it is complete, so a stopped run never leaves a truncated image. The
+			temporary name includes the thread, since two threads may save the same frame
+		================================================================================
+	'''
+
+	def writeHashFile(self, cameraHashLeaf, data):
+
+		partFileName = cameraHashLeaf + '.' + str(threading.get_ident()) + '.part'
+		with open(partFileName, 'wb') as f:
+			f.write(data)
+		os.replace(partFileName, cameraHashLeaf)
+
 	def rotateImage(self, img, angle):
 
 		(h, w) = img.shape[:2]
@@ -165,6 +222,74 @@ class parseCamera:
 
 		return datetime.datetime.fromtimestamp(int(unix_time)).strftime('%Y-%m-%d %H:%M:%S')
 	
+	'''
+		============================= Method saveFrame() ====================================
+		Method Purpose:
+			hash and save one CompressedImage message into the camera hash table,
+			this method runs in the threads of parseCamera()
+		Input Variable:
+			image_topic, msg, rotate, angle
+
+		Output/Return:
+			md5 hash of the frame
+		================================================================================
+	'''
+
+	def saveFrame(self, image_topic, msg, rotate, angle):
+		# This must be used for compressed images. CvBridge does not
+		# support compressed images.
+		# http://wiki.ros.org/rospy_tutorials/Tutorials/WritingImagePublisherSubscriber
+		# In pass-through mode, jpeg frames are only decoded when they need to be rotated
+		if self.passThrough and rotate is not True and 'jpeg' in msg.format:
+			return self.saveMD5JPEG(msg.data)
+
+		np_arr = np.frombuffer(msg.data, np.uint8)
+		img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+
+		if rotate is True:
+			img = self.rotateImage(img, angle)
+
+		# This can be used for raw images, but not for compressed. CvBridge
+		# does not support compressed images.
+		# https://gist.github.com/wngreene/835cda68ddd9c5416defce876a4d7dd9
+		# try:
+		# 	img = self.bridge.imgmsg_to_cv2(msg)
+		# except CvBridgeError, e:
+		# 	print e
+
+		# img = cv2.undistort(img,K_left,D_left)
+
+		return self.saveMD5Image(image_topic,img)
+
+	'''
+		============================= Method writeFrameInfo() ====================================
+		Method Purpose:
+			write the line of one frame into the index txt file, once its hash is known
+		Input Variable:
+			file, future (returns the md5 hash of the frame), msg, bag_timestamp
+		================================================================================
+	'''
+
+	def writeFrameInfo(self, file, future, msg, bag_timestamp):
+		md5_filename = future.result()
+
+		header_time_nanoseconds = repr(msg.header.stamp.secs*10**(9) + msg.header.stamp.nsecs)
+		bag_time_nanoseconds = repr(bag_timestamp.secs*10**(9) + bag_timestamp.nsecs)
+		file.write(str(msg.header.seq + 1))
+		file.write(',')
+		file.write(str(parseUtilities.unixTimeToTimeStamp(msg.header.stamp.secs)))
+		file.write(',')
+		file.write(str(msg.header.stamp.secs))
+		file.write(',')
+		file.write(str(msg.header.stamp.nsecs))
+		file.write(',')
+		file.write(header_time_nanoseconds)
+		file.write(',')
+		file.write(bag_time_nanoseconds)
+		file.write(',')
+		file.write(str(md5_filename))
+		file.write('\n')
+
 	'''
 		============================= Method parseCamera() ====================================
 		#	Method Purpose:
@@ -225,54 +350,26 @@ class parseCamera:
 		# file.close()
 		#values=[bag_file_id,sensor_id, msg.K[0], msg.K[4], msg.K[2], msg.K[5], msg.K[1], msg.width, msg.height, msg.D[0], msg.D[1], msg.D[2], msg.D[3], msg.D[4]]
 
-		file = open(output_file_name_images, "w")
+		# The txt file is renamed to output_file_name_images once all the frames are saved (see parseJournal.py)
+		file = open(partName(output_file_name_images), "w")
 		# Write header to the txt file
 		Camera_info_header = "Camera Index, Local Time, ROS Time Second, ROS Time Nanosecond, ROS Time (nanosecond), Bag Time (nanosecond), Camera Hashtag"
 		file.write(Camera_info_header + "\n")
 		number_of_messages = self.bag_file.get_message_count(topic_filters=image_topic)
 
-		count_of_camera_frame = 1
-		for topic, msg, bag_timestamp in self.bag_file.read_messages(topics=[image_topic]):
-			# This must be used for compressed images. CvBridge does not
-			# support compressed images.
-			# http://wiki.ros.org/rospy_tutorials/Tutorials/WritingImagePublisherSubscriber
-			np_arr = np.fromstring(msg.data, np.uint8)
-			img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
-			if rotate is True:
-				img = self.rotateImage(img, angle)
-
-			# This can be used for raw images, but not for compressed. CvBridge
-			# does not support compressed images.
-			# https://gist.github.com/wngreene/835cda68ddd9c5416defce876a4d7dd9
-			# try:
-			# 	img = self.bridge.imgmsg_to_cv2(msg)
-			# except CvBridgeError, e:
-			# 	print e
-
-			# img = cv2.undistort(img,K_left,D_left)
-
-			md5_filename = self.saveMD5Image(image_topic,img)
-			# Uncomment the following line to show the progress in the terminal
-			# parseUtilities.printProgress(count_of_camera_frame, number_of_messages, prefix='Progress:', suffix='Complete', decimals=1, length=50)
-
-			header_time_nanoseconds = repr(msg.header.stamp.secs*10**(9) + msg.header.stamp.nsecs)
-			bag_time_nanoseconds = repr(bag_timestamp.secs*10**(9) + bag_timestamp.nsecs)
-			file.write(str(msg.header.seq + 1))
-			file.write(',')
-			file.write(str(parseUtilities.unixTimeToTimeStamp(msg.header.stamp.secs)))
-			file.write(',')
-			file.write(str(msg.header.stamp.secs))
-			file.write(',')
-			file.write(str(msg.header.stamp.nsecs))
-			file.write(',')
-			file.write(header_time_nanoseconds)
-			file.write(',')
-			file.write(bag_time_nanoseconds)
-			file.write(',')
-			file.write(str(md5_filename))
-			file.write('\n')
-
-			count_of_camera_frame += 1
+		# Frames are decoded, hashed and saved by a pool of threads (cv2 and hashlib release the GIL), while the
+		# index txt file is still written in the order of the frames. At most 2*numThreads frames are in flight.
+		pendingFrames = deque()
+		with ThreadPoolExecutor(max_workers=self.numThreads) as pool:
+			for topic, msg, bag_timestamp in self.bag_file.read_messages(topics=[image_topic]):
+				pendingFrames.append((pool.submit(self.saveFrame, image_topic, msg, rotate, angle), msg, bag_timestamp))
+				if len(pendingFrames) >= 2*self.numThreads:
+					self.writeFrameInfo(file, *pendingFrames.popleft())
+
+			while pendingFrames:
+				self.writeFrameInfo(file, *pendingFrames.popleft())
 
 		file.close()
+		commitFile(output_file_name_images)
+
+		return number_of_messages
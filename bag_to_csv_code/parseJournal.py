@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+python 3.9
+
+Journal of the parsed topics, used by main_bag_to_csv_py3.py to resume a run that was stopped.
+
+The journal is a small SQLite file, parseJournal.sqlite, in the destination folder. It has
+one row for each bag and topic:
+
+	bag, topic, status ('started' or 'done'), rows, output, checksum (md5 of the output), finished
+
+Every output file is first written under a temporary name, <fileName>.part, and is renamed to
+its final name only once it is complete (see partName() and commitFile()). A topic is marked
+'done' after its output files have been renamed. When a run is restarted:
+	- topics that are 'done' are skipped
+	- topics that were 'started' but not finished are parsed again, their .part files are
+	  overwritten, so no truncated file is ever kept under its final name
+
+SQLite handles the locking, so the bags parsed at the same time with -j share one journal.
+
+Supervised by Professor Sean Brennan
+'''
+
+import os
+import time
+import sqlite3
+import hashlib
+
+
+'''
+	============================= Function partName() ====================================
+	#	Purpose:
+	#		name of the temporary file that an output is written into
+	================================================================================
+'''
+def partName(fileName):
+	return fileName + '.part'
+
+
+'''
+	============================= Function commitFile() ====================================
+	#	Purpose:
+	#		rename a complete temporary file to its final name, in one step
+	================================================================================
+'''
+def commitFile(fileName):
+	os.replace(partName(fileName), fileName)
+
+
+'''
+	============================= Function discardFile() ====================================
+	#	Purpose:
+	#		remove the temporary file of an output that was not finished
+	================================================================================
+'''
+def discardFile(fileName):
+	try:
+		os.remove(partName(fileName))
+	except OSError:
+		pass
+
+
+'''
+	============================= Function fileChecksum() ====================================
+	#	Purpose:
+	#		md5 of a file, read in blocks of 1 MB
+	================================================================================
+'''
+def fileChecksum(fileName):
+	md5 = hashlib.md5()
+	with open(fileName, 'rb') as f:
+		for block in iter(lambda: f.read(1 << 20), b''):
+			md5.update(block)
+	return md5.hexdigest()
+
+
+class parseJournal:
+
+	'''
+		============================= Class parseJournal ====================================
+		#	Purpose:
+		#		record which topics of which bags have been parsed
+		#
+		#	Input Variable:
+		#		journalFileName		path of the SQLite file, created if it does not exist
+		================================================================================
+	'''
+
+	def __init__(self, journalFileName):
+		# Other processes may be writing into the journal, wait for them instead of failing
+		self.connection = sqlite3.connect(journalFileName, timeout = 600)
+		self.connection.execute('''CREATE TABLE IF NOT EXISTS topics (
+			bag TEXT NOT NULL,
+			topic TEXT NOT NULL,
+			status TEXT NOT NULL,
+			rows INTEGER,
+			output TEXT,
+			checksum TEXT,
+			finished REAL,
+			PRIMARY KEY (bag, topic))''')
+		self.connection.commit()
+
+	def isDone(self, bagName, topicName):
+		row = self.connection.execute('SELECT status, output FROM topics WHERE bag = ? AND topic = ?', (bagName, topicName)).fetchone()
+		# A topic is only done if its output is still there
+		return row is not None and row[0] == 'done' and (row[1] is None or os.path.exists(row[1]))
+
+	def markStarted(self, bagName, topicName, outputFileName):
+		self.connection.execute('INSERT OR REPLACE INTO topics (bag, topic, status, output) VALUES (?, ?, ?, ?)', (bagName, topicName, 'started', outputFileName))
+		self.connection.commit()
+
+	def markDone(self, bagName, topicName, rows, outputFileName):
+		checksum = fileChecksum(outputFileName) if outputFileName is not None and os.path.exists(outputFileName) else None
+		self.connection.execute('INSERT OR REPLACE INTO topics (bag, topic, status, rows, output, checksum, finished) VALUES (?, ?, ?, ?, ?, ?, ?)',
+			(bagName, topicName, 'done', rows, outputFileName, checksum, time.time()))
+		self.connection.commit()
+
+	'''
+		============================= Method runTopic() ====================================
+		#	Purpose:
+		#		parse one topic with parseFunction, unless it is already done. parseFunction
+		#		must write outputFileName through partName()/commitFile() and return the
+		#		number of rows it wrote
+		#
+		#	Output/Return:
+		#		True if the topic was parsed, False if it was skipped
+		================================================================================
+	'''
+	def runTopic(self, bagName, topicName, outputFileName, parseFunction, *args, **kwargs):
+		if self.isDone(bagName, topicName):
+			print ('This topic has already been parsed:', topicName)
+			return False
+		self.markStarted(bagName, topicName, outputFileName)
+		rows = parseFunction(*args, **kwargs)
+		self.markDone(bagName, topicName, rows, outputFileName)
+		return True
+
+	def close(self):
+		self.connection.close()
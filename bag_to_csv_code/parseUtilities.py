@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
 import datetime
 
+import numpy as np
+
 
 def parseBagFileNameForDateTime(file_name):
 
@@ -68,4 +71,149 @@ def printProgress(iteration, total, prefix='', suffix='', decimals=1, length=100
 
 	# Print New Line on Complete
 	if iteration == total:
-		print()
\ No newline at end of file
+		print()
+
+'''
+	============================= Function getBagTopicInfo() ====================================
+	#	Purpose:
+	#		list the topics in a bag from the connection and chunk index of the bag, without
+	#		reading or deserializing any message
+	#
+	#	Input Variable:
+	#		bag					bag = rosbag.Bag(bagFilePath)
+	#
+	#	Output/Return:
+	#		topicInfo			dictionary of {topicName : info}, ordered by the time each topic
+	#							first appears in the bag. info is a dictionary with the keys:
+	#							msgType			message type, e.g. 'sensor_msgs/CompressedImage'
+	#							messageCount	number of messages of the topic
+	#							startTime		rosbag time of the first message (rospy.Time)
+	#							endTime			rosbag time of the last message (rospy.Time)
+	#
+	#	Restrictions/Notes:
+	#		The bag must be indexed, rosbag.Bag() raises ROSBagUnindexedException otherwise.
+	#		The types and counts come from bag.get_type_and_topic_info(). The times of each topic
+	#		are only in the index of the bag (see getTopicTimes); without them, startTime and
+	#		endTime are None and the topics are ordered by name.
+	================================================================================
+'''
+def getBagTopicInfo(bag):
+	topicInfo = {}
+	topicTimes = getTopicTimes(bag)
+
+	for topicName, topic in bag.get_type_and_topic_info().topics.items():
+		if topic.message_count == 0:
+			continue
+
+		startTime, endTime = topicTimes.get(topicName, (None, None))
+		topicInfo[topicName] = {
+			'msgType' : topic.msg_type,
+			'messageCount' : topic.message_count,
+			'startTime' : startTime,
+			'endTime' : endTime
+		}
+
+	if len(topicTimes) == 0:
+		return dict(sorted(topicInfo.items()))
+	return dict(sorted(topicInfo.items(), key = lambda item: (item[1]['startTime'] is None, item[1]['startTime'], item[0])))
+
+
+'''
+	============================= Function getTopicTimes() ====================================
+	#	Purpose:
+	#		get the rosbag time of the first and last message of each topic from the index of
+	#		the bag, without reading any message
+	#
+	#	Input Variable:
+	#		bag					bag = rosbag.Bag(bagFilePath)
+	#
+	#	Output/Return:
+	#		topicTimes			dictionary of {topicName : (startTime, endTime)}, empty if the
+	#							index can't be read
+	#
+	#	Restrictions/Notes:
+	#		rosbag has no public way to get the times of a topic, so this reads its private index
+	#		(bag._get_connections() and bag._connection_indexes). It is the only place that does;
+	#		if a rosbag version changes them, the topics are still listed, only not ordered by time.
+	================================================================================
+'''
+def getTopicTimes(bag):
+	topicTimes = {}
+	try:
+		for connection in bag._get_connections():
+			# Each index entry holds the time and position of one message of this connection
+			indexEntries = bag._connection_indexes.get(connection.id, [])
+			if len(indexEntries) == 0:
+				continue
+			startTime = min(entry.time for entry in indexEntries)
+			endTime = max(entry.time for entry in indexEntries)
+
+			# A topic can be recorded from more than one connection
+			if connection.topic in topicTimes:
+				oldStart, oldEnd = topicTimes[connection.topic]
+				startTime, endTime = min(oldStart, startTime), max(oldEnd, endTime)
+			topicTimes[connection.topic] = (startTime, endTime)
+
+	except (AttributeError, TypeError) as e:
+		print ('The times of the topics could not be read from the bag index, the topics are ordered by name:', e)
+		return {}
+
+	return topicTimes
+
+
+# PLY type names of the numpy types that can be written into a PLY file
+plyTypeNames = {'i1' : 'char', 'u1' : 'uchar', 'i2' : 'short', 'u2' : 'ushort',
+				'i4' : 'int', 'u4' : 'uint', 'f4' : 'float', 'f8' : 'double'}
+
+'''
+	============================= Function writePLY() ====================================
+	#	Purpose:
+	#		write a point cloud into a PLY file, either as binary_little_endian or as ascii
+	#
+	#	Input Variable:
+	#		plyFileName			name of the PLY file
+	#		points				structured numpy array, one element per point. The PLY
+	#							properties take the names and types of its fields
+	#		asciiFormat			fmt given to np.savetxt when the file is written as ascii,
+	#							e.g. "%.8f %.8f %.8f %.8f %.8f %d %d %d"
+	#		binary				True to write binary_little_endian, False to write ascii
+	#
+	#	Output/Return:
+	#		None
+	#
+	#	Restrictions/Notes:
+	#		In binary mode the points are written straight from the numpy buffer, no value
+	#		is formatted as text. The fields are packed and converted to little endian first
+	#		if they are not already.
+	================================================================================
+'''
+def writePLY(plyFileName, points, asciiFormat, binary=True):
+	# Pack the fields and make them little endian, so the buffer matches the PLY layout
+	packedDtype = np.dtype([(name, points.dtype.fields[name][0].newbyteorder('<')) for name in points.dtype.names])
+	if points.dtype != packedDtype:
+		points = points.astype(packedDtype)
+	points = np.ascontiguousarray(points)
+
+	headerLines = ['ply']
+	if binary:
+		headerLines.append('format binary_little_endian 1.0')
+	else:
+		headerLines.append('format ascii 1.0')
+	headerLines.append('element vertex ' + str(points.shape[0]))
+	for name in points.dtype.names:
+		fieldType = points.dtype.fields[name][0]
+		headerLines.append('property ' + plyTypeNames[fieldType.kind + str(fieldType.itemsize)] + ' ' + name)
+	headerLines.append('end_header')
+	header = '\n'.join(headerLines) + '\n'
+
+	# Write into a temporary file and rename it, so a stopped run never leaves a truncated scan in the hash table
+	partFileName = plyFileName + '.part'
+	if binary:
+		with open(partFileName, 'wb') as f:
+			f.write(header.encode('ascii'))
+			points.tofile(f)
+	else:
+		with open(partFileName, 'w') as f:
+			f.write(header)
+			np.savetxt(f, points, fmt = asciiFormat)
+	os.replace(partFileName, plyFileName)
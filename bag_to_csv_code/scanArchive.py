@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+python 3.9
+
+Packed storage for the LiDAR scans of one bag file.
+
+Instead of saving every scan into its own hashVelodyne_<site>/ab/cd/<md5>.ply file,
+the scans of a bag are appended into one binary pack file, <bagName>.pack, and a
+small index, <bagName>.index.json, is written next to it:
+
+	{
+		"dtypes": [ dtype of the scans, e.g. [["x", "<f4"], ["y", "<f4"], ...] ],
+		"scans": { md5 : [offset, length, number of points, index into dtypes] }
+	}
+
+The md5 hash of the scan stays the key, so velodyne_hash and ouster_hash in the
+database still point to the scan. The pack file holds the raw little-endian
+records of each scan, each one starting at a multiple of 8 bytes.
+
+scanArchiveReader maps the pack file into memory, and read(md5) returns the scan
+as a numpy view of the mapped file, without copying it.
+
+Supervised by Professor Sean Brennan
+'''
+
+import os
+import json
+import numpy as np
+from parseJournal import partName, commitFile, discardFile
+
+
+class scanArchiveWriter:
+
+	'''
+		============================= Class scanArchiveWriter ====================================
+		#	Purpose:
+		#		append LiDAR scans into one pack file and write the index when closed
+		#
+		#	Input Variable:
+		#		packFileName	path of the pack file, the index is saved as
+		#						<packFileName without .pack>.index.json
+		================================================================================
+	'''
+
+	def __init__(self, packFileName):
+		self.packFileName = packFileName
+		self.indexFileName = indexFileNameOf(packFileName)
+		# Written under a temporary name until close(), like the other outputs (see parseJournal.py)
+		self.File = open(partName(packFileName), 'wb')
+		self.offset = 0
+		self.dtypes = []
+		self.scans = {}
+
+	def add(self, md5_scan, points):
+		# The same scan is only stored once, like a hash file that would be overwritten
+		if md5_scan in self.scans:
+			return
+
+		points = np.ascontiguousarray(points, dtype = points.dtype.newbyteorder('<'))
+		dtypeDescr = [list(field) for field in points.dtype.descr]
+		if dtypeDescr not in self.dtypes:
+			self.dtypes.append(dtypeDescr)
+
+		# Start every scan at a multiple of 8 bytes
+		padding = (-self.offset) % 8
+		if padding:
+			self.File.write(b'\0' * padding)
+			self.offset += padding
+
+		points.tofile(self.File)
+		length = points.nbytes
+		self.scans[md5_scan] = [self.offset, length, int(points.shape[0]), self.dtypes.index(dtypeDescr)]
+		self.offset += length
+
+	def close(self):
+		self.File.close()
+		# Write the index into a temporary file first, so an interrupted run never leaves half an index
+		with open(partName(self.indexFileName), 'w') as f:
+			json.dump({'dtypes' : self.dtypes, 'scans' : self.scans}, f)
+		commitFile(self.packFileName)
+		commitFile(self.indexFileName)
+
+	def abort(self):
+		self.File.close()
+		discardFile(self.packFileName)
+
+
+class scanArchiveReader:
+
+	'''
+		============================= Class scanArchiveReader ====================================
+		#	Purpose:
+		#		read LiDAR scans back from a pack file written by scanArchiveWriter
+		#
+		#	Input Variable:
+		#		packFileName	path of the pack file
+		#
+		#	Example:
+		#		archive = scanArchiveReader(packFileName)
+		#		points = archive.read(md5_scan)	# numpy view of the scan, no copy
+		================================================================================
+	'''
+
+	def __init__(self, packFileName):
+		with open(indexFileNameOf(packFileName), 'r') as f:
+			index = json.load(f)
+		self.dtypes = [np.dtype([tuple(field) for field in descr]) for descr in index['dtypes']]
+		self.scans = index['scans']
+		# A bag without scans leaves an empty pack file, which np.memmap can't map
+		if os.path.getsize(packFileName) == 0:
+			self.pack = np.zeros(0, dtype = np.uint8)
+		else:
+			self.pack = np.memmap(packFileName, dtype = np.uint8, mode = 'r')
+
+	def __contains__(self, md5_scan):
+		return md5_scan in self.scans
+
+	def __len__(self):
+		return len(self.scans)
+
+	def keys(self):
+		return self.scans.keys()
+
+	def read(self, md5_scan):
+		offset, length, num_points, dtypeIndex = self.scans[md5_scan]
+		return self.pack[offset:offset + length].view(self.dtypes[dtypeIndex])
+
+
+'''
+	============================= Function indexFileNameOf() ====================================
+	#	Purpose:
+	#		get the name of the index file that belongs to a pack file
+	================================================================================
+'''
+def indexFileNameOf(packFileName):
+	if packFileName.endswith('.pack'):
+		packFileName = packFileName[:-len('.pack')]
+	return packFileName + '.index.json'
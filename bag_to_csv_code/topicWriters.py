@@ -0,0 +1,584 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+python 3.9
+
+Per-topic writers used by main_bag_to_csv_py3.py to parse a bag file in a single pass.
+
+Instead of calling bag.read_messages(topicName) once per topic, which decompresses and
+deserializes every chunk of the bag again for each topic, a writer is created for every
+topic that should be parsed. The bag is then read once with demultiplexBag() and each
+message is handed to the writer that owns its topic.
+
+Every writer has the same methods and attributes:
+	write(msg, t)	write one message (t is the rosbag timestamp)
+	close()			close the files of the writer and give them their final names
+	abort()			close the files of the writer and remove them, used when the bag could not be read to the end
+	fileName		main output file of the writer, recorded in the parse journal
+	rowCount		number of messages written
+
+The files are written under temporary names (see parseJournal.partName) until close() is called,
+so a run that is stopped never leaves a truncated file under the name of a finished one.
+
+Supervised by Professor Sean Brennan
+'''
+
+import csv
+import os
+import yaml
+try:	# polars is only needed for the Parquet / Arrow IPC output of columnarTopicWriter
+	import polars as pl
+except ImportError:
+	pl = None
+from functools import lru_cache
+from operator import attrgetter
+import hashlib
+import numpy as np
+import velodyne_decoder as vd
+import parseUtilities
+from parseJournal import partName, commitFile, discardFile
+
+
+# ROS field types that are written into a csv cell as they are
+primitiveTypes = {'bool', 'byte', 'char', 'int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32', 'int64', 'uint64', 'float32', 'float64'}
+
+# Message extractors that have already been built, by message type
+messageExtractors = {}
+
+
+'''
+	============================= Function yamlString() ====================================
+	#	Purpose:
+	#		write a string field the same way as str(msg) does, "..." (or '' when the
+	#		string is empty), so the csv files do not change. Strings such as frame_id
+	#		repeat in every message, so the results are cached
+	================================================================================
+'''
+@lru_cache(maxsize = 4096)
+def yamlString(value):
+	if not value:
+		return "''"
+	return yaml.dump(value, default_style = '"', width = float('inf')).rstrip('\n')
+
+
+def emptyCell(value):
+	return ''
+
+
+def noConversion(value):
+	return value
+
+
+def arrayString(value):
+	# uint8[] and char[] fields are bytes, str(msg) writes them as a list of numbers
+	return str(list(value))
+
+
+'''
+	============================= Class messageExtractor ====================================
+	#	Purpose:
+	#		write the fields of one message type into a csv row without going through
+	#		str(msg). The columns are built once from the __slots__ and _slot_types of
+	#		the message class, in the same order as the lines of str(msg):
+	#			- a nested message or a time/duration (e.g. header, stamp) has its own
+	#			  column with an empty value, followed by the columns of its fields
+	#			- numbers and bools are passed to the csv writer as they are
+	#			- strings are quoted like str(msg) does
+	#			- arrays of numbers, strings or bytes are written as [a, b, ...]
+	#			- arrays of messages are written in one column as a list with the
+	#			  row of each message, instead of being split over several lines
+	#
+	#	Input Variable:
+	#		msg		first message of the topic, used to walk through nested messages
+	================================================================================
+'''
+class messageExtractor:
+
+	def __init__(self, msg):
+		self.columns = []
+		self.slotTypes = []	# ROS type of each column, 'placeholder' for the empty columns
+		self.formatters = []
+		paths = []
+		self.addFields(msg, '', paths)
+		getter = attrgetter(*paths)
+		# attrgetter returns the value itself, not a tuple, when there is a single field
+		self.getter = getter if len(paths) > 1 else (lambda msg: (getter(msg),))
+
+	def addFields(self, msg, prefix, paths):
+		for slot, slotType in zip(msg.__slots__, msg._slot_types):
+			path = prefix + slot
+			column = len(paths)
+			self.columns.append(slot)
+			self.slotTypes.append(slotType)
+			paths.append(path)
+
+			if '[' in slotType:
+				baseType = slotType[:slotType.index('[')]
+				if baseType in primitiveTypes or baseType == 'string':
+					self.formatters.append((column, arrayString))
+				else:
+					self.formatters.append((column, messageArrayString))
+			elif slotType == 'string':
+				self.formatters.append((column, yamlString))
+			elif slotType in ('time', 'duration'):
+				self.formatters.append((column, emptyCell))
+				self.slotTypes[column] = 'placeholder'
+				for field in ('secs', 'nsecs'):
+					self.columns.append(field)
+					self.slotTypes.append('uint32' if slotType == 'time' else 'int32')
+					paths.append(path + '.' + field)
+			elif slotType not in primitiveTypes:
+				self.formatters.append((column, emptyCell))
+				self.slotTypes[column] = 'placeholder'
+				self.addFields(getattr(msg, slot), path + '.', paths)
+
+	def row(self, msg):
+		# Values of the columns, formatted like str(msg)
+		values = list(self.getter(msg))
+		for column, formatter in self.formatters:
+			values[column] = formatter(values[column])
+		return values
+
+
+'''
+	============================= Function getMessageExtractor() ====================================
+	#	Purpose:
+	#		get the messageExtractor of the type of msg, it is only built for the first
+	#		message of each type
+	================================================================================
+'''
+def getMessageExtractor(msg):
+	extractor = messageExtractors.get(msg._type)
+	if extractor is None:
+		extractor = messageExtractor(msg)
+		messageExtractors[msg._type] = extractor
+	return extractor
+
+
+def messageArrayString(value):
+	return str([getMessageExtractor(element).row(element) for element in value])
+
+
+class csvTopicWriter:
+
+	'''
+		============================= Class csvTopicWriter ====================================
+		#	Purpose:
+		#		write a generic topic into a csv file, one row per message. The first
+		#		column is the rosbag timestamp, the rest of the columns are the fields
+		#		of the message, taken out by the messageExtractor of its type.
+		#		If no extractor can be built for the message, the fields are parsed
+		#		from str(msg) instead
+		================================================================================
+	'''
+
+	def __init__(self, fileName):
+		self.fileName = fileName
+		self.rowCount = 0
+		self.csvfile = open(partName(fileName), 'w+')
+		self.filewriter = csv.writer(self.csvfile, delimiter = ',')
+		self.firstIteration = True	#allows header row
+		self.extractor = None
+
+	def write(self, msg, t):
+		self.rowCount += 1
+		if self.firstIteration:	# header
+			try:
+				self.extractor = getMessageExtractor(msg)
+			except Exception as e:
+				print ('Fields of ' + msg._type + ' will be parsed from the message string:', e)
+
+		if self.extractor is None:
+			self.writeFromString(msg, t)
+			return
+
+		if self.firstIteration:
+			self.filewriter.writerow(["rosbagTimestamp"] + self.extractor.columns)
+			self.firstIteration = False
+
+		self.filewriter.writerow([str(t)] + self.extractor.row(msg))	#first column will have rosbag timestamp
+
+	def writeFromString(self, msg, t):
+		#parse data from this instant, which is of the form of multiple lines of "Name: value\n"
+		msgString = str(msg)
+
+		msgList = msgString.split('\n')
+		instantaneousListOfData = []
+		for nameValuePair in msgList:
+			splitPair = nameValuePair.split(':')
+			for i in range(len(splitPair)):	#should be 0 to 1
+				splitPair[i] = splitPair[i].strip()
+			instantaneousListOfData.append(splitPair)
+
+		#write the first row from the first element of each pair
+		if self.firstIteration:	# header
+			headers = ["rosbagTimestamp"]	#first column header
+			for pair in instantaneousListOfData:
+				headers.append(pair[0])
+			self.filewriter.writerow(headers)
+			self.firstIteration = False
+
+		# write the value from each pair to the file
+		values = [str(t)]	#first column will have rosbag timestamp
+		for pair in instantaneousListOfData:
+			if len(pair) > 1:
+				values.append(pair[1])
+		self.filewriter.writerow(values)
+
+	def close(self):
+		self.csvfile.close()
+		commitFile(self.fileName)
+
+	def abort(self):
+		self.csvfile.close()
+		discardFile(self.fileName)
+
+
+class columnarTopicWriter:
+
+	'''
+		============================= Class columnarTopicWriter ====================================
+		#	Purpose:
+		#		write a generic topic into a Parquet (zstd) or Arrow IPC file with typed
+		#		columns. The columns are the same as in the csv file, without the empty
+		#		header/stamp columns, and each column keeps the type of its ROS field:
+		#			- numbers and bools		Int8 ... UInt64, Float32, Float64, Boolean
+		#			- strings				Utf8, without the quotes of the csv file
+		#			- uint8[] and char[]	Binary
+		#			- arrays of numbers		List
+		#			- arrays of messages	Utf8, as in the csv file
+		#		The rows are gathered in typed polars chunks, so a long topic is not kept
+		#		in memory as python objects
+		#
+		#	Input Variable:
+		#		fileName		path of the output file
+		#		outputFormat	'parquet' or 'ipc'
+		================================================================================
+	'''
+
+	chunkSize = 50000
+
+	def __init__(self, fileName, outputFormat):
+		if pl is None:
+			raise ImportError('polars is needed to write ' + fileName + ', install it with pip install polars')
+		self.fileName = fileName
+		self.rowCount = 0
+		self.outputFormat = outputFormat
+		self.extractor = None
+		self.chunks = []
+		self.rows = []
+
+	def write(self, msg, t):
+		if self.extractor is None:
+			self.extractor = getMessageExtractor(msg)
+			self.setSchema(self.extractor)
+
+		values = self.extractor.getter(msg)
+		row = [t.secs*10**(9) + t.nsecs]	#first column will have rosbag timestamp
+		for column, convert in self.conversions:
+			row.append(convert(values[column]))
+		self.rows.append(row)
+		self.rowCount += 1
+
+		if len(self.rows) >= self.chunkSize:
+			self.flush()
+
+	def setSchema(self, extractor):
+		# Polars type of each ROS field type
+		polarsTypes = {
+			'bool' : pl.Boolean, 'byte' : pl.Int8, 'char' : pl.UInt8,
+			'int8' : pl.Int8, 'uint8' : pl.UInt8, 'int16' : pl.Int16, 'uint16' : pl.UInt16,
+			'int32' : pl.Int32, 'uint32' : pl.UInt32, 'int64' : pl.Int64, 'uint64' : pl.UInt64,
+			'float32' : pl.Float32, 'float64' : pl.Float64, 'string' : pl.Utf8
+		}
+		schema = [('rosbagTimestamp', pl.Int64)]
+		self.conversions = []
+		usedNames = set(['rosbagTimestamp'])
+		for column, (name, slotType) in enumerate(zip(extractor.columns, extractor.slotTypes)):
+			if slotType == 'placeholder':
+				continue
+			# secs and nsecs appear once for each time field, number the repeated columns
+			uniqueName = name
+			count = 1
+			while uniqueName in usedNames:
+				count += 1
+				uniqueName = name + '_' + str(count)
+			usedNames.add(uniqueName)
+
+			if '[' in slotType:
+				baseType = slotType[:slotType.index('[')]
+				if baseType in ('uint8', 'char'):
+					schema.append((uniqueName, pl.Binary))
+					self.conversions.append((column, bytes))
+				elif baseType in polarsTypes:
+					schema.append((uniqueName, pl.List(polarsTypes[baseType])))
+					self.conversions.append((column, list))
+				else:
+					schema.append((uniqueName, pl.Utf8))
+					self.conversions.append((column, messageArrayString))
+			else:
+				schema.append((uniqueName, polarsTypes[slotType]))
+				self.conversions.append((column, noConversion))
+		self.schema = schema
+
+	def flush(self):
+		if self.rows:
+			self.chunks.append(pl.DataFrame(self.rows, schema = self.schema, orient = 'row'))
+			self.rows = []
+
+	def close(self):
+		self.flush()
+		if self.chunks:
+			df = pl.concat(self.chunks, rechunk = True)
+		else:
+			# A topic without messages still gets its file, as the csv writer does, so it is not parsed again on a resumed run.
+			# The types of the fields are only known from a message, so only the rosbag timestamp column is written then
+			df = pl.DataFrame(schema = self.schema if self.extractor is not None else [('rosbagTimestamp', pl.Int64)])
+		if self.outputFormat == 'parquet':
+			df.write_parquet(partName(self.fileName), compression = 'zstd')
+		else:
+			df.write_ipc(partName(self.fileName))
+		commitFile(self.fileName)
+
+	def abort(self):
+		# Nothing has been written to the disk yet
+		self.chunks = []
+		self.rows = []
+
+
+class sickTopicWriter:
+
+	'''
+		============================= Class sickTopicWriter ====================================
+		#	Purpose:
+		#		write the Sick LiDAR scans into a txt file, one scan per line
+		================================================================================
+	'''
+
+	def __init__(self, fileName):
+		self.fileName = fileName
+		self.rowCount = 0
+		self.File = open(partName(fileName), 'w')
+
+	def write(self, msg, t):
+		self.rowCount += 1
+		File = self.File
+		File.write(str(msg.header.seq))
+		File.write(',')
+		File.write(str(msg.header.stamp.secs))
+		File.write(',')
+		File.write(str(msg.header.stamp.nsecs))
+		File.write(',')
+		File.write(str(msg.angle_min))
+		File.write(',')
+		File.write(str(msg.angle_max))
+		File.write(',')
+		File.write(str(msg.angle_increment))
+		File.write(',')
+		File.write(str(msg.time_increment))
+		File.write(',')
+		File.write(str(msg.scan_time))
+		File.write(',')
+		File.write(str(msg.range_min))
+		File.write(',')
+		File.write(str(msg.range_max))
+		File.write(',')
+		File.write(', '.join(map(str,msg.ranges))) # This removes the leading and lagging parenthese from this message
+		File.write(',')
+		File.write(', '.join(map(str,msg.intensities))) # This removes the leading and lagging parenthese from this message
+		File.write('\n')
+
+	def close(self):
+		self.File.close()
+		commitFile(self.fileName)
+
+	def abort(self):
+		self.File.close()
+		discardFile(self.fileName)
+
+
+class velodynePointsTopicWriter:
+
+	'''
+		============================= Class velodynePointsTopicWriter ====================================
+		#	Purpose:
+		#		write the header information of the /velodyne_points topic into a txt file
+		#		and the point fields into velodyne_info.txt
+		================================================================================
+	'''
+
+	def __init__(self, fileName, infoFileName):
+		self.fileName = fileName
+		self.infoFileName = infoFileName
+		self.rowCount = 0
+		self.File = open(partName(fileName), 'w')
+		self.InfoFile = open(partName(infoFileName), 'w')
+
+	def write(self, msg, t):
+		self.rowCount += 1
+		File = self.File
+		self.InfoFile.write(', '.join(map(str,msg.fields))) # This removes the leading and lagging parenthese from this message
+		self.InfoFile.write('\n')
+		File.write(str(msg.header.seq))
+		File.write(',')
+		File.write(str(msg.header.stamp.secs))
+		File.write(',')
+		File.write(str(msg.header.stamp.nsecs))
+		File.write(',')
+		File.write(str(msg.height))
+		File.write(',')
+		File.write(str(msg.width))
+		File.write(',')
+		File.write(str(msg.is_bigendian))
+		File.write(',')
+		File.write(str(msg.point_step))
+		File.write(',')
+		File.write(str(msg.row_step))
+		File.write(',')
+		File.write(str(msg.is_dense))
+		File.write('\n')
+
+	def close(self):
+		self.File.close()
+		self.InfoFile.close()
+		commitFile(self.infoFileName)
+		commitFile(self.fileName)
+
+	def abort(self):
+		self.File.close()
+		self.InfoFile.close()
+		discardFile(self.infoFileName)
+		discardFile(self.fileName)
+
+
+class velodynePacketsTopicWriter:
+
+	'''
+		============================= Class velodynePacketsTopicWriter ====================================
+		#	Purpose:
+		#		decode the /velodyne_packets topic while the bag is being read. Each
+		#		VelodyneScan message is decoded into one LiDAR scan, which is saved into
+		#		the hash folder as a PLY file, and one line is written into the txt file
+		#		with the bag time, header time, host time, device time and hash of the scan
+		#
+		#	Input Variable:
+		#		fileName			txt file with one line per LiDAR scan
+		#		velodyneFolder		root of the Velodyne hash folder
+		#		plyBinary			True to write binary_little_endian PLY files, False for ascii
+		#		scanArchive			optional scanArchiveWriter, the scans are appended into its
+		#							pack file instead of one PLY file per scan
+		================================================================================
+	'''
+
+	def __init__(self, fileName, velodyneFolder, plyBinary, scanArchive = None):
+		self.fileName = fileName
+		self.rowCount = 0
+		self.File = open(partName(fileName), 'w')
+		# Header_Time is the time when the message is generated, ROS_Bag_Time is the timestamp when the message is recorded in the bags
+		LiDAR_info_header = "LiDAR Index, ROS_Bag_Time (nanoseconds), Header_Time (nanoseconds), Host Time (nanoseconds), Device Time (nanoseconds), LiDAR Hashtag"
+		self.File.write(LiDAR_info_header + "\n")
+		self.velodyneFolder = velodyneFolder
+		self.plyBinary = plyBinary
+		self.scanArchive = scanArchive
+		self.decoder = None	# created from the first message, once timestamp_first_packet is known
+		self.count_of_LiDARScan = 1
+		try:	#else already exists
+			os.makedirs(velodyneFolder)
+		except:
+			pass
+
+	def write(self, msg, bag_timestamp):
+		if len(msg.packets) == 0:
+			return
+
+		if self.decoder is None:
+			headerTimeSecs = msg.header.stamp.to_sec()
+			packetTimeSecs = msg.packets[0].stamp.to_sec()
+			config = vd.Config(model = vd.Model.PuckHiRes)
+			config.timestamp_first_packet = (abs(headerTimeSecs - packetTimeSecs) < 0.05)
+			self.decoder = vd.ScanDecoder(config)
+
+		stamp, points = self.decoder.decode_message(msg, as_pcl_structs = True)
+
+		points = np.ascontiguousarray(points)
+		md5_scan = hashlib.md5(points).hexdigest()
+		File = self.File
+		File.write(str(self.count_of_LiDARScan))
+		File.write(',')
+		File.write(str(bag_timestamp.secs*10**(9) + bag_timestamp.nsecs))
+		File.write(',')
+		File.write(str(msg.header.stamp.secs*10**(9) + msg.header.stamp.nsecs))
+		File.write(',')
+		File.write(str(int(stamp.host*10**(9))))
+		File.write(',')
+		File.write(str(int(stamp.device*10**(9))))
+		File.write(',')
+		File.write(str(md5_scan))
+		File.write('\n')
+		if self.scanArchive is not None:
+			self.scanArchive.add(md5_scan, points)
+		else:
+			hash_branch = self.velodyneFolder + '/' + md5_scan[0:2] + '/' + md5_scan[2:4] + '/'
+			ply_file =  hash_branch + str(md5_scan) + '.ply'
+			try:
+				os.makedirs(hash_branch)
+			except:
+				pass
+				# print ('this folder already exists:', hash_branch)
+			parseUtilities.writePLY(ply_file, points, "%.8f %.8f %.8f %.8f %.8f %d %d %d", binary = self.plyBinary)
+
+		self.count_of_LiDARScan += 1
+		self.rowCount += 1
+
+	def close(self):
+		# The scans are saved before the txt file gets its final name, so every hash in the txt file can be found
+		if self.scanArchive is not None:
+			self.scanArchive.close()
+		self.File.close()
+		commitFile(self.fileName)
+
+	def abort(self):
+		if self.scanArchive is not None:
+			self.scanArchive.abort()
+		self.File.close()
+		discardFile(self.fileName)
+
+
+'''
+	============================= Function demultiplexBag() ====================================
+	#	Purpose:
+	#		read the bag exactly once and send each message to the writer of its topic
+	#
+	#	Input Variable:
+	#		bag					bag = rosbag.Bag(bagFilePath)
+	#		writersByTopic		dictionary of {topicName : writer}
+	#		journal				optional parseJournal, the topics are marked as done in it
+	#		bagName				name of the bag in the journal
+	#
+	#	Output/Return:
+	#		None, all writers are closed when the function returns. If the bag could not
+	#		be read to the end, the unfinished outputs are removed and the error is raised
+	================================================================================
+'''
+def demultiplexBag(bag, writersByTopic, journal = None, bagName = None):
+	if len(writersByTopic) == 0:
+		return
+
+	if journal is not None:
+		for topic, writer in writersByTopic.items():
+			journal.markStarted(bagName, topic, writer.fileName)
+
+	try:
+		# Only chunks that contain at least one of the requested topics are read
+		for topic, msg, t in bag.read_messages(topics = list(writersByTopic.keys())):
+			writersByTopic[topic].write(msg, t)
+	except BaseException:
+		for writer in writersByTopic.values():
+			writer.abort()
+		raise
+
+	for topic, writer in writersByTopic.items():
+		writer.close()
+		if journal is not None:
+			journal.markDone(bagName, topic, writer.rowCount, writer.fileName)
@@ -0,0 +1,206 @@
+'''
+Backfill the database from folders of CSV files that were parsed from the bag files in the past (one folder per bag, with
+one _slash_<topic>.csv file per topic, e.g. Data/processOneMatFile/From), without reading the bags again.
+
+Each CSV file is scanned lazily with polars (see parse_csv.scan_csv_table), with the column types of its table in the
+registry (see get_table_info), and sent to the database in batches of batch_rows rows with df_to_db, so a file is never
+read into memory at once. Each folder is one bag: the name of the folder is the name of the bag, and a folder whose bag is
+already in the bag_files table is skipped. Several folders are backfilled at the same time with -j, each in its own
+process with its own database connection.
+
+Run: python3 backfill_csv.py -s sourcePath [-j jobs]
+'''
+
+from pathlib import Path
+import os
+import sys
+import argparse
+import multiprocessing.util
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import use_database
+import parse_csv
+import parse_utilities
+from update_df import update_df
+
+flags = {
+    "batch_rows"     : 500000,   # Number of rows of a CSV file sent to the database at a time
+    "binary_copy"    : 1,   # Send the data frames to the database with binary COPY (CSV COPY is used for tables it doesn't support)
+    "db_pool_size"   : 1,   # Number of database connections uploading the tables of a bag at the same time (1: one table after the other)
+    "idempotent_ingest" : 0   # Skip the rows that are already in the database, so backfilling a folder again adds no duplicates (needs the ingest keys, option 11 of use_database.py)
+}
+
+db_login_info = {
+    "db_username" : "postgres",
+    "db_password" : "pass",
+    "db_host"   : "127.0.0.1",
+    "db_port"     : "5432",
+    "db_name"     : ""
+}
+
+def parse_arguments():
+    # Describe the argument parser
+    arg_parser_description = "Upload folders of CSV files parsed from bag files to the database."
+    arg_parser = argparse.ArgumentParser(description = arg_parser_description)
+
+    arg_parser.add_argument("-s", "--sourcePath", required = True, help = "Path to the folders of CSV files (searched with its subfolders).", type = str)
+    arg_parser.add_argument("-j", "--jobs", required = False, default = 1, type = int, help = "Number of folders to backfill at the same time, each in its own process.")
+
+    input_args = arg_parser.parse_args()
+    path_to_source = input_args.sourcePath.replace("\\", "/")
+
+    if not os.path.exists(path_to_source):
+        print(f"Error - The given path does not exist.\n")
+        sys.exit(1)
+
+    return path_to_source, max(1, input_args.jobs)
+
+'''
+Find the folders with CSV files of topics (_slash_*.csv) in the source path and its subfolders.
+'''
+def get_csv_folders(path_to_source):
+    folders = sorted(set(str(p.parent) for p in Path(path_to_source).rglob("_slash_*.csv")))
+    return folders
+
+'''
+Backfill one folder: add its bag to the bag_files table, then scan each of its CSV files and upload it in batches. The
+folder is committed at the end as a whole, so a folder that fails is rolled back (with its bag_files row) and tried again
+next time. Returns the number of rows written (0 for a folder that is skipped or fails) and the runtime of the folder.
+'''
+def backfill_folder(folder, folder_count, folder_total, db, db_name):
+    folder_start_time = time.time()
+
+    bag_name = os.path.basename(folder)
+    print(f"Backfilling folder #{folder_count}/{folder_total}: '{bag_name}'")
+
+    if (db.get_bag_id_from_name(bag_name) != None):
+        print(f"\t - '{bag_name}' is already in the database, the folder is skipped.")
+        return 0, 0
+
+    rows = 0
+    try:
+        bag_file_db_id = db.insert_new_bag(bag_name)
+        if (bag_file_db_id is None):
+            raise Exception(f"the bag '{bag_name}' could not be added to bag_files")
+
+        for csv_file in sorted(Path(folder).glob("_slash_*.csv")):
+            lazy_df, table_name, mapping_dict, db_col_lst = parse_csv.scan_csv_table(str(csv_file))
+
+            if (lazy_df is None):
+                print(f"\t - '{csv_file.name}' is not a database table, it is skipped.")
+                continue
+
+            # Only one batch of the file is in memory at a time
+            table_rows = 0
+            for batch in lazy_df.collect_batches(chunk_size = flags["batch_rows"]):
+                df = update_df(batch, table_name, mapping_dict, db_col_lst, bag_file_db_id, 1, db)
+                if (df is None):
+                    raise Exception(f"'{csv_file.name}' could not be updated for '{table_name}'")
+
+                # A failed data frame rolls back the transaction, with the bag_files row, so stop the folder here
+                if (db.df_to_db(table_name, df, db_col_lst) == False):
+                    raise Exception(f"'{csv_file.name}' could not be written into '{table_name}'")
+                table_rows += df.height
+
+            print(f"\t + '{csv_file.name}': {table_rows} rows into '{table_name}'")
+            rows += table_rows
+
+        if (db.check_and_commit(db_name) == False):
+            raise Exception("the folder could not be committed")
+
+    except Exception as e:
+        # Roll back everything of the folder, so the connection starts the next folder with a clean transaction
+        print(f"\t - Error backfilling '{bag_name}', the folder is rolled back: {e}")
+        db.conn.rollback()
+        db.forget_transaction()
+        rows = 0
+
+    folder_runtime = round(time.time() - folder_start_time, 4)
+    return rows, folder_runtime
+
+# Database connection of a worker process, made once when the process starts
+worker_db = None
+
+def make_database(db_url):
+    return use_database.Database(1, db_url, binary_copy = (flags["binary_copy"] == 1), idempotent = (flags["idempotent_ingest"] == 1), pool_size = flags["db_pool_size"])
+
+'''
+Initialize a worker process of the process pool by connecting it to the database. The connection is closed when the
+process exits.
+'''
+def init_worker(db_url):
+    global worker_db
+    worker_db = make_database(db_url)
+    # Worker processes don't run atexit handlers, but they do run the multiprocessing finalizers
+    multiprocessing.util.Finalize(None, worker_db.disconnect, exitpriority = 10)
+
+def backfill_folder_in_worker(folder, folder_count, folder_total, db_name):
+    return backfill_folder(folder, folder_count, folder_total, worker_db, db_name)
+
+def main():
+    start_time = time.time()
+
+    path_to_source, jobs = parse_arguments()
+
+    try:
+        db_name = input("Please enter the name of the database you'd like to connect to: ")
+        db_login_info["db_name"] = db_name
+
+        # Design the Postgres URL: postgresql://<username>:<password>@<host>:<port>/<database name>
+        db_login_info_lst = list(db_login_info.values())
+        db_url = f"postgresql://{db_login_info_lst[0]}:{db_login_info_lst[1]}@{db_login_info_lst[2]}:{db_login_info_lst[3]}/{db_login_info_lst[4]}"
+
+        db = make_database(db_url)
+        print("─" * 125)
+
+    except:
+        print("Error connecting to the database. Please check database connection parameters.")
+        sys.exit()
+
+    # Skip the folders whose bag is already in the database, with one query for all of them
+    folders = get_csv_folders(path_to_source)
+    bag_names = db.get_bag_names()
+    skipped = [folder for folder in folders if os.path.basename(folder) in bag_names]
+    folders = [folder for folder in folders if os.path.basename(folder) not in bag_names]
+
+    print(f"Path to Source: {path_to_source}")
+    print(f"{len(skipped)} folder(s) are already in the database and will be skipped.")
+    parse_utilities.print_file_list(folders)
+
+    rows_total = 0
+    if (jobs == 1):
+        for folder_count, folder in enumerate(folders, start = 1):
+            rows, folder_runtime = backfill_folder(folder, folder_count, len(folders), db, db_name)
+            rows_total += rows
+
+    else:
+        # Each folder is backfilled in its own process, with its own database connection
+        print(f"Backfilling {len(folders)} folder(s) with {jobs} processes...\n")
+        with ProcessPoolExecutor(max_workers = jobs, initializer = init_worker, initargs = (db_url,)) as executor:
+            futures = {}
+            for folder_count, folder in enumerate(folders, start = 1):
+                future = executor.submit(backfill_folder_in_worker, folder, folder_count, len(folders), db_name)
+                futures[future] = folder
+
+            folders_done = 0
+            for future in as_completed(futures):
+                folders_done += 1
+                try:
+                    rows, folder_runtime = future.result()
+                    rows_total += rows
+                    print(f"Finished folder {folders_done}/{len(folders)}: '{futures[future]}' ({rows} rows) in {folder_runtime} seconds")
+
+                except Exception as e:
+                    print(f"Error backfilling '{futures[future]}': {e}")
+
+    print(f"Total rows backfilled: {rows_total}")
+
+    db_size_bytes, db_size_mb = db.get_db_size(db_name)
+    print(f"Final Database Size: {db_size_bytes} bytes ({db_size_mb} MB)")
+    db.disconnect()
+
+    total_runtime = parse_utilities.display_runtime(start_time, "Total", False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+'''
+Binary COPY of a polars data frame into a PostgreSQL table.
+
+The data frame is encoded straight from its column buffers (through numpy) into the
+PostgreSQL binary COPY format, used by: COPY table_name (cols) FROM STDIN WITH (FORMAT binary)
+
+    header : "PGCOPY\\n\\377\\r\\n\\0", int32 flags = 0, int32 header extension length = 0
+    row    : int16 number of fields, then for each field: int32 length (-1 for null) and the value bytes
+    trailer: int16 -1
+
+All the numbers are big-endian. The rows are encoded in chunks of chunk_rows rows while psycopg2
+reads the stream, so only one chunk is held in memory at a time.
+
+Binary COPY needs the exact type of each database column (an int8 sent into an int4 column is
+refused), so the types are read from information_schema.columns. Only the types in PG_BINARY_TYPES
+are supported; Database.df_to_db uses the CSV path for a table with any other column type.
+'''
+
+import numpy as np
+import polars as pl
+
+PG_COPY_HEADER = b"PGCOPY\n\xff\r\n\0" + np.array([0, 0], dtype = ">i4").tobytes()
+PG_COPY_TRAILER = np.array([-1], dtype = ">i2").tobytes()
+
+# Postgres type (udt_name) : [polars type to cast to, big-endian numpy type of the value, or None for text]
+PG_BINARY_TYPES = {
+    "int2"    : [pl.Int16, ">i2"],
+    "int4"    : [pl.Int32, ">i4"],
+    "int8"    : [pl.Int64, ">i8"],
+    "float4"  : [pl.Float32, ">f4"],
+    "float8"  : [pl.Float64, ">f8"],
+    "bool"    : [pl.Boolean, "u1"],
+    "text"    : [pl.Utf8, None],
+    "varchar" : [pl.Utf8, None],
+    "bpchar"  : [pl.Utf8, None]
+}
+
+''' Check whether every column type of a table can be sent with binary COPY '''
+def binary_copy_supported(pg_types):
+    return len(pg_types) > 0 and all(pg_type in PG_BINARY_TYPES for pg_type in pg_types)
+
+''' Get the values of one column as big-endian numpy values (or utf-8 bytes for text), its null mask and the byte size of each value '''
+def encode_column(series, pg_type):
+    pl_type, np_type = PG_BINARY_TYPES[pg_type]
+    series = series.cast(pl_type)
+    nulls = series.is_null().to_numpy()
+
+    if np_type is None:
+        values = series.fill_null("")
+        data = np.frombuffer("".join(values.to_list()).encode("utf-8"), dtype = np.uint8)
+        sizes = values.str.len_bytes().to_numpy().astype(np.int64)
+    else:
+        if pl_type == pl.Boolean:
+            values = series.fill_null(False).cast(pl.UInt8).to_numpy()
+        else:
+            values = series.fill_null(0).to_numpy()
+        data = np.ascontiguousarray(values, dtype = np_type)
+        sizes = np.full(len(series), data.dtype.itemsize, dtype = np.int64)
+
+    sizes[nulls] = 0
+    return data, nulls, sizes
+
+''' Encode the rows of a data frame (one chunk) into the binary COPY format '''
+def encode_rows(df, pg_types):
+    num_rows = df.height
+    num_fields = len(pg_types)
+    columns = [encode_column(series, pg_type) for series, pg_type in zip(df.get_columns(), pg_types)]
+
+    # Every value has a fixed size and none is null: the rows are records of one packed numpy type
+    if all(PG_BINARY_TYPES[pg_type][1] is not None for pg_type in pg_types) and not any(nulls.any() for data, nulls, sizes in columns):
+        fields = [("num_fields", ">i2")]
+        for i, (data, nulls, sizes) in enumerate(columns):
+            fields += [(f"length_{i}", ">i4"), (f"value_{i}", data.dtype)]
+        rows = np.empty(num_rows, dtype = np.dtype(fields))
+        rows["num_fields"] = num_fields
+        for i, (data, nulls, sizes) in enumerate(columns):
+            rows[f"length_{i}"] = data.dtype.itemsize
+            rows[f"value_{i}"] = data
+        return rows.tobytes()
+
+    # Otherwise, compute where each field of each row starts and copy the bytes of each column there
+    row_sizes = 2 + sum(4 + sizes for data, nulls, sizes in columns)
+    row_starts = np.zeros(num_rows, dtype = np.int64)
+    np.cumsum(row_sizes[:-1], out = row_starts[1:])
+    out = np.empty(int(row_sizes.sum()), dtype = np.uint8)
+
+    out[row_starts[:, None] + np.arange(2)] = np.frombuffer(np.array([num_fields], dtype = ">i2").tobytes(), dtype = np.uint8)
+    position = row_starts + 2
+
+    for (data, nulls, sizes), pg_type in zip(columns, pg_types):
+        lengths = np.where(nulls, -1, sizes).astype(">i4")
+        out[position[:, None] + np.arange(4)] = lengths.view(np.uint8).reshape(num_rows, 4)
+        position += 4
+
+        if PG_BINARY_TYPES[pg_type][1] is None:
+            # Text: the utf-8 bytes of every value follow each other in data
+            value_starts = np.zeros(num_rows, dtype = np.int64)
+            np.cumsum(sizes[:-1], out = value_starts[1:])
+            out[np.repeat(position - value_starts, sizes) + np.arange(len(data))] = data
+        else:
+            valid = ~nulls
+            width = data.dtype.itemsize
+            out[position[valid][:, None] + np.arange(width)] = data[valid].view(np.uint8).reshape(-1, width)
+        position += sizes
+
+    return out.tobytes()
+
+
+class BinaryCopyStream:
+
+    ''' File-like object read by cursor.copy_expert, which encodes the data frame into the binary COPY format chunk by chunk '''
+    def __init__(self, df, pg_types, chunk_rows = 100000):
+        self.chunks = self.generate_chunks(df, pg_types, chunk_rows)
+        self.buffer = memoryview(b"")
+
+    def generate_chunks(self, df, pg_types, chunk_rows):
+        yield PG_COPY_HEADER
+        for offset in range(0, df.height, chunk_rows):
+            yield encode_rows(df.slice(offset, chunk_rows), pg_types)
+        yield PG_COPY_TRAILER
+
+    def read(self, size = -1):
+        # Refill the buffer with the next chunk once it has been read
+        while len(self.buffer) == 0:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return b""
+            self.buffer = memoryview(chunk)
+
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = self.buffer[:size].tobytes()
+        self.buffer = self.buffer[size:]
+        return data
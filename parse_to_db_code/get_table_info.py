@@ -12,17 +12,26 @@ Usage:
     Use with the parse_and_insert.py script.
 
 Method(s):
-    - get_topics(topic)
+    - get_table_info(table_name)
         Takes in a table name and will return the proper table_name, a mapping dictionary of the ROS bag topics and
         corresponding database column names and data types, and a list of the columns for the database table.
+    - get_table_schema(table_name)
+        Returns the TableSchema of a table (or None), with everything the bag and CSV parsers need to know about it.
+    - get_topic_table(topic) / get_csv_table(csv_file)
+        Return the table name of a ROS bag topic or of a CSV file written by the bag to CSV code.
+    - get_table_ddl(table_name)
+        Returns the CREATE TABLE statement of a table, built from its columns and data types.
     - debug()
         Helps test whether the remapping of the keys and values in the dictionaries are properly updated.
 
+The tables are declared once in TABLE_DEFINITIONS, and TABLE_REGISTRY (table name -> TableSchema) and TOPIC_TABLES
+(topic -> table name) are built from it when the module is imported, so looking a table up is a single dictionary access.
+
 For adding in a future table:
-    1. Update the SQL script
+    1. Update the SQL script (get_table_ddl gives the CREATE TABLE statement of the columns)
         a. New CREATE TABLE
         b. New ADD FOREIGN KEY
-    2. Create a new "if" statement to check whether the table_name matches that of the newly added table
+    2. Add an entry to TABLE_DEFINITIONS with the table names and the ROS bag topic of each table
     3. Create a dictionary (mapping_dict)
         a. Keys are the topics you want from the ROS bag / the older CSV files
         b. Values are a list of the corresponding name in the database table and proper datatype. To ensure data can be written to
@@ -34,375 +43,448 @@ For adding in a future table:
                 real = pl.Float32
                 float = pl.Float64
     4. Create a list (db_col_lst) that includes the columns in the new database table 
+    5. If a column is not a plain field of the ROS message, add its attribute path to field_paths (e.g. "orientation.x")
 '''
 import polars as pl
 
-def get_table_info(table_name):
-    # Declare and initialize the dictionary and list to be empty
-    mapping_dict = {}
-    db_col_lst = []
 
+# Columns that hold the time of a message in nanoseconds (or its seconds and nanoseconds parts). They are read as text
+# from the ROS bag / CSV files and are stored as bigint in the database (see update_df).
+TIME_COLUMNS = ['ros_header_time', 'ros_header_seconds', 'ros_header_nanoseconds', 'written_to_bag_time', 'gps_time']
+
+# Attribute path in the ROS message of the header columns; None for the columns that are computed when parsing the bag
+HEADER_FIELD_PATHS = {'ros_header_time' : None,
+                      'written_to_bag_time' : None,
+                      'ros_header_seconds' : 'header.stamp.secs',
+                      'ros_header_nanoseconds' : 'header.stamp.nsecs'
+}
+
+# Polars type -> Postgres type of a column, for get_table_ddl
+POSTGRES_TYPES = {pl.Utf8 : 'TEXT',
+                  pl.Int32 : 'INTEGER',
+                  pl.Int64 : 'BIGINT',
+                  pl.Float32 : 'REAL',
+                  pl.Float64 : 'DOUBLE PRECISION'
+}
+
+# Columns that refer to another table of the database
+REFERENCE_COLUMNS = {'bag_file_db_id' : 'INTEGER NOT NULL REFERENCES bag_files (id)',
+                     'base_station_messages_id' : 'INTEGER REFERENCES base_station_messages (id)'
+}
+
+'''
+Declaration of every table of the database: each entry is used for one or more tables with the same columns.
+    - tables: {table_name : ROS bag topic of the table (None if it isn't parsed from a pose topic)}
+    - mapping_dict: {ROS bag / CSV name : [database column name, data type]}
+    - db_col_lst: the columns of the database table, in order
+    - field_paths: attribute path in the ROS message of the columns that aren't a plain field (optional)
+'''
+TABLE_DEFINITIONS = [
     # Table: encoder
-    if (table_name == 'encoder'):
-        mapping_dict = {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
-                        'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
-                        'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
-                        'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
-                        'mode': ['encoder_mode', pl.Utf8],
-                        'C1': ['c1', pl.Int64],
-                        'C2': ['c2', pl.Int64],
-                        'C3': ['c3', pl.Int64],
-                        'C4': ['c4', pl.Int64],
-                        'P1': ['p1', pl.Int64],
-                        'E1': ['e1', pl.Int64],
-                        'err_wrong_element_length': ['err_wrong_element_length', pl.Int32],
-                        'err_bad_element_structure': ['err_bad_element_structure', pl.Int32],
-                        'err_failed_time': ['err_failed_time', pl.Int32],
-                        'err_bad_uppercase_character': ['err_bad_uppercase_character', pl.Int32],
-                        'err_bad_lowercase_character': ['err_bad_lowercase_character', pl.Int32],
-                        'err_bad_character': ['err_bad_character', pl.Int32]
-        }
-        
-        db_col_lst = ['bag_file_db_id', 'encoder_mode',
-                      'c1', 'c2', 'c3', 'c4', 'p1', 'e1',
-                      'err_wrong_element_length', 'err_bad_element_structure',
-                      'err_failed_time', 'err_bad_uppercase_character',
-                      'err_bad_lowercase_character', 'err_bad_character',
-                      'written_to_bag_time', 'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
-        ]
-        
+    {'tables' : {'encoder' : '/parseEncoder'},
+
+     'mapping_dict' : {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
+                       'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
+                       'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
+                       'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
+                       'mode': ['encoder_mode', pl.Utf8],
+                       'C1': ['c1', pl.Int64],
+                       'C2': ['c2', pl.Int64],
+                       'C3': ['c3', pl.Int64],
+                       'C4': ['c4', pl.Int64],
+                       'P1': ['p1', pl.Int64],
+                       'E1': ['e1', pl.Int64],
+                       'err_wrong_element_length': ['err_wrong_element_length', pl.Int32],
+                       'err_bad_element_structure': ['err_bad_element_structure', pl.Int32],
+                       'err_failed_time': ['err_failed_time', pl.Int32],
+                       'err_bad_uppercase_character': ['err_bad_uppercase_character', pl.Int32],
+                       'err_bad_lowercase_character': ['err_bad_lowercase_character', pl.Int32],
+                       'err_bad_character': ['err_bad_character', pl.Int32]
+     },
+
+     'db_col_lst' : ['bag_file_db_id', 'encoder_mode',
+                     'c1', 'c2', 'c3', 'c4', 'p1', 'e1',
+                     'err_wrong_element_length', 'err_bad_element_structure',
+                     'err_failed_time', 'err_bad_uppercase_character',
+                     'err_bad_lowercase_character', 'err_bad_character',
+                     'written_to_bag_time', 'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
+     ]
+    },
+
     # Table: gps_sparkfun_gga (left, right, or front)
-    elif (table_name == 'gps_sparkfun_rearleft_gga' or table_name == 'gps_sparkfun_rearright_gga' or table_name == 'gps_sparkfun_front_gga'):
-        mapping_dict = {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
-                        'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
-                        'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
-                        'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
-                        'GPSSecs': ['gps_secs', pl.Int64],
-                        'GPSMicroSecs': ['gps_microsecs', pl.Int64],
-                        'Latitude': ['latitude', pl.Float32],
-                        'Longitude': ['longitude', pl.Float32],
-                        'Altitude': ['altitude', pl.Float32],
-                        'GeoSep': ['geosep', pl.Float32],
-                        'NavMode': ['nav_mode', pl.Int32],
-                        'NumOfSats': ['num_of_sats', pl.Int32],
-                        'HDOP': ['hdop', pl.Float64],
-                        'AgeOfDiff': ['age_of_diff', pl.Float64],
-                        'LockStatus': ['lock_status', pl.Int32],
-                        'BaseStationID': ['base_station_messages_id', pl.Utf8]
-        }
-        
-        db_col_lst = ['bag_file_db_id', 'base_station_messages_id',
-                      'gps_secs', 'gps_microsecs', 'gps_time',
-                      'latitude', 'longitude', 'altitude',
-                      'geosep', 'nav_mode', 'num_of_sats',
-                      'hdop', 'age_of_diff', 'lock_status',
-                      'written_to_bag_time', 'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'              
-        ]
+    {'tables' : {'gps_sparkfun_rearleft_gga' : '/GPS_SparkFun_RearLeft_GGA',
+                 'gps_sparkfun_rearright_gga' : '/GPS_SparkFun_RearRight_GGA',
+                 'gps_sparkfun_front_gga' : '/GPS_SparkFun_Front_GGA'},
+
+     'mapping_dict' : {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
+                       'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
+                       'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
+                       'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
+                       'GPSSecs': ['gps_secs', pl.Int64],
+                       'GPSMicroSecs': ['gps_microsecs', pl.Int64],
+                       'Latitude': ['latitude', pl.Float32],
+                       'Longitude': ['longitude', pl.Float32],
+                       'Altitude': ['altitude', pl.Float32],
+                       'GeoSep': ['geosep', pl.Float32],
+                       'NavMode': ['nav_mode', pl.Int32],
+                       'NumOfSats': ['num_of_sats', pl.Int32],
+                       'HDOP': ['hdop', pl.Float64],
+                       'AgeOfDiff': ['age_of_diff', pl.Float64],
+                       'LockStatus': ['lock_status', pl.Int32],
+                       'BaseStationID': ['base_station_messages_id', pl.Utf8]
+     },
+
+     'db_col_lst' : ['bag_file_db_id', 'base_station_messages_id',
+                     'gps_secs', 'gps_microsecs', 'gps_time',
+                     'latitude', 'longitude', 'altitude',
+                     'geosep', 'nav_mode', 'num_of_sats',
+                     'hdop', 'age_of_diff', 'lock_status',
+                     'written_to_bag_time', 'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
+     ]
+    },
 
     # Table: gps_sparkfun_pvt (left, right, or front)
-    elif (table_name == 'gps_sparkfun_rearleft_pvt' or table_name == 'gps_sparkfun_rearright_pvt' or table_name == 'gps_sparkfun_front_pvt'):
-        '''
-        rosbagTimestamp
-        iTOW
-        year
-        month
-        day
-        hour
-        min
-        sec
-        valid
-        tAcc
-        nano
-        fixType
-        flags
-        flags2
-        numSV	
-        longitude
-        latitude
-        height
-        hMSL
-        hAcc
-        vAcc
-        velN
-        velE
-        velD
-        gSpeed
-        heading
-        sAcc
-        headAcc
-        pDOP
-        reserved1
-        headVeh
-        magDec
-        magAcc
-        '''    
-        '''    
-        mapping_dict = {'rosbagTimestamp' : ['ros_header_time', pl.Int64],
-                        'iTOW' : ['itow', pl.Int64],
-                        'year' : ['gps_year', pl.Int64],
-                        'month' : ['gps_month', pl.Int64],
-                        'day' : ['gps_day', pl.Int64],
-                        'hour' : ['gps_hour', pl.Int64],
-                        'min' : ['gps_min', pl.Int64],
-                        'sec' : ['gps_sec', pl.Int64],
-                        'valid' : ['valid', pl.Int32],
-                        'tAcc' : ['t_acc', pl.Float32],
-                        'nano' : ['nano', pl.Int64],
-                        'fixType' : ['fix_type', pl.Int32],
-                        'flags' : ['flags', pl.Int64],
-                        'flags2' : ['flags2', pl.Int64],
-                        'numSV' : ['num_sv', pl.Int32],	
-                        'longitude' : ['longitude', pl.Float32],
-                        'latitude' : ['latitude', pl.Float32],
-                        'height' : ['altitude', pl.Float32],
-                        'hMSL' : ['h_msl', pl.Int64],
-                        'hAcc' : ['h_acc', pl.Float32],
-                        'vAcc' : ['v_acc', pl.Float32],
-                        'velN' : ['vel_n', pl.Float32],
-                        'velE' : ['vel_e', pl.Float32],
-                        'velD' : ['vel_d', pl.Float32],
-                        'gSpeed' : ['g_speed', pl.Float32],
-                        'heading' : ['heading', pl.Float32],
-                        'sAcc' : ['s_acc', pl.Float32],
-                        'headAcc' : ['head_acc', pl.Float32],
-                        'pDOP' : ['p_dop', pl.Int32],
-                        'headVeh' : ['head_veh', pl.Int32],
-                        'magDec' : ['mag_dec', pl.Int32],
-                        'magAcc' : ['mag_acc', pl.Int32],
-        }
-        
-        db_col_lst = ['bag_file_db_id', 'itow',
-                      'gps_time', 'gps_year', 'gps_month', 'gps_day', 'gps_hour', 'gps_min', 'gps_secs',
-                      'valid', 't_acc', 'nano', 'fix_type', 'flags', 'flags2', 'num_sv',
-                      'longitude', 'latitude', 'altitude',
-                      'h_msl', 'h_acc', 'v_acc', 'vel_n', 'vel_e', 'vel_d',
-                      'g_speed', 'heading', 's_acc', 'head_acc', 'p_dop',
-                      'head_veh', 'mag_dec', 'mag_acc', 
-                      'written_to_bag_time', 'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
-        ]
-        '''
-
-        mapping_dict = {'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
-                        'iTOW' : ['itow', pl.Int64],
-                        'year' : ['gps_year', pl.Int64],
-                        'month' : ['gps_month', pl.Int64],
-                        'day' : ['gps_day', pl.Int64],
-                        'hour' : ['gps_hour', pl.Int64],
-                        'min' : ['gps_min', pl.Int64],
-                        'sec' : ['gps_secs', pl.Int64],
-                        'valid' : ['valid', pl.Int32],
-                        'tAcc' : ['t_acc', pl.Float32],
-                        'nano' : ['nano', pl.Int64],
-                        'fixType' : ['fix_type', pl.Int32],
-                        'flags' : ['flags', pl.Int64],
-                        'flags2' : ['flags2', pl.Int64],
-                        'numSV' : ['num_sv', pl.Int32],	
-                        'longitude' : ['longitude', pl.Utf8],
-                        'latitude' : ['latitude', pl.Utf8],
-                        'height' : ['altitude', pl.Float32],
-                        'hMSL' : ['h_msl', pl.Int64],
-                        'hAcc' : ['h_acc', pl.Float32],
-                        'vAcc' : ['v_acc', pl.Float32],
-                        'velN' : ['vel_n', pl.Float32],
-                        'velE' : ['vel_e', pl.Float32],
-                        'velD' : ['vel_d', pl.Float32],
-                        'gSpeed' : ['g_speed', pl.Float32],
-                        'heading' : ['heading', pl.Float32],
-                        'sAcc' : ['s_acc', pl.Float32],
-                        'headAcc' : ['head_acc', pl.Float32],
-                        'pDOP' : ['p_dop', pl.Int32],
-                        'headVeh' : ['head_veh', pl.Int32],
-                        'magDec' : ['mag_dec', pl.Int32],
-                        'magAcc' : ['mag_acc', pl.Int32],
-        }
-        
-        db_col_lst = ['bag_file_db_id', 'itow',
-                      'gps_year', 'gps_month', 'gps_day', 'gps_hour', 'gps_min', 'gps_secs',
-                      'valid', 't_acc', 'nano', 'fix_type', 'flags', 'flags2', 'num_sv',
-                      'longitude', 'latitude', 'altitude',
-                      'h_msl', 'h_acc', 'v_acc', 'vel_n', 'vel_e', 'vel_d',
-                      'g_speed', 'heading', 's_acc', 'head_acc', 'p_dop',
-                      'head_veh', 'mag_dec', 'mag_acc', 
-                      'written_to_bag_time'
-        ]
+    # Fields of the PVT message: rosbagTimestamp, iTOW, year, month, day, hour, min, sec, valid, tAcc, nano, fixType, flags,
+    # flags2, numSV, longitude, latitude, height, hMSL, hAcc, vAcc, velN, velE, velD, gSpeed, heading, sAcc, headAcc, pDOP,
+    # reserved1, headVeh, magDec, magAcc
+    {'tables' : {'gps_sparkfun_rearleft_pvt' : '/GPS_SparkFun_RearLeft_PVT',
+                 'gps_sparkfun_rearright_pvt' : '/GPS_SparkFun_RearRight_PVT',
+                 'gps_sparkfun_front_pvt' : '/GPS_SparkFun_Front_PVT'},
+
+     'mapping_dict' : {'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
+                       'iTOW' : ['itow', pl.Int64],
+                       'year' : ['gps_year', pl.Int64],
+                       'month' : ['gps_month', pl.Int64],
+                       'day' : ['gps_day', pl.Int64],
+                       'hour' : ['gps_hour', pl.Int64],
+                       'min' : ['gps_min', pl.Int64],
+                       'sec' : ['gps_secs', pl.Int64],
+                       'valid' : ['valid', pl.Int32],
+                       'tAcc' : ['t_acc', pl.Float32],
+                       'nano' : ['nano', pl.Int64],
+                       'fixType' : ['fix_type', pl.Int32],
+                       'flags' : ['flags', pl.Int64],
+                       'flags2' : ['flags2', pl.Int64],
+                       'numSV' : ['num_sv', pl.Int32],
+                       'longitude' : ['longitude', pl.Utf8],
+                       'latitude' : ['latitude', pl.Utf8],
+                       'height' : ['altitude', pl.Float32],
+                       'hMSL' : ['h_msl', pl.Int64],
+                       'hAcc' : ['h_acc', pl.Float32],
+                       'vAcc' : ['v_acc', pl.Float32],
+                       'velN' : ['vel_n', pl.Float32],
+                       'velE' : ['vel_e', pl.Float32],
+                       'velD' : ['vel_d', pl.Float32],
+                       'gSpeed' : ['g_speed', pl.Float32],
+                       'heading' : ['heading', pl.Float32],
+                       'sAcc' : ['s_acc', pl.Float32],
+                       'headAcc' : ['head_acc', pl.Float32],
+                       'pDOP' : ['p_dop', pl.Int32],
+                       'headVeh' : ['head_veh', pl.Int32],
+                       'magDec' : ['mag_dec', pl.Int32],
+                       'magAcc' : ['mag_acc', pl.Int32],
+     },
+
+     'db_col_lst' : ['bag_file_db_id', 'itow',
+                     'gps_year', 'gps_month', 'gps_day', 'gps_hour', 'gps_min', 'gps_secs',
+                     'valid', 't_acc', 'nano', 'fix_type', 'flags', 'flags2', 'num_sv',
+                     'longitude', 'latitude', 'altitude',
+                     'h_msl', 'h_acc', 'v_acc', 'vel_n', 'vel_e', 'vel_d',
+                     'g_speed', 'heading', 's_acc', 'head_acc', 'p_dop',
+                     'head_veh', 'mag_dec', 'mag_acc',
+                     'written_to_bag_time'
+     ]
+    },
 
     # Table: gps_sparkfun_gst (left, right, or front)
-    elif (table_name == 'gps_sparkfun_rearleft_gst' or table_name == 'gps_sparkfun_rearright_gst' or table_name == 'gps_sparkfun_front_gst'):
-        mapping_dict = {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
-                        'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
-                        'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
-                        'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
-                        'StdMajor': ['stdmajor', pl.Float64],
-                        'StdMinor': ['stdminor', pl.Float64],
-                        'StdOri': ['stdori', pl.Float64],
-                        'StdLat': ['stdlat', pl.Float64],
-                        'StdLon': ['stdlon', pl.Float64],
-                        'StdAlt': ['stdalt', pl.Float64]
-        }
-
-        db_col_lst = ['bag_file_db_id',
-                      'stdmajor', 'stdminor', 'stdori',
-                      'stdlat', 'stdlon', 'stdalt',
-                      'written_to_bag_time', 'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
-        ]
+    {'tables' : {'gps_sparkfun_rearleft_gst' : '/GPS_SparkFun_RearLeft_GST',
+                 'gps_sparkfun_rearright_gst' : '/GPS_SparkFun_RearRight_GST',
+                 'gps_sparkfun_front_gst' : '/GPS_SparkFun_Front_GST'},
+
+     'mapping_dict' : {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
+                       'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
+                       'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
+                       'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
+                       'StdMajor': ['stdmajor', pl.Float64],
+                       'StdMinor': ['stdminor', pl.Float64],
+                       'StdOri': ['stdori', pl.Float64],
+                       'StdLat': ['stdlat', pl.Float64],
+                       'StdLon': ['stdlon', pl.Float64],
+                       'StdAlt': ['stdalt', pl.Float64]
+     },
+
+     'db_col_lst' : ['bag_file_db_id',
+                     'stdmajor', 'stdminor', 'stdori',
+                     'stdlat', 'stdlon', 'stdalt',
+                     'written_to_bag_time', 'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
+     ]
+    },
 
     # Table: gps_sparkfun_vtg (left, right, or front)
-    elif (table_name == 'gps_sparkfun_rearleft_vtg' or table_name == 'gps_sparkfun_rearright_vtg' or table_name == 'gps_sparkfun_front_vtg'):
-        mapping_dict = {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
-                        'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
-                        'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
-                        'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
-                        'TrueTrack': ['true_track', pl.Float32],
-                        'MagTrack': ['mag_track', pl.Float32],
-                        'SpdOverGrndKnots': ['spdovergrndknots', pl.Float32],
-                        'SpdOverGrndKmph': ['spdovergrndkmph', pl.Float32]
-        }
-
-        db_col_lst = ['bag_file_db_id', 'true_track', 'mag_track',
-                      'spdovergrndknots', 'spdovergrndkmph',
-                      'written_to_bag_time', 'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
-        ]
+    {'tables' : {'gps_sparkfun_rearleft_vtg' : '/GPS_SparkFun_RearLeft_VTG',
+                 'gps_sparkfun_rearright_vtg' : '/GPS_SparkFun_RearRight_VTG',
+                 'gps_sparkfun_front_vtg' : '/GPS_SparkFun_Front_VTG'},
+
+     'mapping_dict' : {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
+                       'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
+                       'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
+                       'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
+                       'TrueTrack': ['true_track', pl.Float32],
+                       'MagTrack': ['mag_track', pl.Float32],
+                       'SpdOverGrndKnots': ['spdovergrndknots', pl.Float32],
+                       'SpdOverGrndKmph': ['spdovergrndkmph', pl.Float32]
+     },
+
+     'db_col_lst' : ['bag_file_db_id', 'true_track', 'mag_track',
+                     'spdovergrndknots', 'spdovergrndkmph',
+                     'written_to_bag_time', 'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
+     ]
+    },
 
     # Table: sick_lms_5xx
-    elif (table_name == 'sick_lms_5xx'):
-        mapping_dict = {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
-                        'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
-                        'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
-                        'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
-                        'angle_min' : ['angle_min', pl.Float32],
-                        'angle_max' : ['angle_max', pl.Float32],
-                        'angle_increment' : ['angle_increment', pl.Float32],
-                        'time_increment' : ['time_increment', pl.Float32],
-                        'scan_time' : ['scan_time', pl.Float32],
-                        'range_min' : ['range_min', pl.Float32],
-                        'range_max' : ['range_max', pl.Float32],
-                        'ranges' : ['ranges', pl.Utf8],
-                        'intensities' : ['intensities', pl.Utf8]
-        }
-
-        db_col_lst = ['bag_file_db_id', 'scan_time', 'time_increment',
-                      'angle_min', 'angle_max', 'angle_increment',
-                      'range_min', 'range_max', 'ranges', 'intensities', 
-                      'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
-        ]
+    {'tables' : {'sick_lms_5xx' : '/sick_lms_5xx/scan'},
+
+     'mapping_dict' : {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
+                       'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
+                       'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
+                       'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
+                       'angle_min' : ['angle_min', pl.Float32],
+                       'angle_max' : ['angle_max', pl.Float32],
+                       'angle_increment' : ['angle_increment', pl.Float32],
+                       'time_increment' : ['time_increment', pl.Float32],
+                       'scan_time' : ['scan_time', pl.Float32],
+                       'range_min' : ['range_min', pl.Float32],
+                       'range_max' : ['range_max', pl.Float32],
+                       'ranges' : ['ranges', pl.Utf8],
+                       'intensities' : ['intensities', pl.Utf8]
+     },
+
+     'db_col_lst' : ['bag_file_db_id', 'scan_time', 'time_increment',
+                     'angle_min', 'angle_max', 'angle_increment',
+                     'range_min', 'range_max', 'ranges', 'intensities',
+                     'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
+     ]
+    },
 
     # Table: oustero1_imu
-    elif (table_name == 'oustero1_imu'):
-        mapping_dict = {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
-                        'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
-                        'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
-                        'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
-                        'orientation_x' : ['orientation_x', pl.Float64],
-                        'orientation_y' : ['orientation_y', pl.Float64],
-                        # 'orientation_covariance' : ['orientation_covariance', pl.List(pl.Float64)],
-                        'angular_velocity_x' : ['angular_velocity_x', pl.Float64],
-                        'angular_velocity_y' : ['angular_velocity_y', pl.Float64],
-                        # 'angular_velocity_covariance' : ['angular_velocity_covariance', pl.List(pl.Float64)],
-                        'linear_acceleration_x' : ['linear_acceleration_x', pl.Float64],
-                        'linear_acceleration_y' : ['linear_acceleration_y', pl.Float64]
-                        # 'linear_acceleration_covariance' : ['linear_acceleration_covariance', pl.List(pl.Float64)]
-        }
-
-        '''
-        db_col_lst = ['bag_file_db_id', 'orientation_x', 'orientation_y', 'orientation_covariance',
-                      'angular_velocity_x', 'angular_velocity_y', 'angular_velocity_covariance',
-                      'linear_acceleration_x', 'linear_acceleration_y', 'linear_acceleration_covariance',
-                      'written_to_bag_time', 'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
-        ]
-        '''
-
-        db_col_lst = ['bag_file_db_id',
-                      'orientation_x', 'orientation_y',
-                      'angular_velocity_x', 'angular_velocity_y',
-                      'linear_acceleration_x', 'linear_acceleration_y',
-                      'written_to_bag_time', 'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
-        ]
-        
+    {'tables' : {'oustero1_imu' : '/ousterO1/imu'},
+
+     'mapping_dict' : {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
+                       'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
+                       'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
+                       'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
+                       'orientation_x' : ['orientation_x', pl.Float64],
+                       'orientation_y' : ['orientation_y', pl.Float64],
+                       # 'orientation_covariance' : ['orientation_covariance', pl.List(pl.Float64)],
+                       'angular_velocity_x' : ['angular_velocity_x', pl.Float64],
+                       'angular_velocity_y' : ['angular_velocity_y', pl.Float64],
+                       # 'angular_velocity_covariance' : ['angular_velocity_covariance', pl.List(pl.Float64)],
+                       'linear_acceleration_x' : ['linear_acceleration_x', pl.Float64],
+                       'linear_acceleration_y' : ['linear_acceleration_y', pl.Float64]
+                       # 'linear_acceleration_covariance' : ['linear_acceleration_covariance', pl.List(pl.Float64)]
+     },
+
+     # db_col_lst with the covariances: 'orientation_covariance' after 'orientation_y', 'angular_velocity_covariance'
+     # after 'angular_velocity_y' and 'linear_acceleration_covariance' after 'linear_acceleration_y'
+     'db_col_lst' : ['bag_file_db_id',
+                     'orientation_x', 'orientation_y',
+                     'angular_velocity_x', 'angular_velocity_y',
+                     'linear_acceleration_x', 'linear_acceleration_y',
+                     'written_to_bag_time', 'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
+     ],
+
+     # The vectors of the message are split into separate x and y columns
+     'field_paths' : {'orientation_x' : 'orientation.x',
+                      'orientation_y' : 'orientation.y',
+                      'angular_velocity_x' : 'angular_velocity.x',
+                      'angular_velocity_y' : 'angular_velocity.y',
+                      'linear_acceleration_x' : 'linear_acceleration.x',
+                      'linear_acceleration_y' : 'linear_acceleration.y'
+     }
+    },
+
     # Table: velodyne_lidar
-    elif (table_name == 'velodyne_lidar'):
-        mapping_dict = {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
-                        'velodyne_hash': ['velodyne_hash', pl.Utf8],
-                        'velodyne_hash_root_folder_name': ['velodyne_hash_root_folder_name', pl.Utf8],
-                        'velodyne_file_size' : ['velodyne_file_size', pl.Int64],
-                        'velodyne_sensor_time' : ['velodyne_sensor_time', pl.Int64],
-                        'velodyne_host_time' : ['velodyne_host_time', pl.Int64],
-                        'velodyne_average_header_time' : ['velodyne_average_header_time', pl.Int64],
-                        'velodyne_bag_time' : ['velodyne_bag_time', pl.Int64]
-        }
-
-        db_col_lst = ['bag_file_db_id', 
-                      'velodyne_hash', 'velodyne_hash_root_folder_name', 'velodyne_file_size', 
-                      'velodyne_sensor_time', 'velodyne_host_time',
-                      'velodyne_average_header_time', 'velodyne_bag_time',
-                      'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
-        ]
+    {'tables' : {'velodyne_lidar' : None},
+
+     'mapping_dict' : {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
+                       'velodyne_hash': ['velodyne_hash', pl.Utf8],
+                       'velodyne_hash_root_folder_name': ['velodyne_hash_root_folder_name', pl.Utf8],
+                       'velodyne_file_size' : ['velodyne_file_size', pl.Int64],
+                       'velodyne_sensor_time' : ['velodyne_sensor_time', pl.Int64],
+                       'velodyne_host_time' : ['velodyne_host_time', pl.Int64],
+                       'velodyne_average_header_time' : ['velodyne_average_header_time', pl.Int64],
+                       'velodyne_bag_time' : ['velodyne_bag_time', pl.Int64]
+     },
+
+     'db_col_lst' : ['bag_file_db_id',
+                     'velodyne_hash', 'velodyne_hash_root_folder_name', 'velodyne_file_size',
+                     'velodyne_sensor_time', 'velodyne_host_time',
+                     'velodyne_average_header_time', 'velodyne_bag_time',
+                     'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
+     ]
+    },
 
     # Table: ouster_lidar
-    elif (table_name == 'ouster_lidar'):
-        mapping_dict = {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
-                        'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
-                        'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
-                        'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
-                        'ouster_hash': ['ouster_hash', pl.Utf8],
-                        'ouster_range_image_hash': ['ouster_range_image_hash', pl.Utf8],
-                        'ouster_signal_image_hash': ['ouster_signal_image_hash', pl.Utf8],
-                        'ouster_reflective_image_hash': ['ouster_reflective_image_hash', pl.Utf8],
-                        'ouster_nearir_image_hash': ['ouster_nearir_image_hash', pl.Utf8],
-                        'ouster_hash_root_folder_name': ['ouster_hash_root_folder_name', pl.Utf8],
-                        'ouster_file_size' : ['ouster_file_size', pl.Int64],
-                        'ouster_sensor_time' : ['ouster_sensor_time', pl.Int64],
-                        'ouster_host_time' : ['ouster_host_time', pl.Int64],
-                        'ouster_average_header_time' : ['ouster_average_header_time', pl.Int64],
-                        'ouster_bag_time' : ['ouster_bag_time', pl.Int64]
-        }
-
-        db_col_lst = ['bag_file_db_id', 
-                      'ouster_hash', 'ouster_range_image_hash',
-                      'ouster_signal_image_hash', 'ouster_reflective_image_hash',
-                      'ouster_nearir_image_hash', 'ouster_hash_root_folder_name',
-                      'ouster_sensor_time', 'ouster_host_time',
-                      'ouster_average_header_time', 'ouster_bag_time',
-                      'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
-        ]
-        
+    {'tables' : {'ouster_lidar' : None},
+
+     'mapping_dict' : {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
+                       'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
+                       'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
+                       'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
+                       'ouster_hash': ['ouster_hash', pl.Utf8],
+                       'ouster_range_image_hash': ['ouster_range_image_hash', pl.Utf8],
+                       'ouster_signal_image_hash': ['ouster_signal_image_hash', pl.Utf8],
+                       'ouster_reflective_image_hash': ['ouster_reflective_image_hash', pl.Utf8],
+                       'ouster_nearir_image_hash': ['ouster_nearir_image_hash', pl.Utf8],
+                       'ouster_hash_root_folder_name': ['ouster_hash_root_folder_name', pl.Utf8],
+                       'ouster_file_size' : ['ouster_file_size', pl.Int64],
+                       'ouster_sensor_time' : ['ouster_sensor_time', pl.Int64],
+                       'ouster_host_time' : ['ouster_host_time', pl.Int64],
+                       'ouster_average_header_time' : ['ouster_average_header_time', pl.Int64],
+                       'ouster_bag_time' : ['ouster_bag_time', pl.Int64]
+     },
+
+     'db_col_lst' : ['bag_file_db_id',
+                     'ouster_hash', 'ouster_range_image_hash',
+                     'ouster_signal_image_hash', 'ouster_reflective_image_hash',
+                     'ouster_nearir_image_hash', 'ouster_hash_root_folder_name',
+                     'ouster_sensor_time', 'ouster_host_time',
+                     'ouster_average_header_time', 'ouster_bag_time',
+                     'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
+     ]
+    },
+
     # Table: trigger
-    elif (table_name == 'trigger'):
-        mapping_dict = {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
-                        'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
-                        'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
-                        'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
-                        'mode': ['trigger_mode', pl.Utf8],
-                        'mode_counts': ['trigger_mode_counts', pl.Int32],
-                        'adjone': ['adjone', pl.Int32],
-                        'adjtwo': ['adjtwo', pl.Int32],
-                        'adjthree': ['adjthree', pl.Int32],
-                        'err_failed_mode_count': ['err_failed_mode_count', pl.Int32],
-                        'err_failed_XI_format': ['err_failed_xi_format', pl.Int32],
-                        'err_failed_checkInformation': ['err_failed_check_information', pl.Int32],
-                        'err_trigger_unknown_error_occured': ['err_trigger_unknown_error_occured', pl.Int32],
-                        'err_bad_uppercase_character': ['err_bad_uppercase_character', pl.Int32],
-                        'err_bad_lowercase_character': ['err_bad_lowercase_character', pl.Int32],
-                        'err_bad_three_adj_element': ['err_bad_three_adj_element', pl.Int32],
-                        'err_bad_first_element': ['err_bad_first_element', pl.Int32],
-                        'err_bad_character': ['err_bad_character', pl.Int32],
-                        'err_wrong_element_length': ['err_wrong_element_length', pl.Int32]
-        }
-
-        db_col_lst = ['bag_file_db_id', 'trigger_mode', 'trigger_mode_counts',
-                      'adjone', 'adjtwo', 'adjthree',
-                      'err_failed_mode_count', 'err_failed_xi_format', 'err_failed_check_information',
-                      'err_trigger_unknown_error_occured', 'err_bad_uppercase_character',
-                      'err_bad_lowercase_character', 'err_bad_three_adj_element',
-                      'err_bad_first_element', 'err_bad_character', 'err_wrong_element_length',
-                      'written_to_bag_time', 'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
-        ]
-    
-    else:
-        table_name = ""
-        mapping_dict = {}
-        db_col_lst = []
-
-    return table_name, mapping_dict, db_col_lst
+    {'tables' : {'trigger' : '/parseTrigger'},
+
+     'mapping_dict' : {'rosbagTimestamp' : ['ros_header_time', pl.Utf8],
+                       'ros_header_seconds' : ['ros_header_seconds', pl.Utf8],
+                       'ros_header_nanoseconds' : ['ros_header_nanoseconds', pl.Utf8],
+                       'written_to_bag_time' : ['written_to_bag_time', pl.Utf8],
+                       'mode': ['trigger_mode', pl.Utf8],
+                       'mode_counts': ['trigger_mode_counts', pl.Int32],
+                       'adjone': ['adjone', pl.Int32],
+                       'adjtwo': ['adjtwo', pl.Int32],
+                       'adjthree': ['adjthree', pl.Int32],
+                       'err_failed_mode_count': ['err_failed_mode_count', pl.Int32],
+                       'err_failed_XI_format': ['err_failed_xi_format', pl.Int32],
+                       'err_failed_checkInformation': ['err_failed_check_information', pl.Int32],
+                       'err_trigger_unknown_error_occured': ['err_trigger_unknown_error_occured', pl.Int32],
+                       'err_bad_uppercase_character': ['err_bad_uppercase_character', pl.Int32],
+                       'err_bad_lowercase_character': ['err_bad_lowercase_character', pl.Int32],
+                       'err_bad_three_adj_element': ['err_bad_three_adj_element', pl.Int32],
+                       'err_bad_first_element': ['err_bad_first_element', pl.Int32],
+                       'err_bad_character': ['err_bad_character', pl.Int32],
+                       'err_wrong_element_length': ['err_wrong_element_length', pl.Int32]
+     },
+
+     'db_col_lst' : ['bag_file_db_id', 'trigger_mode', 'trigger_mode_counts',
+                     'adjone', 'adjtwo', 'adjthree',
+                     'err_failed_mode_count', 'err_failed_xi_format', 'err_failed_check_information',
+                     'err_trigger_unknown_error_occured', 'err_bad_uppercase_character',
+                     'err_bad_lowercase_character', 'err_bad_three_adj_element',
+                     'err_bad_first_element', 'err_bad_character', 'err_wrong_element_length',
+                     'written_to_bag_time', 'ros_header_seconds', 'ros_header_nanoseconds', 'ros_header_time'
+     ]
+    }
+]
+
+
+class TableSchema:
+
+    '''
+    Everything about one database table, computed once when the module is imported:
+        - mapping_dict and db_col_lst, as returned by get_table_info
+        - subtopic_dict: {ROS bag / CSV name : database column name}
+        - type_map: {database column name : data type}
+        - csv_schema: {CSV column name : data type}, the types the CSV files of the table are read with
+        - field_paths: {database column name : attribute path in the ROS message}, None for the columns computed
+          from the header and the bag time
+    '''
+    def __init__(self, table_name, topic, mapping_dict, db_col_lst, field_paths = None):
+        self.table_name = table_name
+        self.topic = topic
+        self.mapping_dict = mapping_dict
+        self.db_col_lst = db_col_lst
+
+        self.subtopic_dict = {old_name : new_name[0] for old_name, new_name in mapping_dict.items()}
+        self.type_map = {new_name : new_type for new_name, new_type in mapping_dict.values()}
+        # The older CSV files write some integers as floats (e.g. GPSSecs = 1722883527.0), so the integer columns are read
+        # as Float64 and cast to their type by update_df
+        self.csv_schema = {old_name : (pl.Float64 if new_name[1] in (pl.Int32, pl.Int64) else new_name[1])
+                           for old_name, new_name in mapping_dict.items()}
+
+        field_paths = field_paths or {}
+        self.field_paths = {}
+        for old_name, new_name in self.subtopic_dict.items():
+            if (new_name in field_paths):
+                self.field_paths[new_name] = field_paths[new_name]
+            elif (new_name in HEADER_FIELD_PATHS):
+                self.field_paths[new_name] = HEADER_FIELD_PATHS[new_name]
+            else:
+                self.field_paths[new_name] = old_name
+
+# Table name -> TableSchema, and ROS bag topic -> table name
+TABLE_REGISTRY = {}
+TOPIC_TABLES = {}
+
+for definition in TABLE_DEFINITIONS:
+    for table_name, topic in definition['tables'].items():
+        TABLE_REGISTRY[table_name] = TableSchema(table_name, topic, definition['mapping_dict'], definition['db_col_lst'],
+                                                 definition.get('field_paths'))
+        if (topic is not None):
+            TOPIC_TABLES[topic] = table_name
+
+def get_table_info(table_name):
+    schema = TABLE_REGISTRY.get(table_name)
+
+    if (schema is None):
+        return "", {}, []
+
+    return schema.table_name, schema.mapping_dict, schema.db_col_lst
+
+''' Get the TableSchema of a table, or None if the table is not in the registry '''
+def get_table_schema(table_name):
+    return TABLE_REGISTRY.get(table_name)
+
+''' Get the table name of a ROS bag topic. A topic that isn't registered gets a name from the topic itself '''
+def get_topic_table(topic):
+    if (topic in TOPIC_TABLES):
+        return TOPIC_TABLES[topic]
+
+    # The table and topic name do not match - use the following to align the naming
+    table_name = topic.replace("/", "")   # Get rid the of "/" in the naming
+    table_name = table_name.lower()       # Make sure the name is all lowercase
+    table_name = table_name.replace("parse", "")   # Get rid of the "parse" in the name (if there)
+    return table_name
+
+''' Get the table name of a CSV file written by the bag to CSV code, e.g. "_slash_GPS_SparkFun_Front_GGA.csv" '''
+def get_csv_table(csv_file):
+    topic = csv_file.replace("\\", "/").split("/")[-1]
+    if (topic.endswith(".csv")):
+        topic = topic[:-4]               # Get rid of the ".csv" part
+    topic = topic.replace("_slash_", "/")
+    return get_topic_table(topic)
+
+''' Get the CREATE TABLE statement of a table, with the Postgres type of each column in the db_col_lst '''
+def get_table_ddl(table_name):
+    schema = TABLE_REGISTRY.get(table_name)
+
+    if (schema is None):
+        return ""
+
+    columns = ['id SERIAL PRIMARY KEY']
+    for col in schema.db_col_lst:
+        if (col in REFERENCE_COLUMNS):
+            col_type = REFERENCE_COLUMNS[col]
+        elif (col in TIME_COLUMNS):
+            col_type = 'BIGINT'
+        else:
+            col_type = POSTGRES_TYPES[schema.type_map[col]]
+        columns.append(f'{col} {col_type}')
+
+    column_lines = ',\n    '.join(columns)
+    return f'CREATE TABLE {table_name} (\n    {column_lines}\n);'
 
 def debug():
     # Choose a specific topic and call the function above
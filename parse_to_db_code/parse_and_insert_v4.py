@@ -6,29 +6,41 @@ from pathlib import Path
 import os
 import sys
 import argparse
+import multiprocessing.util
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import rosbag
 import pandas as pd
 import polars as pl
 
 import use_database
+from upload_pipeline import UploadPipeline
 import parse_pose
 import parse_utilities
 from parse_camera import parseCamera
 from parse_velodyne import parse_velodyne
-from write_csv import write_csv
+from write_csv import write_csv, write_columnar
 
 flags = {
     "write_time_log" : 0,
     "read_bag_files" : 1,
     "pose"           : 1,
     "camera"         : 1,
+    "camera_pass_through" : 0,   # Save the original jpeg bytes of each frame instead of decoding and re-encoding it (gives different hashes than 0)
     "velodyne"       : 1,
     "ouster"         : 0,
     "display_df"     : 0,
     "to_csv"         : 0,
-    "to_db"          : 1
+    "to_parquet"     : 0,   # Also write each pose topic as a Parquet (zstd) file
+    "to_ipc"         : 0,   # Also write each pose topic as an Arrow IPC file, which can be memory mapped when it is read
+    "to_db"          : 1,
+    "replace_existing_bags" : 0,   # Delete the data of a bag that is already in the database before parsing it again
+    "idempotent_ingest" : 0,   # Skip the rows that are already in the database, so parsing a bag again adds no duplicates (needs the ingest keys, option 11 of use_database.py)
+    "binary_copy"    : 1,   # Send the data frames to the database with binary COPY (CSV COPY is used for tables it doesn't support)
+    "db_pool_size"   : 1,   # Above 1: upload the tables of a bag in the background through staging tables (see use_database.df_to_db)
+    "pipeline"       : 0,   # Upload the data frames in a background thread while the next bag is parsed (see upload_pipeline.py)
+    "pipeline_queue_size" : 4   # Number of parsed data frames that can wait for the upload before parsing waits
 }
 
 db_login_info = {
@@ -54,6 +66,7 @@ def parse_arugments():
     arg_parser.add_argument("-d", "--destinationPath", required = True, help = "Path to the destination directory.", type = str)
     arg_parser.add_argument("-f", "--fileName", required = False, help = "Specific file to parse.")
     arg_parser.add_argument("-a", "--allFiles", required = False, action = "store_true", help = "Parse all files in the source path and its subfolders.")
+    arg_parser.add_argument("-j", "--jobs", required = False, default = 1, type = int, help = "Number of files to parse at the same time, each in its own process.")
     
     # Access the input arguments
     input_args = arg_parser.parse_args()
@@ -69,9 +82,8 @@ def parse_arugments():
     
     files_to_parse = []
     
-    arg_count = len(sys.argv)
-    if (arg_count > 7):
-        print(f"""Error - Too many arguments given ({arg_count}) \n   There hould be 5: script -s sourcePath -d destinationPath, \n     or 6: script -s sourcePath -d destinationPath -a, \n     or 7: script -s sourcePath -d destinationPath -f fileName""")
+    if (input_args.fileName and input_args.allFiles):
+        print(f"""Error - Use either -f fileName or -a, not both \n   There should be: script -s sourcePath -d destinationPath, \n     or: script -s sourcePath -d destinationPath -a, \n     or: script -s sourcePath -d destinationPath -f fileName \n   Each can be followed by -j jobs""")
         sys.exit(1)
         
     elif (input_args.fileName):
@@ -88,12 +100,8 @@ def parse_arugments():
         root_path = Path(path_to_source)
         files_to_parse = [str(p.relative_to(root_path)) for p in root_path.rglob("*") if p.suffix in [".bag", ".csv"]]
         
-    elif (arg_count == 5):
-        files_to_parse = [f for f in os.listdir(path_to_source) if f.endswith(".bag") or f.endswith(".csv")]
-    
     else:
-        print(f"Bad argument(s): {sys.argv}")
-        sys.exit(1)
+        files_to_parse = [f for f in os.listdir(path_to_source) if f.endswith(".bag") or f.endswith(".csv")]
         
     if (flags["read_bag_files"]):
         files_to_parse = [file for file in files_to_parse if (
@@ -119,7 +127,7 @@ def parse_arugments():
     print(f"Path to Destination: {path_to_dest}\n")
     parse_utilities.print_file_list(files_to_parse)
         
-    return path_to_source, path_to_dest, files_to_parse
+    return path_to_source, path_to_dest, files_to_parse, max(1, input_args.jobs)
 
 '''
 Return information about topics and subtopics in the input bag file. Can also use this function to check
@@ -147,17 +155,13 @@ def get_bag_info(bag_file, path_to_source, path_to_dest):
     topic_subtopic_dict = {}
     topic_lst = []
 
-    # Loop through the bag messages
-    for topic, msg, t in bag.read_messages():
-        subtopics = msg.__slots__
-
-        # Make sure the topics and subtopics are unique
-        if topic not in topic_lst and subtopics not in topic_subtopic_dict.items():
-            # Don't bother with data that won't go to the database or isn't related to the cameras or OusterO1_Raw
-            if (("cameras" in bag_name) or ("OusterO1_Raw" in bag_name) or (topic in db_tables)):
-                # Update the list and dictionary
-                topic_lst.append(topic)
-                topic_subtopic_dict.update({topic : subtopics})
+    # Read the topics and subtopics from the bag index instead of looping through every message
+    for topic, info in parse_utilities.get_bag_topic_info(bag).items():
+        # Don't bother with data that won't go to the database or isn't related to the cameras or OusterO1_Raw
+        if (("cameras" in bag_name) or ("OusterO1_Raw" in bag_name) or (topic in db_tables)):
+            # Update the list and dictionary
+            topic_lst.append(topic)
+            topic_subtopic_dict.update({topic : info["subtopics"]})
 
     # Print information about the topics
     print(f"For '{bag_file}', these {len(topic_lst)} topics will be parsed: {topic_lst}")
@@ -166,10 +170,193 @@ def get_bag_info(bag_file, path_to_source, path_to_dest):
     # Return relevant information
     return bag, path_to_bag, bag_name, path_to_new_bag_dir, topic_subtopic_dict, topic_lst
 
+'''
+Parse one bag (or CSV) file and upload its data frames to the database. This is the work done for each file, so it can
+run in its own process when each process has its own database connection (see init_worker). With a pipeline, the
+data frames are queued for its uploader thread instead of being uploaded here.
+'''
+def parse_file(file, file_count, file_total, path_to_source, path_to_dest, hash_names, db, db_name, pipeline = None):
+    hash_name_Cameras, hash_name_Velodyne, hash_name_OusterO1 = hash_names
+
+    file_start_time = time.time()
+    
+    dfs_created = 0
+    df = pl.DataFrame()
+    bag_file_db_id = None
+    new_bag = False   # Whether the bag_files row of the bag is inserted by this run
+    
+    if (flags["read_bag_files"] == 0):
+        print("Handling CSV files...\n")
+    
+    else:        
+        bag, path_to_bag, bag_name, path_to_new_bag_dir, topic_subtopic_dict, topic_lst = get_bag_info(file, path_to_source, path_to_dest)
+        
+        # For debugging the above:
+        # print(f"""(Debugging) Bag Info:
+        #     path_to_bag: {path_to_bag}
+        #     bag_name: {bag_name}
+        #     path_to_new_bag_dir: {path_to_new_bag_dir}
+        #     topic_subtopic_dict: {topic_subtopic_dict}
+        #     topic_lst: {topic_lst}""")
+        
+        # Make a new folder - unless you are just doing pose data and not writing to CSV files
+        if (flags["camera"] or flags["velodyne"] or flags["ouster"] or (flags["pose"] and (flags["to_csv"] or flags["to_parquet"] or flags["to_ipc"]))): 
+            parse_utilities.make_folder(path_to_new_bag_dir, bag_name)
+        
+        if (flags["to_db"] == 1):
+            bag_file_db_id = db.get_bag_id_from_name(bag_name)
+            
+            if (bag_file_db_id == None):
+                bag_file_db_id = db.insert_new_bag(bag_name)
+                new_bag = True
+
+            elif (flags["replace_existing_bags"]):
+                # In the tables partitioned by bag, this drops the partitions of the bag (see use_database.partition_by_bag)
+                print(f"'{bag_name}' is already in the database (id = {bag_file_db_id}), its data will be replaced.")
+                db.delete_bag_rows(bag_file_db_id)
+            
+        else:
+            bag_file_db_id = 1  
+            
+        # Handle Ouster data
+        if ("OusterO1_Raw" in file):
+            if (flags["ouster"]):
+                print("Skipping Ouster data now.\n")
+                
+                # To-do: Fix the following function
+                print(f"Now parsing: OusterO1_Raw")
+                # df = parse_ouster(path_to_source, path_to_bag, path_to_dest, hash_name_OusterO1, file, bag_file_db_id, db, flags["to_db"])
+                
+                if (df.is_empty() == False):
+                    bag_df_count += 1
+
+                print("\t + OusterO1_Raw data has been parsed.")
+
+            else:
+                print("\t - OusterO1_Raw data will not be parsed.\n")
+        else:
+            # Parse all of the pose topics in a single read of the bag, instead of reading the bag again for each topic
+            pose_dfs = {}
+            if (flags["pose"] and ("cameras" not in file)):
+                pose_topics = [topic for topic in topic_subtopic_dict.keys() if topic != "/velodyne_packets"]
+                pose_dfs = parse_pose.parse_pose_bag(bag, pose_topics, bag_file_db_id, flags["to_db"], db)
+
+            for topic, subtopics in topic_subtopic_dict.items():
+                topic_start_time = time.time()
+                
+                if (flags["display_df"]):
+                    print(f"Now working on: '{topic}'...\n")
+                    
+                # Handle camera data
+                if ("cameras" in file):
+                    if (flags["camera"]):
+                        # Ceeate an instance of the parseCamera class
+                        pc = parseCamera(path_to_source, path_to_bag, path_to_dest, bag, hash_name_Cameras, bag_file_db_id, flags["to_db"], db, passThrough = (flags["camera_pass_through"] == 1))
+                        
+                        output_file_name = f"{path_to_dest}/{bag_name}/{topic.replace('/', '_slash_')}.txt"    
+                        df, table_name, db_col_lst = pc.parseCamera(topic, output_file_name)   # Create a data frame
+                            
+                    else:
+                        print(f"\t - Camera topic '{topic}' will not be parsed.")
+                        
+                # Handle Velodyne data
+                elif (topic == "/velodyne_packets"): 
+                    if (flags["velodyne"]):
+                        df, table_name, db_col_lst = parse_velodyne(path_to_source, path_to_bag, path_to_dest, hash_name_Velodyne, topic, bag, bag_file_db_id, db, flags["to_db"])   # Create a data frame
+                            
+                    else:
+                        print(f"\t - Camera topic '{topic}' will not be parsed.")
+                    
+                # Handle pose data
+                elif (flags["pose"]):    
+                    df, table_name, db_col_lst = pose_dfs[topic]
+                    
+                    if ((df.is_empty() == False) and (flags["to_csv"])):
+                        write_csv(path_to_dest, topic, df)
+                    if ((df.is_empty() == False) and (flags["to_parquet"])):
+                        write_columnar(path_to_dest, topic, df, "parquet")
+                    if ((df.is_empty() == False) and (flags["to_ipc"])):
+                        write_columnar(path_to_dest, topic, df, "ipc")
+                
+                else:
+                    print("No flags set to parse any data types.")
+                    
+                if (df.is_empty() == False):
+                    dfs_created += 1
+                    
+                    if (flags["display_df"]):
+                        print(f"Displaying the first 3 rows of '{topic}' in '{table_name}':")
+                        print(df.head(3))
+                        
+                    if (flags["to_db"]):
+                        if table_name != None:
+                            if (pipeline is not None):
+                                pipeline.put_df(db, table_name, df, db_col_lst)
+                            else:
+                                db.df_to_db(table_name, df, db_col_lst)
+                            
+    # Display information about the number of bag file data frames created
+    if ((dfs_created > 0)):
+        print("-" * 125)
+        print(f"Total data frames for file #{file_count}/{file_total} created: {dfs_created}\n")
+
+    if (flags["to_db"]):
+        if (pipeline is not None):
+            pipeline.put_commit(db, bag_file_db_id, new_bag)
+        else:
+            db.check_and_commit(db_name)
+                                        
+    file_runtime = parse_utilities.display_runtime(file_start_time, "File", False)
+
+    return file_runtime
+
+# Database connection and upload pipeline of a worker process, made once when the process starts
+worker_db = None
+worker_pipeline = None
+
+'''
+Size of the connection pool of the parsing side. With a pipeline, the uploader uploads the data frames, so the parsing
+side doesn't need a pool.
+'''
+def parse_pool_size():
+    return 1 if (flags["to_db"] and flags["pipeline"]) else flags["db_pool_size"]
+
+'''
+Create the upload pipeline of a process, if the pipeline flag is set and the data goes to the database.
+'''
+def make_pipeline(db_url, db_name):
+    if (flags["to_db"] and flags["pipeline"]):
+        return UploadPipeline(db_url, db_name, flags["pipeline_queue_size"], binary_copy = (flags["binary_copy"] == 1), idempotent = (flags["idempotent_ingest"] == 1), pool_size = flags["db_pool_size"])
+    return None
+
+'''
+Initialize a worker process of the process pool by connecting it to the database. The upload pipeline of the worker is
+closed (and its queue emptied) when the process exits.
+'''
+def init_worker(db_url, db_name):
+    global worker_db, worker_pipeline
+    worker_db = use_database.Database(flags["to_db"], db_url, binary_copy = (flags["binary_copy"] == 1), idempotent = (flags["idempotent_ingest"] == 1), pool_size = parse_pool_size())
+    worker_pipeline = make_pipeline(db_url, db_name)
+    if (worker_pipeline is not None):
+        # Worker processes don't run atexit handlers, but they do run the multiprocessing finalizers
+        multiprocessing.util.Finalize(None, worker_pipeline.close, exitpriority = 10)
+
+def parse_file_in_worker(file, file_count, file_total, path_to_source, path_to_dest, hash_names, db_name):
+    try:
+        return parse_file(file, file_count, file_total, path_to_source, path_to_dest, hash_names, worker_db, db_name, worker_pipeline)
+
+    except Exception:
+        # Roll back what the bag left on the connection of the worker, so the next bag of the worker doesn't commit it
+        if (flags["to_db"]):
+            worker_db.conn.rollback()
+            worker_db.forget_transaction()
+            worker_db.drop_staged_dfs()
+        raise
+
 def main():
     start_time = time.time()
     
-    path_to_source, path_to_dest, files_to_parse = parse_arugments()
+    path_to_source, path_to_dest, files_to_parse, jobs = parse_arugments()
     
     try:
         if (flags["to_db"]):
@@ -181,13 +368,15 @@ def main():
         db_url = f"postgresql://{db_login_info_lst[0]}:{db_login_info_lst[1]}@{db_login_info_lst[2]}:{db_login_info_lst[3]}/{db_login_info_lst[4]}"
         
         # Connect to the database
-        db = use_database.Database(flags["to_db"], db_url)
+        db = use_database.Database(flags["to_db"], db_url, binary_copy = (flags["binary_copy"] == 1), idempotent = (flags["idempotent_ingest"] == 1), pool_size = parse_pool_size())
         print("─" * 125)
         
     except:
         print("Error connecting to the database. Please check database connection parameters.")
         sys.exit()
         
+    db_name = db_login_info["db_name"]
+
     # Determine the names of the different folders
     site_folder_name = os.path.basename(path_to_source)
     site_folder_name_nonspace = site_folder_name.replace(" ", "_")
@@ -203,115 +392,43 @@ def main():
     #     hash_name_Velodyne: {hash_name_Velodyne}
     #     hash_name_OusterO1: {hash_name_OusterO1}""")
     
-    file_count = 0
-    # files_to_parse = [files_to_parse[0]]
-    for file in files_to_parse:
-        file_start_time = time.time()
-        file_count += 1
-        
-        dfs_created = 0
-        df = pl.DataFrame()
-        
-        if (flags["read_bag_files"] == 0):
-            print("Handling CSV files...\n")
+    hash_names = (hash_name_Cameras, hash_name_Velodyne, hash_name_OusterO1)
+    
+    files_runtime = 0
+    if (jobs == 1):
+        pipeline = make_pipeline(db_url, db_name)
         
-        else:        
-            bag, path_to_bag, bag_name, path_to_new_bag_dir, topic_subtopic_dict, topic_lst = get_bag_info(file, path_to_source, path_to_dest)
-            
-            # For debugging the above:
-            # print(f"""(Debugging) Bag Info:
-            #     path_to_bag: {path_to_bag}
-            #     bag_name: {bag_name}
-            #     path_to_new_bag_dir: {path_to_new_bag_dir}
-            #     topic_subtopic_dict: {topic_subtopic_dict}
-            #     topic_lst: {topic_lst}""")
-            
-            # Make a new folder - unless you are just doing pose data and not writing to CSV files
-            if (flags["camera"] or flags["velodyne"] or flags["ouster"] or (flags["pose"] and flags["to_csv"])): 
-                parse_utilities.make_folder(path_to_new_bag_dir, bag_name)
-            
-            if (flags["to_db"] == 1):
-                bag_file_db_id = db.get_bag_id_from_name(bag_name)
-                
-                if (bag_file_db_id == None):
-                    bag_file_db_id = db.insert_new_bag(bag_name)
-                
-            else:
-                bag_file_db_id = 1  
-                
-            # Handle Ouster data
-            if ("OusterO1_Raw" in file):
-                if (flags["ouster"]):
-                    print("Skipping Ouster data now.\n")
-                    
-                    # To-do: Fix the following function
-                    print(f"Now parsing: OusterO1_Raw")
-                    # df = parse_ouster(path_to_source, path_to_bag, path_to_dest, hash_name_OusterO1, file, bag_file_db_id, db, flags["to_db"])
-                    
-                    if (df.is_empty() == False):
-                        bag_df_count += 1
+        file_count = 0
+        # files_to_parse = [files_to_parse[0]]
+        for file in files_to_parse:
+            file_count += 1
+            files_runtime += parse_file(file, file_count, len(files_to_parse), path_to_source, path_to_dest, hash_names, db, db_name, pipeline)
 
-                    print("\t + OusterO1_Raw data has been parsed.")
+        # Wait for the last uploads before the final database report
+        if (pipeline is not None):
+            pipeline.close()
 
-                else:
-                    print("\t - OusterO1_Raw data will not be parsed.\n")
-            else:
-                for topic, subtopics in topic_subtopic_dict.items():
-                    topic_start_time = time.time()
-                    
-                    if (flags["display_df"]):
-                        print(f"Now working on: '{topic}'...\n")
-                        
-                    # Handle camera data
-                    if ("cameras" in file):
-                        if (flags["camera"]):
-                            # Ceeate an instance of the parseCamera class
-                            pc = parseCamera(path_to_source, path_to_bag, path_to_dest, bag, hash_name_Cameras, bag_file_db_id, flags["to_db"], db)
-                            
-                            output_file_name = f"{path_to_dest}/{bag_name}/{topic.replace('/', '_slash_')}.txt"    
-                            df, table_name, db_col_lst = pc.parseCamera(topic, output_file_name)   # Create a data frame
-                                
-                        else:
-                            print(f"\t - Camera topic '{topic}' will not be parsed.")
-                            
-                    # Handle Velodyne data
-                    elif (topic == "/velodyne_packets"): 
-                        if (flags["velodyne"]):
-                            df, table_name, db_col_lst = parse_velodyne(path_to_source, path_to_bag, path_to_dest, hash_name_Velodyne, topic, bag, bag_file_db_id, db, flags["to_db"])   # Create a data frame
-                                
-                        else:
-                            print(f"\t - Camera topic '{topic}' will not be parsed.")
-                        
-                    # Handle pose data
-                    elif (flags["pose"]):    
-                        df, table_name, db_col_lst = parse_pose.parse_pose_topics(bag, topic, subtopics, bag_file_db_id, flags["to_db"], db)
-                        
-                        if ((df.is_empty() == False) and (flags["to_csv"])):
-                            write_csv(path_to_dest, topic, df)
+    else:
+        # Each file is parsed in its own process, with its own rosbag handle and database connection
+        print(f"Parsing {len(files_to_parse)} file(s) with {jobs} processes...\n")
+        with ProcessPoolExecutor(max_workers = jobs, initializer = init_worker, initargs = (db_url, db_name)) as executor:
+            futures = {}
+            for file_count, file in enumerate(files_to_parse, start = 1):
+                future = executor.submit(parse_file_in_worker, file, file_count, len(files_to_parse), path_to_source, path_to_dest, hash_names, db_name)
+                futures[future] = file
+
+            files_done = 0
+            for future in as_completed(futures):
+                files_done += 1
+                try:
+                    file_runtime = future.result()
+                    files_runtime += file_runtime
+                    print(f"Finished file {files_done}/{len(files_to_parse)}: '{futures[future]}' in {file_runtime} seconds")
                     
-                    else:
-                        print("No flags set to parse any data types.")
-                        
-                    if (df.is_empty() == False):
-                        dfs_created += 1
-                        
-                        if (flags["display_df"]):
-                            print(f"Displaying the first 3 rows of '{topic}' in '{table_name}':")
-                            print(df.head(3))
-                            
-                        if (flags["to_db"]):
-                            if table_name != None:
-                                db.df_to_db(table_name, df, db_col_lst)
-                                
-        # Display information about the number of bag file data frames created
-        if ((dfs_created > 0)):
-            print("-" * 125)
-            print(f"Total data frames for file #{file_count}/{len(files_to_parse)} created: {dfs_created}\n")
+                except Exception as e:
+                    print(f"Error parsing '{futures[future]}': {e}")
 
-        if (flags["to_db"]):
-            db.check_and_commit(db_name)
-                                            
-        file_runtime = parse_utilities.display_runtime(file_start_time, "File", False)
+        print(f"Sum of the file runtimes: {round(files_runtime, 4)} seconds")
     
     # Disconnect from the database (if connected)
     if (flags["to_db"]):
@@ -26,6 +26,8 @@ import pandas as pd
 import polars as pl
 
 import parse_utilities
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 class parseCamera:
 
@@ -62,7 +64,7 @@ class parseCamera:
 		================================================================================
 	'''
 
-	def __init__(self, pathForRootFolder, PathForCurrentBag, destinationPath, bag_file, hashName_Cameras, bag_file_db_id, to_db, db):
+	def __init__(self, pathForRootFolder, PathForCurrentBag, destinationPath, bag_file, hashName_Cameras, bag_file_db_id, to_db, db, passThrough=False, numThreads=None):
 		self.pathForRootFolder = pathForRootFolder
 		self.PathForCurrentBag = PathForCurrentBag
 		self.destinationPath = destinationPath
@@ -71,6 +73,10 @@ class parseCamera:
 		self.bag_file_db_id = bag_file_db_id
 		self.to_db = to_db
 		self.db = db
+		# With passThrough, the JPEG bytes of the message are hashed and saved as they are, see saveMD5JPEG()
+		self.passThrough = passThrough
+		# Number of threads that decode, hash and save the frames, one per core by default
+		self.numThreads = numThreads or os.cpu_count() or 1
 
 		# self.output_file_name = output_file_name
 
@@ -161,6 +167,39 @@ class parseCamera:
 
 		return md5_filename
 
+	'''
+		============================= Method saveMD5JPEG() ====================================
+		Method Purpose:
+			save the compressed bytes of a CompressedImage message, without decoding
+			and re-encoding them, into the folder with hash value filename as .jpg format
+		Input Variable:
+			jpegBytes:	msg.data of a jpeg CompressedImage message
+
+		Output/Return:
+			md5 hash of the jpeg bytes
+
+		Restrictions/Notes:
+			The hash is computed from the jpeg bytes, not from the decoded pixels as in
+			saveMD5Image(), so the same frame gets a different hash in the two modes.
+			A frame that is already in the hash table is not written again.
+
+		================================================================================
+	'''
+
+	def saveMD5JPEG(self, jpegBytes):
+
+		md5_filename = hashlib.md5(jpegBytes).hexdigest()
+
+		# No sub folder for each camera, save all images in the same hash table
+		cameraHashBranch = self.destinationPath + '/' + self.hashName_Cameras + '/' + md5_filename[0:2] + '/' + md5_filename[2:4]
+		cameraHashLeaf = cameraHashBranch + '/' + md5_filename + '.jpg'
+		if not os.path.exists(cameraHashLeaf):
+			self.make_sure_path_exists(cameraHashBranch)
+			with open(cameraHashLeaf, 'wb') as f:
+				f.write(jpegBytes)
+
+		return md5_filename
+
 	def rotateImage(self, img, angle):
 
 		(h, w) = img.shape[:2]
@@ -253,6 +292,62 @@ class parseCamera:
 	===========================================================================================
 	'''
 
+	'''
+		============================= Method saveFrame() ====================================
+		Method Purpose:
+			hash and save one CompressedImage message into the camera hash table,
+			this method runs in the threads of parseCamera()
+		Input Variable:
+			image_topic, msg, rotate, angle
+
+		Output/Return:
+			md5 hash of the frame
+		================================================================================
+	'''
+
+	def saveFrame(self, image_topic, msg, rotate, angle):
+		# This must be used for compressed images. CvBridge does not
+		# support compressed images.
+		# http://wiki.ros.org/rospy_tutorials/Tutorials/WritingImagePublisherSubscriber
+		# In pass-through mode, jpeg frames are only decoded when they need to be rotated
+		if self.passThrough and rotate is not True and 'jpeg' in msg.format:
+			return self.saveMD5JPEG(msg.data)
+
+		np_arr = np.frombuffer(msg.data, np.uint8)
+		img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+
+		if rotate is True:
+			img = self.rotateImage(img, angle)
+
+		# This can be used for raw images, but not for compressed. CvBridge
+		# does not support compressed images.
+		# https://gist.github.com/wngreene/835cda68ddd9c5416defce876a4d7dd9
+		# try:
+		# 	img = self.bridge.imgmsg_to_cv2(msg)
+		# except CvBridgeError, e:
+		# 	print e
+
+		# img = cv2.undistort(img,K_left,D_left)
+
+		return self.saveMD5Image(image_topic,img)
+
+	'''
+		============================= Method addFrameRow() ====================================
+		Method Purpose:
+			create the data frame row of one frame, once its hash is known
+		Input Variable:
+			data, future (returns the md5 hash of the frame), msg, bag_timestamp
+		================================================================================
+	'''
+
+	def addFrameRow(self, data, future, msg, bag_timestamp):
+		md5_filename = future.result()
+
+		header_time_nanoseconds = repr(msg.header.stamp.secs*10**(9) + msg.header.stamp.nsecs)
+		bag_time_nanoseconds = repr(bag_timestamp.secs*10**(9) + bag_timestamp.nsecs)
+
+		return self.createCameraDFRow(data, md5_filename, header_time_nanoseconds, bag_time_nanoseconds)
+
 	'''
 		============================= Method parseCamera() ====================================
 		#	Method Purpose:
@@ -324,54 +419,22 @@ class parseCamera:
 		file.write(Camera_info_header + "\n")
 		number_of_messages = self.bag_file.get_message_count(topic_filters=image_topic)
 
+		# Frames are decoded, hashed and saved by a pool of threads (cv2 and hashlib release the GIL), while the
+		# rows of the data frame are still created in the order of the frames. At most 2*numThreads frames are in flight.
 		count_of_camera_frame = 1
-		for topic, msg, bag_timestamp in self.bag_file.read_messages(topics=[image_topic]):
-			# This must be used for compressed images. CvBridge does not
-			# support compressed images.
-			# http://wiki.ros.org/rospy_tutorials/Tutorials/WritingImagePublisherSubscriber
-			np_arr = np.fromstring(msg.data, np.uint8)
-			img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
-			if rotate is True:
-				img = self.rotateImage(img, angle)
-
-			# This can be used for raw images, but not for compressed. CvBridge
-			# does not support compressed images.
-			# https://gist.github.com/wngreene/835cda68ddd9c5416defce876a4d7dd9
-			# try:
-			# 	img = self.bridge.imgmsg_to_cv2(msg)
-			# except CvBridgeError, e:
-			# 	print e
-
-			# img = cv2.undistort(img,K_left,D_left)
-
-			md5_filename = self.saveMD5Image(image_topic,img)
-			# Uncomment the following line to show the progress in the terminal
-			parse_utilities.printProgress(count_of_camera_frame, number_of_messages, prefix='Camera Topic Progress:', suffix='Complete', decimals=1, length=50)
-
-			header_time_nanoseconds = repr(msg.header.stamp.secs*10**(9) + msg.header.stamp.nsecs)
-			bag_time_nanoseconds = repr(bag_timestamp.secs*10**(9) + bag_timestamp.nsecs)
-			# file.write(str(msg.header.seq + 1))
-			# file.write(',')
-			# file.write(str(parse_utilities.unixTimeToTimeStamp(msg.header.stamp.secs)))
-			# file.write(',')
-			# file.write(str(msg.header.stamp.secs))
-			# file.write(',')
-			# file.write(str(msg.header.stamp.nsecs))
-			# file.write(',')
-			# file.write(header_time_nanoseconds)
-			# file.write(',')
-			# file.write(bag_time_nanoseconds)
-			# file.write(',')
-			# file.write(str(md5_filename))
-			# file.write('\n')
-
-			count_of_camera_frame += 1
-
-			''' *** '''
-			# Create the a row of data for the data frame
-			data = self.createCameraDFRow(data, md5_filename, header_time_nanoseconds, bag_time_nanoseconds)
-			''' *** '''
+		pendingFrames = deque()
+		with ThreadPoolExecutor(max_workers=self.numThreads) as pool:
+			for topic, msg, bag_timestamp in self.bag_file.read_messages(topics=[image_topic]):
+				pendingFrames.append((pool.submit(self.saveFrame, image_topic, msg, rotate, angle), msg, bag_timestamp))
+				if len(pendingFrames) >= 2*self.numThreads:
+					data = self.addFrameRow(data, *pendingFrames.popleft())
+					parse_utilities.printProgress(count_of_camera_frame, number_of_messages, prefix='Camera Topic Progress:', suffix='Complete', decimals=1, length=50)
+					count_of_camera_frame += 1
+
+			while pendingFrames:
+				data = self.addFrameRow(data, *pendingFrames.popleft())
+				parse_utilities.printProgress(count_of_camera_frame, number_of_messages, prefix='Camera Topic Progress:', suffix='Complete', decimals=1, length=50)
+				count_of_camera_frame += 1
 
 		file.close()
 
@@ -12,6 +12,10 @@ Usage:
 
 Method(s): csv_to_df(csv_file, bag_file_name, bag_file_id, to_db, db)
     Create a data frame given a CSV file.
+
+           scan_csv_table(csv_file)
+    Lazily scan a CSV file with the column types of its table in the registry (see get_table_info), without reading
+    the whole file into memory. Used by the backfill_csv.py script.
 '''
 from io import StringIO 
 from pathlib import Path
@@ -31,9 +35,16 @@ import pandas as pd
 import polars as pl
 import numpy as np
 
-from get_table_info import get_table_info
+from get_table_info import get_table_info, get_table_schema, get_csv_table
 from update_df import update_df
 
+# Columns that the older CSV files don't have, and the CSV column each one is made from instead: the header stamp is
+# written as secs and nsecs, and the rosbagTimestamp column is the time the message was written to the bag
+LEGACY_CSV_COLUMNS = {'ros_header_seconds' : 'secs',
+                      'ros_header_nanoseconds' : 'nsecs',
+                      'written_to_bag_time' : 'rosbagTimestamp'
+}
+
 def csv_to_df(csv_file, bag_file_db_id, to_db, db):
     # Use the Pandas library to read the CSV files, using commas to separate each value
     df_pandas = pd.read_csv(csv_file, sep = ",")
@@ -42,20 +53,7 @@ def csv_to_df(csv_file, bag_file_db_id, to_db, db):
     # Transform into a polars data frame
     df = pl.DataFrame(df_pandas)
 
-    # The table and topic name do not match - use the following to align the naming
-    table_name = csv_file.split("/")[-1]
-    table_name = table_name.replace("_slash_", "")   # Get rid the of "_slash_" in the naming
-    table_name = table_name[:-4]                     # Get rid of the ".csv" part
-    table_name = table_name.lower()                  # Make sure the name is all lowercase
-
-    # Handle the ousterO1/imu topic specifically
-    if ("ouster" in table_name and "imu" in table_name):
-        table_name = "ousterO1_imu"
-
-    # Handle the parse_encoder and parse_trigger topics
-    if ("parse" in table_name):
-        table_name = table_name.replace("parse", "")   # Get rid of the "parse" in the name (if there)
-    
+    table_name = get_csv_table(csv_file)   # The table and CSV file name do not match - look the table of the file up
     table_name, mapping_dict, db_col_lst = get_table_info(table_name)   # Get information about the corresponding table
 
     # Display the first 3 rows of the data frame
@@ -65,4 +63,54 @@ def csv_to_df(csv_file, bag_file_db_id, to_db, db):
     print()
 
     # Return the following
-    return df, table_name, db_col_lst
\ No newline at end of file
+    return df, table_name, db_col_lst
+
+'''
+Lazily scan a CSV file into the columns of its table. Returns a polars LazyFrame with the columns renamed to the database
+names (ready for update_df), and the table_name, mapping_dict and db_col_lst of the table. For a CSV file of a topic that
+isn't in the database, the LazyFrame is None and the table_name is empty.
+'''
+def scan_csv_table(csv_file):
+    table_name = get_csv_table(csv_file)
+    schema = get_table_schema(table_name)
+
+    if (schema is None):
+        return None, "", {}, []
+
+    # The files written on Windows end their lines with "\r\n". They are read with "\r" as the end of line (a quoted value
+    # followed by "\r\n" is not valid for polars), so the "\n" ends up at the start of the first column of each row
+    with open(csv_file, "rb") as f:
+        windows_lines = f.readline().endswith(b"\r\n")
+    eol_char = "\r" if windows_lines else "\n"
+
+    header = pl.read_csv(csv_file, n_rows = 0, eol_char = eol_char).columns
+    first_column = header[0] if windows_lines else None
+
+    # Read every column as text, except the columns of the table that get their type from the registry. The first column
+    # of a Windows file is read as text and cast after its "\n" is removed
+    schema_overrides = {old_name : dtype for old_name, dtype in schema.csv_schema.items()
+                        if old_name in header and old_name != first_column}
+
+    lazy_df = pl.scan_csv(csv_file, infer_schema = False, schema_overrides = schema_overrides, eol_char = eol_char)
+
+    def read_column(name, dtype):
+        if (name == first_column):
+            value = pl.col(name).str.strip_chars("\n")
+            return pl.when(value != "").then(value).cast(dtype)   # The last line break leaves a row with only "\n"
+        return pl.col(name)
+
+    # Rename the columns to the database names. A column the file doesn't have is made from its legacy column, or is null
+    expressions = []
+    for old_name, new_name in schema.subtopic_dict.items():
+        dtype = schema.csv_schema[old_name]
+        if (old_name in header):
+            expressions.append(read_column(old_name, dtype).alias(new_name))
+        elif (LEGACY_CSV_COLUMNS.get(new_name) in header):
+            expressions.append(read_column(LEGACY_CSV_COLUMNS[new_name], pl.Utf8).cast(dtype).alias(new_name))
+        else:
+            expressions.append(pl.lit(None, dtype = dtype).alias(new_name))
+
+    lazy_df = lazy_df.select(expressions)
+    lazy_df = lazy_df.filter(pl.any_horizontal(pl.all().is_not_null()))   # Drop rows where all elements are null
+
+    return lazy_df, schema.table_name, schema.mapping_dict, schema.db_col_lst
@@ -20,6 +20,7 @@ import velodyne_decoder as vd
 
 import use_database
 import parse_utilities
+from scan_archive import ScanArchiveWriter
 
 from ouster.sdk import client
 from ouster.sdk import bag as ouster_bag
@@ -28,6 +29,8 @@ from ouster.sdk.examples.colormaps import normalize
 
 def parse_ouster(pathForRootFolder, PathForCurrentBag, destinationPathForParsedOutputs, hashName_OusterO1, bagFileName, bag_file_db_id, db, to_db):
     to_write = 1
+    ply_binary = 1   # Write the scans as binary_little_endian PLY files instead of ascii
+    scan_archive = 0   # Append the scans into one <bag_name>.pack file with an md5 index instead of one PLY file per scan (see scan_archive.py)
 
     data = []
     df = pl.DataFrame()
@@ -58,12 +61,8 @@ def parse_ouster(pathForRootFolder, PathForCurrentBag, destinationPathForParsedO
     except Exception as e:
         print(f"Error running rosbag command: {e}")
 
-    bagContents = bag.read_messages()
-
-    listOfTopics = []
-    for topic, msg, t in bagContents:
-        if topic not in listOfTopics:
-            listOfTopics.append(topic)	
+    # Get the list of topics from the bag index, without reading the messages
+    listOfTopics = list(parse_utilities.get_bag_topic_info(bag).keys())
 
     current_path = os.getcwd()
     parent_folder = os.path.dirname(current_path)
@@ -145,6 +144,11 @@ def parse_ouster(pathForRootFolder, PathForCurrentBag, destinationPathForParsedO
             LiDAR_info_header = "LiDAR Frame ID, First Valid Packet Time, Last Packet Time, LiDAR Hashtag"
             LiDARPacket_File.write(LiDAR_info_header + "\n")
 
+        archive = None
+        pack_file = ousterO1_folder + '/' + ousterFolderName + '.pack'
+        if (to_write == 1 and scan_archive == 1):
+            archive = ScanArchiveWriter(pack_file)
+
         # OusterScanCount = sum(1 for _ in LiDAR_Scans)
         
         # Each scan has 64 packets, and each packet has 16 columns, but not all packets or columns are valid
@@ -187,12 +191,6 @@ def parse_ouster(pathForRootFolder, PathForCurrentBag, destinationPathForParsedO
             # parse_utilities.printProgress(idx, 496 - 1, prefix='Progress:', suffix='Complete', decimals=1, length=50)
             
             if (to_write == 1):
-                # NOTE: To do save franem_id, packet_time, md5_scan
-                try:
-                    os.makedirs(hash_branch)
-                except:
-                    pass
-
                 LiDARPacket_File.write(str(frame_id))
                 LiDARPacket_File.write(',')
                 LiDARPacket_File.write(str(first_packet_time))
@@ -201,22 +199,19 @@ def parse_ouster(pathForRootFolder, PathForCurrentBag, destinationPathForParsedO
                 LiDARPacket_File.write(',')
                 LiDARPacket_File.write(str(md5_scan))
                 LiDARPacket_File.write('\n')
-                ply_file = hash_branch + str(md5_scan) + '.ply'
                 num_points = np.shape(xyzirt_reshpaed)[0]
-                with open(ply_file, 'w') as f:
-                    f.write(f"""ply
-                            format ascii 1.0
-                            element vertex {num_points}
-                            property float x
-                            property float y
-                            property float z
-                            property float intensity
-                            property int ringID
-                            property int packet_time
-                            property int column_time
-                            end_header
-                            """)
-                    np.savetxt(f, xyzirt_reshpaed, fmt ="%.8f %.8f %.8f %.4f %d %d %d")
+                # Keep the property names and types of the ascii PLY files. packet_time and column_time are already float64 in xyzirt, so they are kept as double
+                ouster_points = np.rec.fromarrays(xyzirt_reshpaed.T, dtype = [("x", "f4"), ("y", "f4"), ("z", "f4"), ("intensity", "f4"), ("ringID", "i4"), ("packet_time", "f8"), ("column_time", "f8")])
+                if archive is not None:
+                    archive.add(md5_scan, ouster_points)
+                else:
+                    # NOTE: To do save franem_id, packet_time, md5_scan
+                    try:
+                        os.makedirs(hash_branch)
+                    except:
+                        pass
+                    ply_file = hash_branch + str(md5_scan) + '.ply'
+                    parse_utilities.write_ply(ply_file, ouster_points, "%.8f %.8f %.8f %.4f %d %d %d", binary = (ply_binary == 1))
                 # np.savetxt(points_file, xyzir_reshpaed, delimiter=',')
                         
             file_size = os.path.getsize(PathForCurrentBag + ".bag")
@@ -229,7 +224,7 @@ def parse_ouster(pathForRootFolder, PathForCurrentBag, destinationPathForParsedO
                     'ouster_file_size' : file_size,
                     'first_packet_time' : first_packet_time,
                     'last_packet_time' : last_packet_time,
-                    'ply_file' : hash_branch + str(md5_scan) + '.ply',
+                    'ply_file' : pack_file if archive is not None else hash_branch + str(md5_scan) + '.ply',
                     'num_points' : np.shape(xyzirt_reshpaed)[0]
                 })
 
@@ -254,6 +249,8 @@ def parse_ouster(pathForRootFolder, PathForCurrentBag, destinationPathForParsedO
         
         if (to_write == 1):
             LiDARPacket_File.close()
+        if archive is not None:
+            archive.close()
 
     # Make sure there was no mistake with no data being found
     if (len(data) > 0):
@@ -16,6 +16,8 @@ Method(s):
         - Display the first three rows of a data frame.
     - parse_pose_topics(bag, topic, subtopics, bag_file_db_id, to_db, db)
         - Parse pose data from a specific bag given a topic and subtopics. 
+    - parse_pose_bag(bag, topics, bag_file_db_id, to_db, db)
+        - Parse every pose topic of a bag in a single read of the bag, one data frame per table.
 '''
 from io import StringIO 
 from pathlib import Path
@@ -35,8 +37,10 @@ import rosbag
 import pandas as pd
 import polars as pl
 import numpy as np
+from array import array
+from operator import attrgetter
 
-from get_table_info import get_table_info
+from get_table_info import get_table_info, get_table_schema, get_topic_table
 from update_df import update_df
 
 '''
@@ -65,168 +69,174 @@ def display_df(topic, df, debug_flag = False, debug_ouster_imu_flag = False):
     if (debug_ouster_imu_flag == True):
         df.select("orientation_covariance").glimpse()
 
-''' 
-Parse pose data from a specific bag given a topic and subtopics
 '''
-def parse_pose_topics(bag, topic, subtopics, bag_file_db_id, to_db, db):
-    bag_name = bag.filename   # Store the specific bag name
-
-    # Create an empty data frame, table_name and db_col_lst so you'll have something to return regardless
-    df = pl.DataFrame()
-    table_name = ""
-    db_col_lst = []
-
-    # For debugging, choose 1 specific topic to test
-    selected_topic = "/ousterO1/imu"
-
+Get the database table of a pose topic: returns the table_name, mapping_dict and db_col_lst from get_table_info,
+or an empty table_name for the topics that are not parsed here (Sick LiDAR, Velodyne and Ouster packets)
+'''
+def get_pose_table(topic):
     # Skipping the sick_lms_5xx and velodyne/ouster packet topics
     if topic == "/sick_lms_5xx/scan":
         print("Sick LiDAR will not be parsed.\n")
+        return "", {}, []
 
     elif topic == "/velodyne_packets":
         print("Velodyne Packets not handled here.\n")
+        return "", {}, []
 
     elif topic == "/ouster_packets":
         print("Ouster Packets not handled here.\n")
+        return "", {}, []
+
+    table_name = get_topic_table(topic)   # The table and topic name do not match - look the table of the topic up
+
+    return get_table_info(table_name)   # Get information about the corresponding table
+
+'''
+One column of a table: its database name, the function that gets its value from a message and the values gathered so far.
+Numbers are kept in typed arrays (8 bytes per value) instead of python objects, other values in a list.
+'''
+class PoseColumn:
+    __slots__ = ("name", "get", "values")
+
+    def __init__(self, name, get):
+        self.name = name
+        self.get = get
+        self.values = None
+
+    def append(self, msg, t):
+        value = self.get(msg, t)
+        if self.values is None:
+            # The type of the first value decides the type of the array (bool is kept in a list, it is a subclass of int)
+            if type(value) is float:
+                self.values = array("d")
+            elif type(value) is int:
+                self.values = array("q")
+            else:
+                self.values = []
+        try:
+            self.values.append(value)
+        except (TypeError, OverflowError):
+            # A value that does not fit in the typed array (None, a different type, a very large integer)
+            self.values = list(self.values)
+            self.values.append(value)
+
+    def to_series(self):
+        if isinstance(self.values, array):
+            return pl.Series(self.name, np.frombuffer(self.values, dtype = np.float64 if self.values.typecode == "d" else np.int64))
+        return pl.Series(self.name, self.values)
+
+''' Getters of the columns that are computed from the header and the bag time '''
+def get_ros_header_time(msg, t):
+    return int(str(msg.header.stamp.secs) + str(msg.header.stamp.nsecs))
+
+def get_written_to_bag_time(msg, t):
+    return t.secs * 10**9 + t.nsecs
+
+def get_missing_field(msg, t):
+    return None
+
+'''
+Build the columns of a table once, from the first message of its topic. Each column gets its value straight from the
+message with an attrgetter of its path in the registry (e.g. "header.stamp.secs", or "orientation.x" for the ousterO1/imu
+topic), so no dictionary is created for each message.
+'''
+def compile_pose_columns(msg, field_paths):
+    columns = []
+
+    for newname, path in field_paths.items():
+        if (newname == 'ros_header_time'):
+            get = get_ros_header_time
+
+        elif (newname == 'written_to_bag_time'):
+            get = get_written_to_bag_time
 
-    # elif ("gst" in topic):
-    # elif topic == selected_topic:   # For debugging, selected_topic is chosen above
-    else:
-        # The table and topic name do not match - use the following to align the naming
-        # Handle the ousterO1/imu topic specifically
-        if (topic == "/ousterO1/imu"):
-            table_name = "oustero1_imu"
         else:
-            table_name = topic.replace("/", "")   # Get rid the of "/" in the naming
-            table_name = table_name.lower()       # Make sure the name is all lowercase
-        
-        # Handle the parse_encoder and parse_trigger topics
-        if ("parse" in table_name):
-            table_name = table_name.replace("parse", "")   # Get rid of the "parse" in the name (if there)
-
-        table_name, mapping_dict, db_col_lst = get_table_info(table_name)   # Get information about the corresponding table
-        
-        subtopic_dict = {old_name : new_name[0] for old_name, new_name in mapping_dict.items()}
-        subtopic_lst = list(subtopic_dict.values())
-
-        '''
-        subtopic_print_txt = f"\tFor {topic}, these {len(subtopic_lst)} subtopics will be parsed: {subtopic_lst}"
-        wrapped_txt = textwrap.fill(subtopic_print_txt, width = 120, subsequent_indent = "\t")
-        print(wrapped_txt)
-        '''
-
-        # The following array of data contains "rows" of dictionaries.
-        # This data array is then transformed into a polars dataframe
-        data = []
-
-        '''
-
-        # Expand the "header" subtopic into more columns
-        if "header" in subtopics:
-            subtopics.remove("header")
-            
-        header_lst = ["rosbagTimestamp", "written_to_bag_time", "ros_header_seconds", "ros_header_nanoseconds",
-                      "header", "seq", "stamp", "frame_id"]
-        
-        # There is a special scenario for the /ousterO1/imu topic
-        if (topic == '/ousterO1/imu'):
-            subtopics = ["orientation_x", "orientation_y", "orientation_covariance", 
-                         "angular_velocity_x", "angular_velocity_y", "angular_velocity_covariance",
-                         "linear_acceleration_x", "linear_acceleration_y", "linear_acceleration_covariance"]
-        '''
+            getter = attrgetter(path)
+            try:
+                getter(msg)
+                get = lambda msg, t, getter = getter: getter(msg)
+            except AttributeError:
+                # Same as getattr(msg, path, None) for a field the message doesn't have
+                get = get_missing_field
+
+        columns.append(PoseColumn(newname, get))
+
+    return columns
+
+'''
+Create the polars data frame of a table out of its columns and update it for the database
+'''
+def create_pose_df(columns, table_name, mapping_dict, db_col_lst, bag_file_db_id, to_db, db):
+    # Make sure there was no mistake of no data being found
+    if (columns is not None):
+        df = pl.DataFrame([column.to_series() for column in columns])   # Create a polars data frame out of the columns
+
+        # Only do the following if the table is in the database
+        if table_name != "":
+            df = update_df(df, table_name, mapping_dict, db_col_lst, bag_file_db_id, to_db, db)
+
+    # If there was an error, print an error statement and create a blank data frame
+    else:
+        print("\t - Error creating dataframe.")
+        df = pl.DataFrame()
+
+    return df
+
+''' 
+Parse pose data from a specific bag given a topic and subtopics
+'''
+def parse_pose_topics(bag, topic, subtopics, bag_file_db_id, to_db, db):
+    # Create an empty data frame, table_name and db_col_lst so you'll have something to return regardless
+    df = pl.DataFrame()
+
+    table_name, mapping_dict, db_col_lst = get_pose_table(topic)
+
+    if (table_name != ""):
+        field_paths = get_table_schema(table_name).field_paths
+
+        # The columns are built from the first message, then each message adds one value to every column
+        columns = None
 
         # Loop through each message
         for topic, msg, t in bag.read_messages(topics = [topic]):
-            row = {}
-
-            # The following subtopics will be handled differently
-            for oldname, newname in subtopic_dict.items():
-                if (newname == 'ros_header_time'):
-                    value = str(msg.header.stamp.secs) + str(msg.header.stamp.nsecs)
-
-                elif (newname == 'ros_header_seconds'):
-                    value = msg.header.stamp.secs
-
-                elif (newname == 'ros_header_nanoseconds'):
-                    value = msg.header.stamp.nsecs
-
-                elif (newname == 'written_to_bag_time'):
-                    value = str(t)
-                    
-                    '''
-                    elif (subtopic == 'header'):
-                        value = ""
-                    elif (subtopic == 'seq'):
-                        value = msg.header.seq
-                    elif (subtopic == 'stamp'):
-                        value = ""
-                    elif (subtopic == 'frame_id'):
-                        value = msg.header.frame_id
-                    '''
-
-                # The ousterO1/imu topic is handled uniquely - split the objects into separate x and y columns
-                elif (topic == "/ousterO1/imu"):
-                    # Handle subtopics ending in _x or _y in a certain way
-                    if ("_x" in oldname or "_y" in oldname):
-                        # Get the subtopic by itself (orientation, angular_velocity, or linear_acceleration)
-                        subtopic_shortened = oldname[:-2]
-
-                        # Get whether you are dealing with the _x or _y value
-                        x_or_y = oldname[-1:]
-
-                        # Based on the above, get the specfic attribute
-                        value = getattr(getattr(msg, subtopic_shortened), x_or_y)
-                    
-                    # Otherwise, treat it the same as any other subtopic
-                    else:
-                        value = getattr(msg, oldname, None)
-                
-                else:
-                    value = getattr(msg, oldname, None)
-                    # print(value)
-                    '''
-                    if ("PVT" in topic):
-                        if (newname == "longitude" or newname == "latitude"):
-                            value = "None"
-                    '''
-
-                # From each key, you'll get a corresponding value (as seen above). Add this as a new entry to the row dictionary.
-                row[newname] = value
-
-            data.append(row)   # Add this new row to the data array
-
-        # Make sure there was no mistake of no data being found
-        if (len(data) > 0):
-            df = pl.DataFrame(data)   # Create a polars data frame out of this data
-
-            # For debugging:
-            # Display the data frame using the helper function above
-            # display_df(topic, df, True, False)
-            # print(df.columns)
-            
-            # Only do the following if the table is in the database
-            if table_name != "":
-                df = update_df(df, table_name, mapping_dict, db_col_lst, bag_file_db_id, to_db, db)
-
-            # Display the data frame using the helper function above
-            debug_ouster_imu_flag = False
-            # display_df(topic, df, False, debug_ouster_imu_flag)
-
-            '''
-            pd_df = df.to_pandas()
-
-            csv_buffer = StringIO()
-            pd_df.to_csv(csv_buffer, index = False, header = True, sep = ",", na_rep = "null")
-            # csv_buffer = csv_buffer.replace("nan", "null")
-
-            csv_buffer.seek(0)           # Rewind the buffer to the beginning for reading
-            print(csv_buffer.read())   # For simple debugging, print the CSV string to ensure it's not empty'
-            '''
-
-        # If there was an error, print an error statement and create a blank data frame
-        else:
-            print("\t - Error creating dataframe.")
-            df = pl.DataFrame()
+            if (columns is None):
+                columns = compile_pose_columns(msg, field_paths)
+            for column in columns:
+                column.append(msg, t)
+
+        df = create_pose_df(columns, table_name, mapping_dict, db_col_lst, bag_file_db_id, to_db, db)
 
     # Return the following:
-    return df, table_name, db_col_lst
\ No newline at end of file
+    return df, table_name, db_col_lst
+
+'''
+Parse every pose topic of a bag in a single read of the bag. The columns of each topic are filled while the bag is
+read once, then one data frame is created for each table.
+Returns a dictionary of {topic : (df, table_name, db_col_lst)}, with the same values parse_pose_topics returns for each topic.
+'''
+def parse_pose_bag(bag, topics, bag_file_db_id, to_db, db):
+    results = {}
+    tables = {}
+
+    # Register the table of each topic
+    for topic in topics:
+        table_name, mapping_dict, db_col_lst = get_pose_table(topic)
+        results[topic] = (pl.DataFrame(), table_name, db_col_lst)
+
+        if (table_name != ""):
+            tables[topic] = [table_name, mapping_dict, db_col_lst, get_table_schema(table_name).field_paths, None]
+
+    # Read the bag once and add each message to the columns of its table
+    if (len(tables) > 0):
+        for topic, msg, t in bag.read_messages(topics = list(tables.keys())):
+            table = tables[topic]
+            if (table[4] is None):
+                table[4] = compile_pose_columns(msg, table[3])
+            for column in table[4]:
+                column.append(msg, t)
+
+    for topic, (table_name, mapping_dict, db_col_lst, field_paths, columns) in tables.items():
+        df = create_pose_df(columns, table_name, mapping_dict, db_col_lst, bag_file_db_id, to_db, db)
+        results[topic] = (df, table_name, db_col_lst)
+
+    return results
@@ -6,6 +6,8 @@ import time
 
 import os
 
+import numpy as np
+
 def parseBagFileNameForDateTime(file_name):
 
 	# file_name: mapping_van_2019-10-18-20-39-30_12.bag
@@ -108,6 +110,120 @@ def make_folder(path, folder):
     except FileExistsError:
         print(f"Did not create new folder as {folder} already exists.\n")
 
+'''
+Return information about every topic in a bag file from the index of the bag, without deserializing any message. The
+returned dictionary is ordered by the time each topic first appears in the bag and maps a topic name to a dictionary with:
+	msg_type       - message type, e.g. 'sensor_msgs/CompressedImage'
+	message_count  - number of messages of the topic
+	start_time     - rosbag time of the first message (rospy.Time), None if the times can't be read (see get_topic_times)
+	end_time       - rosbag time of the last message (rospy.Time), None if the times can't be read
+	subtopics      - __slots__ of the message class, the names of its fields
+The types and counts come from bag.get_type_and_topic_info(). Without the times, the topics are ordered by name.
+'''
+def get_bag_topic_info(bag):
+	topic_info = {}
+	topic_times = get_topic_times(bag)
+
+	for topic, info in bag.get_type_and_topic_info().topics.items():
+		if (info.message_count == 0):
+			continue
+
+		start_time, end_time = topic_times.get(topic, (None, None))
+		topic_info[topic] = {
+			"msg_type" : info.msg_type,
+			"message_count" : info.message_count,
+			"start_time" : start_time,
+			"end_time" : end_time,
+			"subtopics" : get_message_class(bag, topic, info.msg_type).__slots__
+		}
+
+	if (len(topic_times) == 0):
+		return dict(sorted(topic_info.items()))
+	return dict(sorted(topic_info.items(), key = lambda item: (item[1]["start_time"] is None, item[1]["start_time"], item[0])))
+
+'''
+Return the message class of a topic. The class of the message type is used when its package is installed, otherwise the
+class rosbag generates from the message definition stored in the bag, taken from the first message of the topic read
+raw (its bytes are not deserialized).
+'''
+def get_message_class(bag, topic, msg_type):
+	# Imported here so use_database.py can still be used on a computer without ROS
+	import roslib.message
+
+	msg_class = roslib.message.get_message_class(msg_type)
+	if (msg_class is None):
+		# With raw = True, each message is (datatype, data, md5sum, position, message class)
+		topic_name, raw_msg, t = next(bag.read_messages(topics = [topic], raw = True))
+		msg_class = raw_msg[4]
+
+	return msg_class
+
+'''
+Return the rosbag time of the first and last message of each topic, {topic : (start_time, end_time)}, from the index of
+the bag. rosbag has no public way to get them, so this reads its private index (bag._get_connections() and
+bag._connection_indexes), and is the only place that does. If the index can't be read, the result is empty.
+'''
+def get_topic_times(bag):
+	topic_times = {}
+	try:
+		for connection in bag._get_connections():
+			# Each index entry holds the time and position of one message of this connection
+			index_entries = bag._connection_indexes.get(connection.id, [])
+			if (len(index_entries) == 0):
+				continue
+			start_time = min(entry.time for entry in index_entries)
+			end_time = max(entry.time for entry in index_entries)
+
+			# A topic can be recorded from more than one connection
+			if connection.topic in topic_times:
+				old_start, old_end = topic_times[connection.topic]
+				start_time, end_time = min(old_start, start_time), max(old_end, end_time)
+			topic_times[connection.topic] = (start_time, end_time)
+
+	except (AttributeError, TypeError) as e:
+		print(f"\t - The times of the topics could not be read from the bag index, the topics are ordered by name: {e}")
+		return {}
+
+	return topic_times
+
+# PLY type names of the numpy types that can be written into a PLY file
+ply_type_names = {"i1" : "char", "u1" : "uchar", "i2" : "short", "u2" : "ushort",
+				  "i4" : "int", "u4" : "uint", "f4" : "float", "f8" : "double"}
+
+'''
+Write a point cloud into a PLY file. The points are a structured numpy array with one element per point, and the PLY
+properties take the names and types of its fields. With binary = True the file is binary_little_endian and the points
+are written straight from the numpy buffer, otherwise the file is ascii and the points are written with np.savetxt
+using ascii_format (e.g. "%.8f %.8f %.8f %.8f %.8f %d %d %d").
+'''
+def write_ply(ply_file, points, ascii_format, binary = True):
+	# Pack the fields and make them little endian, so the buffer matches the PLY layout
+	packed_dtype = np.dtype([(name, points.dtype.fields[name][0].newbyteorder("<")) for name in points.dtype.names])
+	if (points.dtype != packed_dtype):
+		points = points.astype(packed_dtype)
+	points = np.ascontiguousarray(points)
+
+	header_lines = ["ply"]
+	if binary:
+		header_lines.append("format binary_little_endian 1.0")
+	else:
+		header_lines.append("format ascii 1.0")
+	header_lines.append(f"element vertex {points.shape[0]}")
+	for name in points.dtype.names:
+		field_type = points.dtype.fields[name][0]
+		header_lines.append(f"property {ply_type_names[field_type.kind + str(field_type.itemsize)]} {name}")
+	header_lines.append("end_header")
+	header = "\n".join(header_lines) + "\n"
+
+	if binary:
+		with open(ply_file, "wb") as f:
+			f.write(header.encode("ascii"))
+			points.tofile(f)
+	else:
+		with open(ply_file, "w") as f:
+			f.write(header)
+			np.savetxt(f, points, fmt = ascii_format)
+
 def print_file_list(file_list):
 	# Display information about the files that will be read
 	print(f"Reading all {len(file_list)} file(s) in the current directory:")
@@ -20,9 +20,12 @@ import velodyne_decoder as vd
 
 import use_database
 import parse_utilities
+from scan_archive import ScanArchiveWriter
 
 def parse_velodyne(pathForRootFolder, PathForCurrentBag, destinationPathForParsedOutputs, hashName_Velodyne, topicName, bag, bag_file_db_id, db, to_db):
     to_write = 0
+    ply_binary = 1   # Write the scans as binary_little_endian PLY files instead of ascii
+    scan_archive = 0   # Append the scans into one <bag_name>.pack file with an md5 index instead of one PLY file per scan (see scan_archive.py)
     data = []
     df = pl.DataFrame()
 
@@ -31,7 +34,7 @@ def parse_velodyne(pathForRootFolder, PathForCurrentBag, destinationPathForParse
 
     velodyne_folder = destinationPathForParsedOutputs + '/' + hashName_Velodyne
 
-    config = vd.Config(model = vd.Model.PuckHiRes)
+    decoder = None   # Created from the first message, once timestamp_first_packet is known
     if (to_write == 1):
         try:	#else already exists
             os.makedirs(velodyne_folder)
@@ -42,6 +45,9 @@ def parse_velodyne(pathForRootFolder, PathForCurrentBag, destinationPathForParse
     cloud_arrays = []
 
     bag_name = bag.filename.rstrip(".bag").split("/")[-1]
+    archive = None
+    if (to_write == 1 and scan_archive == 1):
+        archive = ScanArchiveWriter(velodyne_folder + '/' + bag_name + '.pack')
     OutputFileName = destinationPathForParsedOutputs + '/' + bag_name + '/' + topicName.replace('/', '_slash_') + '.txt'
 
     # print(OutputFileName)
@@ -56,32 +62,27 @@ def parse_velodyne(pathForRootFolder, PathForCurrentBag, destinationPathForParse
     if (to_write == 1):
         File.write(LiDAR_info_header + "\n")
 
-    LiDAR_Bag_Time = []
-    LiDAR_Header_Time = []
+    # Decode each VelodyneScan message as it is read, so the bag time, header time and points of a scan come from the same message
     for topic, msg, bag_timestamp in bag.read_messages(topicName):
-        headerTime = msg.header.stamp.secs*10**(9) + msg.header.stamp.nsecs
-        LiDAR_Bag_Time.append(bag_timestamp.secs*10**(9) + bag_timestamp.nsecs)
-        LiDAR_Header_Time.append(headerTime)
-    for stamp, points, topic, scan_frame_id in vd.read_bag(PathForCurrentBag, config, topicName, as_pcl_structs = True):
+        if len(msg.packets) == 0:
+            continue
+
+        if decoder is None:
+            config = vd.Config(model = vd.Model.PuckHiRes)
+            config.timestamp_first_packet = (abs(msg.header.stamp.to_sec() - msg.packets[0].stamp.to_sec()) < 0.05)
+            decoder = vd.ScanDecoder(config)
+
+        stamp, points = decoder.decode_message(msg, as_pcl_structs = True)
 
         points = np.ascontiguousarray(points)
         num_points = np.shape(points)[0]
         md5_scan = hashlib.md5(points).hexdigest()
-        hash_branch = velodyne_folder + '/' + md5_scan[0:2] + '/' + md5_scan[2:4] + '/'
-        points_file = hash_branch + str(md5_scan) + '.txt'
-        ply_file =  hash_branch + str(md5_scan) + '.ply'
-        try:
-            os.makedirs(hash_branch)
-        except:
-            pass
-            # print ('this folder already exists:', hash_branch)
-
         parse_utilities.printProgress(count_of_LiDARScan, number_of_messages, prefix='Velodyne Packet Progress:', suffix='Complete', decimals=1, length=50)
 
         velodyne_sensor_time = int(stamp.device*10**(9))
         velodyne_host_time = int(stamp.host*10**(9))
-        velodyne_average_header_time = LiDAR_Header_Time[count_of_LiDARScan-1]
-        velodyne_bag_time = LiDAR_Bag_Time[count_of_LiDARScan-1]
+        velodyne_average_header_time = msg.header.stamp.secs*10**(9) + msg.header.stamp.nsecs
+        velodyne_bag_time = bag_timestamp.secs*10**(9) + bag_timestamp.nsecs
 
         if (to_write == 1):
             File.write(str(count_of_LiDARScan))
@@ -96,21 +97,17 @@ def parse_velodyne(pathForRootFolder, PathForCurrentBag, destinationPathForParse
             File.write(',')
             File.write(str(md5_scan))
             File.write('\n')
-            with open(ply_file, 'w') as f:
-                f.write(f"""ply
-                    format ascii 1.0
-                    element vertex {num_points}
-                    property float x
-                    property float y
-                    property float z
-                    property float intensity
-                    property float time
-                    property int column
-                    property int ring
-                    property int return_type
-                    end_header
-                    """)
-                np.savetxt(f, points, fmt ="%.8f %.8f %.8f %.8f %.8f %d %d %d")
+            if archive is not None:
+                archive.add(md5_scan, points)
+            else:
+                hash_branch = velodyne_folder + '/' + md5_scan[0:2] + '/' + md5_scan[2:4] + '/'
+                ply_file =  hash_branch + str(md5_scan) + '.ply'
+                try:
+                    os.makedirs(hash_branch)
+                except:
+                    pass
+                    # print ('this folder already exists:', hash_branch)
+                parse_utilities.write_ply(ply_file, points, "%.8f %.8f %.8f %.8f %.8f %d %d %d", binary = (ply_binary == 1))
 
         # np.savetxt(points_file, points, delimiter=',')
 
@@ -133,6 +130,8 @@ def parse_velodyne(pathForRootFolder, PathForCurrentBag, destinationPathForParse
 
     if (to_write == 1):    
         File.close()
+    if archive is not None:
+        archive.close()
 
     # Make sure there was no mistake with no data being found
     if (len(data) > 0):
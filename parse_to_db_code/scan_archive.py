@@ -0,0 +1,93 @@
+'''
+Packed storage for the LiDAR scans of one bag file.
+
+Instead of saving every scan into its own hash_folder/ab/cd/<md5>.ply file, the scans
+of a bag are appended into one binary pack file, <bag_name>.pack, and a small index,
+<bag_name>.index.json, is written next to it:
+
+    {
+        "dtypes": [ dtype of the scans, e.g. [["x", "<f4"], ["y", "<f4"], ...] ],
+        "scans": { md5 : [offset, length, number of points, index into dtypes] }
+    }
+
+The md5 hash of the scan stays the key, so velodyne_hash and ouster_hash in the
+database still point to the scan. Each scan starts at a multiple of 8 bytes.
+'''
+
+import os
+import json
+import numpy as np
+
+''' Get the name of the index file that belongs to a pack file '''
+def index_file_of(pack_file):
+    if pack_file.endswith(".pack"):
+        pack_file = pack_file[:-len(".pack")]
+    return pack_file + ".index.json"
+
+
+class ScanArchiveWriter:
+
+    ''' Append LiDAR scans into one pack file, the index is written when the archive is closed '''
+    def __init__(self, pack_file):
+        self.pack_file = pack_file
+        self.index_file = index_file_of(pack_file)
+        self.file = open(pack_file, "wb")
+        self.offset = 0
+        self.dtypes = []
+        self.scans = {}
+
+    ''' Append one scan (numpy structured array) under its md5 hash, a scan that is already stored is skipped '''
+    def add(self, md5_scan, points):
+        if md5_scan in self.scans:
+            return
+
+        points = np.ascontiguousarray(points, dtype = points.dtype.newbyteorder("<"))
+        dtype_descr = [list(field) for field in points.dtype.descr]
+        if dtype_descr not in self.dtypes:
+            self.dtypes.append(dtype_descr)
+
+        padding = (-self.offset) % 8
+        if padding:
+            self.file.write(b"\0" * padding)
+            self.offset += padding
+
+        points.tofile(self.file)
+        length = points.nbytes
+        self.scans[md5_scan] = [self.offset, length, int(points.shape[0]), self.dtypes.index(dtype_descr)]
+        self.offset += length
+
+    ''' Close the pack file and write the index, through a temporary file so an interrupted run never leaves half an index '''
+    def close(self):
+        self.file.close()
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({"dtypes": self.dtypes, "scans": self.scans}, f)
+        os.replace(tmp_file, self.index_file)
+
+
+class ScanArchiveReader:
+
+    ''' Read scans back from a pack file, read(md5) returns a numpy view of the memory mapped file without copying it '''
+    def __init__(self, pack_file):
+        with open(index_file_of(pack_file), "r") as f:
+            index = json.load(f)
+        self.dtypes = [np.dtype([tuple(field) for field in descr]) for descr in index["dtypes"]]
+        self.scans = index["scans"]
+        # A bag without scans leaves an empty pack file, which np.memmap can't map
+        if (os.path.getsize(pack_file) == 0):
+            self.pack = np.zeros(0, dtype = np.uint8)
+        else:
+            self.pack = np.memmap(pack_file, dtype = np.uint8, mode = "r")
+
+    def __contains__(self, md5_scan):
+        return md5_scan in self.scans
+
+    def __len__(self):
+        return len(self.scans)
+
+    def keys(self):
+        return self.scans.keys()
+
+    def read(self, md5_scan):
+        offset, length, num_points, dtype_index = self.scans[md5_scan]
+        return self.pack[offset:offset + length].view(self.dtypes[dtype_index])
@@ -0,0 +1,96 @@
+'''
+Upload the data frames of the parsed bags to the database in a background thread, so that the parsing of a bag and the
+upload of the previous one happen at the same time.
+
+The parsing side puts (table_name, df, db_col_lst) items into a bounded queue, and a commit item at the end of each bag.
+An uploader thread, with its own database connection, takes the items out of the queue: it COPYs each data frame into its
+table and commits the bag when it gets its commit item. When the queue is full, the parsing side waits for the uploader,
+so only queue_size data frames are ever waiting in memory.
+
+The data frames refer to rows that the parsing side writes on its own connection (the bag_files row of the bag, the
+base stations of the GGA tables). These rows are committed before a data frame is put into the queue, so that the
+uploader connection can see them. If an upload or the commit of a bag fails, the uploader rolls back the data of the bag
+and, for a bag that was added to bag_files by this run, deletes its bag_files row, so the bag is parsed again by the next
+run instead of being found in the database with part of its data. (The base stations stay, they are shared by the bags.)
+With replace_existing_bags, the old data of a bag is deleted on the parsing side before the upload, so a failed upload
+leaves the bag without data; parse it again.
+'''
+
+import queue
+import threading
+import time
+
+import use_database
+
+
+class UploadPipeline:
+
+    ''' Connect the uploader to the database and start the uploader thread '''
+    def __init__(self, db_url, db_name, queue_size = 4, binary_copy = True, pool_size = 1, idempotent = False):
+        self.db_name = db_name
+        self.queue = queue.Queue(maxsize = queue_size)
+        self.db = use_database.Database(1, db_url, binary_copy = binary_copy, pool_size = pool_size, idempotent = idempotent)
+        self.upload_time = 0   # Time the uploader spent uploading and committing, in seconds
+
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    ''' Queue a data frame to be uploaded into table_name. Waits while the queue is full '''
+    def put_df(self, parse_db, table_name, df, db_col_lst):
+        parse_db.conn.commit()   # The rows the data frame refers to must be visible to the uploader connection
+        self.queue.put(("df", table_name, df, db_col_lst))
+
+    '''
+    Queue the commit of the data frames of a bag. With new_bag, the bag_files row of the bag was inserted by this run and
+    is deleted if the bag can't be committed.
+    '''
+    def put_commit(self, parse_db, bag_file_db_id = None, new_bag = False):
+        parse_db.conn.commit()
+        self.queue.put(("commit", bag_file_db_id, new_bag, None))
+
+    ''' Uploader thread: upload each data frame and commit each bag, in the order they were queued '''
+    def run(self):
+        while True:
+            kind, table_name, df, db_col_lst = self.queue.get()
+
+            if (kind == "stop"):
+                self.queue.task_done()
+                break
+
+            start_time = time.time()
+            try:
+                if (kind == "df"):
+                    self.db.df_to_db(table_name, df, db_col_lst)
+                else:
+                    # For a commit item, the second and third values are the bag_file_db_id and new_bag of put_commit
+                    bag_file_db_id, new_bag = table_name, df
+                    if (self.db.check_and_commit(self.db_name) == False):
+                        self.discard_bag(bag_file_db_id, new_bag)
+
+            except Exception as e:
+                print(f"\t - Error uploading to the database: {e}")
+                self.db.conn.rollback()
+                self.db.forget_transaction()
+                if (kind == "df"):
+                    # The rollback removed the earlier tables of the bag: the commit item of the bag rolls back the rest of it
+                    self.db.transaction_failed = True
+                else:
+                    self.discard_bag(table_name, df)
+
+            self.upload_time += time.time() - start_time
+            self.queue.task_done()
+
+    ''' Delete the bag_files row of a bag that couldn't be committed, if it was added by this run '''
+    def discard_bag(self, bag_file_db_id, new_bag):
+        if (new_bag and bag_file_db_id is not None):
+            print(f"\t - The bag with id = {bag_file_db_id} is removed from bag_files, so it is parsed again by the next run")
+            self.db.delete(bag_file_db_id)
+        elif (bag_file_db_id is not None):
+            print(f"\t - The data of the bag with id = {bag_file_db_id} could not be committed, parse it again")
+
+    ''' Wait until everything in the queue is uploaded, then stop the uploader thread and disconnect it '''
+    def close(self):
+        self.queue.put(("stop", None, None, None))
+        self.thread.join()
+        print(f"Time spent uploading to the database: {round(self.upload_time, 4)} seconds")
+        self.db.disconnect()
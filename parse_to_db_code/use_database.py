@@ -28,10 +28,12 @@
     #           Query: SELECT * FROM table_name WHERE bag_file_id = val;
     #    
     #       6. def df_to_db(self, table_name, df, db_col_lst)
-    #           Quickly insert a data frame into the database. Convert the data frame into a CSV
-    #           string, then use copy_expert.
-    #           Query: COPY table_name (db_col_lst) FROM STDIN WITH CSV HEADER NULL AS 'NULL'
-    #                  cursor.copy_expert(sql = query, file = csv_buffer)
+    #           Quickly insert a data frame into the database. Stream the data frame in the binary
+    #           COPY format (see binary_copy.py), or as a CSV string when the table has a column
+    #           type that binary_copy.py does not support.
+    #           Query: COPY table_name (db_col_lst) FROM STDIN WITH (FORMAT binary)
+    #                  COPY table_name (db_col_lst) FROM STDIN WITH CSV HEADER NULL AS 'NULL'
+    #                  cursor.copy_expert(sql = query, file = stream)
     # 
     #       7. def delete(self, table_name, id)
     #           A simple method to delete a row from a table.
@@ -48,8 +50,13 @@
     ===============================================================================================
 '''
 from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+import os
 import sys
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+import psycopg2.extras
 import pandas as pd
 import polars as pl
 import numpy as np
@@ -59,15 +66,54 @@ from psycopg2 import sql
 import parse_utilities
 from get_table_info import get_table_info
 from write_csv import write_csv
+from binary_copy import BinaryCopyStream, binary_copy_supported
+
+# Polars type of each Postgres type oid of cursor.description, for reading data frames back out of the database.
+# Numeric is read as Float64 (its scale is not known from the oid), with NUMERIC_AS_FLOAT on the cursor. Other types are
+# left for polars to infer.
+PG_OID_TYPES = {16 : pl.Boolean, 20 : pl.Int64, 21 : pl.Int16, 23 : pl.Int32, 700 : pl.Float32, 701 : pl.Float64,
+                25 : pl.Utf8, 1042 : pl.Utf8, 1043 : pl.Utf8, 1082 : pl.Date, 1083 : pl.Time,
+                1114 : pl.Datetime("us"), 1184 : pl.Datetime("us", "UTC"), 1700 : pl.Float64}
+
+# psycopg2 returns numeric values as decimal.Decimal: the cursors that read data frames get them as float instead
+NUMERIC_AS_FLOAT = psycopg2.extensions.new_type(psycopg2.extensions.DECIMAL.values, "NUMERIC_AS_FLOAT",
+                                                lambda value, cursor: float(value) if value is not None else None)
 
 class Database:
     # Upon initialization of the database instance, establish a connection to the SQL 
-    # database and create a cursor.
-    def __init__(self, connect_to_db, db_url):
+    # database and create a cursor. With binary_copy, data frames are sent with binary COPY
+    # instead of CSV whenever the column types of the table allow it. With a pool_size above 1,
+    # a pool of pool_size connections uploads the data frames of a bag at the same time (see df_to_db).
+    # With idempotent, rows already in a table are skipped, so a bag can be parsed again safely (see merge_stage).
+    def __init__(self, connect_to_db, db_url, binary_copy = True, pool_size = 1, idempotent = False):
+        self.binary_copy = binary_copy
+        self.idempotent = idempotent
+        self.column_types = {}   # Postgres types of the columns of each table, read once per table
+        self.base_station_ids = {}   # Id of each base station name in base_station_messages, for this connection
+        self.ingest_rows = {}        # Rows written into each (bag_file_db_id, table) since the last commit
+        self.ingest_table_made = False
+        self.partitioned_tables = None   # Tables partitioned by bag_file_db_id (see partition_by_bag), read when first needed
+        self.bag_partitions = set()      # (table, bag_file_db_id) of the partitions known to exist
+        self.ingest_keys = {}            # Whether each table has the ingest key of add_ingest_keys (ingest_seq and its unique index)
+        self.ingest_seqs = {}            # Rows of each (bag_file_db_id, table) numbered since the last commit, for the ingest_seq column
+        self.transaction_failed = False  # A data frame of the current bag couldn't be written, so the bag must not be committed
+
+        self.pool = None
+        self.upload_executor = None
+        self.uploads = []        # (future, staging table, table, columns, bag) of each data frame uploaded by the pool since the last commit
+        self.stage_count = 0
+        self.stream_count = 0
+
         if (connect_to_db == 1):
             try:
                 self.conn = psycopg2.connect(db_url)
                 self.cursor = self.conn.cursor()
+
+                if (pool_size > 1):
+                    self.pool = psycopg2.pool.ThreadedConnectionPool(1, pool_size, db_url)
+                    self.upload_executor = ThreadPoolExecutor(max_workers = pool_size)
+                    self.drop_orphaned_stages()
+
                 print("PostgreSQL connection is open.")
                 
             except psycopg2.Error as e:
@@ -102,11 +148,13 @@ class Database:
             cursor = self.cursor
             conn = self.conn
             
+            # The partitions of the tables partitioned by bag are not listed, only the tables themselves
             schema = "public"
             query = sql.SQL("""
                 SELECT table_name
                 FROM information_schema.tables
                 WHERE table_schema = %s
+                AND table_name NOT IN (SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid)
             """)
             
             cursor.execute(query, (schema,))
@@ -179,6 +227,21 @@ class Database:
             print(f"\t - Unable to insert into the database: {e}")
             conn.rollback()
             
+    ''' Get the names of all the bag files in the bag_files table, to skip the bags that are already in the database '''
+    def get_bag_names(self):
+        try:
+            cursor = self.cursor
+            conn = self.conn
+
+            cursor.execute("""SELECT bag_file_name FROM bag_files;""")
+
+            return set(row[0] for row in cursor.fetchall())
+
+        except psycopg2.Error as e:
+            print(f"\t - Unable to read the bag files from the database: {e}")
+            conn.rollback()
+            return set()
+
     def check_bag_id(self, id):
         try:
             cursor = self.cursor
@@ -222,44 +285,339 @@ class Database:
         except psycopg2.Error as e:
             print(f"\t - Unable to fetch or insert base station id: {e}")
             conn.rollback()
-            
+
     '''
-    Quickly insert a data frame into the database by converting the data frame into a CSV string, then using copy_expert.
-    Query: COPY table_name (db_col_lst) FROM STDIN WITH CSV HEADER NULL AS 'NULL'
-           cursor.copy_expert(sql = query, file = csv_buffer)
+    Get the ids of a list of base station names, inserting the names that aren't in base_station_messages yet. The ids
+    are cached, and the names that aren't cached are looked up in one query, then the ones not found are inserted in one
+    query (base_station_name has no unique constraint, so this is the same lookup as get_base_station_id, for a list):
+    Query: SELECT base_station_name, min(id) FROM base_station_messages WHERE base_station_name = ANY(names) GROUP BY base_station_name;
+           INSERT INTO base_station_messages (base_station_name) SELECT unnest(new_names) RETURNING base_station_name, id;
+    '''
+    def get_base_station_ids(self, base_station_names):
+        cursor = self.cursor
+        missing_names = list(dict.fromkeys(name for name in base_station_names if name not in self.base_station_ids))
+
+        if (len(missing_names) > 0):
+            try:
+                cursor.execute("""SELECT base_station_name, min(id) FROM base_station_messages WHERE base_station_name = ANY(%s::text[])
+                                  GROUP BY base_station_name;""", (missing_names,))
+                self.base_station_ids.update(cursor.fetchall())
+
+                new_names = [name for name in missing_names if name not in self.base_station_ids]
+                if (len(new_names) > 0):
+                    cursor.execute("""INSERT INTO base_station_messages (base_station_name) SELECT unnest(%s::text[])
+                                      RETURNING base_station_name, id;""", (new_names,))
+                    self.base_station_ids.update(cursor.fetchall())
+
+            except psycopg2.Error as e:
+                print(f"\t - Unable to get the ids of the base stations: {e}")
+                self.conn.rollback()
+                self.forget_transaction()
+                # The rollback also removed the other data frames of the bag: check_and_commit rolls back the rest of it
+                self.transaction_failed = True
+                raise
+
+        return {name : self.base_station_ids[name] for name in base_station_names}
+
+    '''
+    Get the Postgres type (udt_name, e.g. int4, float8, text) of each of the given columns of a table. The types
+    of a table are only read from information_schema once.
+    '''
+    def get_column_types(self, table_name, db_col_lst):
+        if table_name not in self.column_types:
+            self.cursor.execute("SELECT column_name, udt_name FROM information_schema.columns WHERE table_schema = 'public' AND table_name = %s",
+                                (table_name,))
+            self.column_types[table_name] = dict(self.cursor.fetchall())
+
+        types = self.column_types[table_name]
+        return [types.get(col) for col in db_col_lst]
+
+    '''
+    Quickly insert a data frame into the database. The data frame is encoded from its columns into the binary COPY
+    format in chunks while it is sent (see binary_copy.py). If the table has a column type that binary_copy.py doesn't
+    support, the data frame is sent as a CSV string instead.
+    Query: COPY table_name (db_col_lst) FROM STDIN WITH (FORMAT binary)
+           cursor.copy_expert(sql = query, file = BinaryCopyStream(df, pg_types))
+
+    With a connection pool, the data frame is uploaded in the background by one of the pool connections into its own
+    staging table, and df_to_db returns right away. This is staging only: check_and_commit waits for the uploads, then
+    copies the rows of each staging table into its table one after the other on the main connection, within the
+    transaction of the bag, so the bag is still committed (or rolled back) as a whole. Every row is written twice and the
+    writes into the tables are not concurrent; what runs at the same time is the encoding and COPY of the data frames,
+    while the parsing goes on. The staging tables have no foreign keys, so they can be filled before the bag_files row of
+    the bag is committed. They are committed by the pool connections, so a process that stops before check_and_commit
+    leaves them behind; drop_orphaned_stages removes them the next time a pool is made.
+
+    In a table with an ingest key (see add_ingest_keys), each row gets its ingest_seq: its position among the rows of its
+    bag in the table. With idempotent, a data frame is always COPYed into a staging table first (a temporary table of
+    this connection when there is no pool), then merged into its table without the rows whose (bag_file_db_id,
+    ingest_seq) is already there (see merge_stage). A table without an ingest key can't be written with idempotent.
     '''
     def df_to_db(self, table_name, df, db_col_lst):
         try:
             cursor = self.cursor
             conn = self.conn
 
-            # Convert the data frame into a Pandas data frame and then into a CSV string to work with copy_expert
-            pd_df = df.to_pandas()
+            # A table partitioned by bag needs the partition of the bag before rows of the bag can be written into it
+            if (table_name in self.get_partitioned_tables()):
+                self.make_bag_partition(table_name, get_df_bag_id(df))
 
-            csv_buffer = StringIO()
-            pd_df.to_csv(csv_buffer, index = False, header = True, sep = ",", na_rep = 'null')
-            csv_buffer.seek(0)           # Rewind the buffer to the beginning for reading
-            # print(csv_buffer.read())   # For simple debugging, print the CSV string to ensure it's not empty
+            if (self.get_ingest_key(table_name)):
+                df, db_col_lst = self.add_ingest_seq(table_name, df, db_col_lst)
+
+            elif (self.idempotent):
+                print(f"\t - '{table_name}' has no ingest key, run the ingest key migration (add_ingest_keys) before an idempotent ingest")
+                self.transaction_failed = True
+                return False
+
+            pg_types = self.get_column_types(table_name, db_col_lst) if self.binary_copy else []
+
+            if (self.pool is not None):
+                stage_name = self.new_stage_name(table_name)
+                future = self.upload_executor.submit(self.stage_df, stage_name, table_name, df, db_col_lst, pg_types)
+                self.uploads.append((future, stage_name, table_name, db_col_lst, get_df_bag_id(df)))
+
+            elif (self.idempotent):
+                stage_name = self.new_stage_name(table_name)
+                cursor.execute(sql.SQL("CREATE TEMPORARY TABLE {} AS SELECT {} FROM {} WITH NO DATA").format(
+                    sql.Identifier(stage_name),
+                    sql.SQL(', ').join(map(sql.Identifier, db_col_lst)),
+                    sql.Identifier(table_name)
+                ))
+                self.copy_df(cursor, stage_name, df, db_col_lst, pg_types)
+                rows = self.merge_stage(stage_name, table_name, db_col_lst)
+                self.count_ingest(table_name, get_df_bag_id(df), rows)
+
+            else:
+                self.copy_df(cursor, table_name, df, db_col_lst, pg_types)
+                self.count_ingest(table_name, get_df_bag_id(df), df.height)
+
+            return True
+
+        # Not only psycopg2 errors: with binary COPY, a bad value fails while it is cast and encoded (see binary_copy.py)
+        except Exception as e:
+            print(f"\t - Unable to write the data frame into the database: {e}")
+            conn.rollback()
+            self.forget_transaction()
+            # The rollback also removed the other data frames of the bag: check_and_commit rolls back the rest of it
+            self.transaction_failed = True
+            return False
+
+    '''
+    Add the ingest_seq column to a data frame: the rows of a bag in a table are numbered from 0 in the order they are
+    written, carrying on from the earlier data frames of the same bag and table in the transaction.
+    '''
+    def add_ingest_seq(self, table_name, df, db_col_lst):
+        key = (get_df_bag_id(df), table_name)
+        start = self.ingest_seqs.get(key, 0)
+        self.ingest_seqs[key] = start + df.height
+
+        df = df.with_columns(pl.int_range(start, start + df.height, dtype = pl.Int64).alias("ingest_seq"))
+        return df, db_col_lst + ["ingest_seq"]
+
+    ''' Name of a new staging table. The table name is last, so a name cut at 63 characters by Postgres is still unique '''
+    def new_stage_name(self, table_name):
+        self.stage_count += 1
+        return f"stage_{os.getpid()}_{self.stage_count}_{table_name}"
+
+    '''
+    Forget what was cached about the current transaction after it is rolled back: the base stations, partitions and
+    indexes it created and the rows it wrote are gone.
+    '''
+    def forget_transaction(self):
+        self.base_station_ids.clear()
+        self.ingest_rows = {}
+        self.ingest_table_made = False
+        self.bag_partitions.clear()
+        self.ingest_seqs = {}
+        self.transaction_failed = False
+
+    '''
+    COPY a data frame into a table with the given cursor, with binary COPY if the column types (pg_types) allow it and
+    as a CSV string otherwise.
+    '''
+    def copy_df(self, cursor, table_name, df, db_col_lst, pg_types):
+        if (binary_copy_supported(pg_types) and len(df.columns) == len(db_col_lst)):
+            # Binary COPY matches the fields to the columns by position, so put the columns in the order of db_col_lst
+            if all(col in df.columns for col in db_col_lst):
+                df = df.select(db_col_lst)
 
             # Build the query
-            query = sql.SQL("COPY {} ({}) FROM STDIN WITH CSV HEADER NULL AS 'null'").format(
+            query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT binary)").format(
                 sql.Identifier(table_name),
                 sql.SQL(', ').join(map(sql.Identifier, db_col_lst))
             )
 
-            # Use copy_expert to transport the data into the database
-            cursor.copy_expert(sql = query, file = csv_buffer)
+            # The rows are encoded chunk by chunk as copy_expert reads the stream
+            cursor.copy_expert(sql = query, file = BinaryCopyStream(df, pg_types), size = 1 << 20)
             # print(f"\t + The data frame has successfully been inserted into {table_name}.")
 
-        except psycopg2.Error as e:
-            print(f"\t - Unable to write the data frame into the database: {e}")
+        else:
+            self.df_to_db_csv(cursor, table_name, df, db_col_lst)
+
+    '''
+    Insert a data frame into the database by converting the data frame into a CSV string, then using copy_expert.
+    Used by df_to_db when binary COPY can't be used.
+    Query: COPY table_name (db_col_lst) FROM STDIN WITH CSV HEADER NULL AS 'NULL'
+           cursor.copy_expert(sql = query, file = csv_buffer)
+    '''
+    def df_to_db_csv(self, cursor, table_name, df, db_col_lst):
+        # Convert the data frame into a Pandas data frame and then into a CSV string to work with copy_expert
+        pd_df = df.to_pandas()
+
+        csv_buffer = StringIO()
+        pd_df.to_csv(csv_buffer, index = False, header = True, sep = ",", na_rep = 'null')
+        csv_buffer.seek(0)           # Rewind the buffer to the beginning for reading
+        # print(csv_buffer.read())   # For simple debugging, print the CSV string to ensure it's not empty
+
+        # Build the query
+        query = sql.SQL("COPY {} ({}) FROM STDIN WITH CSV HEADER NULL AS 'null'").format(
+            sql.Identifier(table_name),
+            sql.SQL(', ').join(map(sql.Identifier, db_col_lst))
+        )
+
+        # Use copy_expert to transport the data into the database
+        cursor.copy_expert(sql = query, file = csv_buffer)
+
+    '''
+    Run by a thread of the upload pool: create an unlogged staging table with the columns of the table, COPY the data
+    frame into it and commit, so the main connection can read it.
+    Query: CREATE UNLOGGED TABLE stage_name AS SELECT db_col_lst FROM table_name WITH NO DATA
+    '''
+    def stage_df(self, stage_name, table_name, df, db_col_lst, pg_types):
+        conn = self.pool.getconn()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql.SQL("CREATE UNLOGGED TABLE {} AS SELECT {} FROM {} WITH NO DATA").format(
+                sql.Identifier(stage_name),
+                sql.SQL(', ').join(map(sql.Identifier, db_col_lst)),
+                sql.Identifier(table_name)
+            ))
+            self.copy_df(cursor, stage_name, df, db_col_lst, pg_types)
+            conn.commit()
+
+        except Exception:
             conn.rollback()
+            raise
 
-    def db_to_df (self, bag_id, table):
+        finally:
+            self.pool.putconn(conn)
+
+    '''
+    Drop the staging tables left behind by a process that stopped before committing its bag. The name of a staging table
+    starts with the id of the process that made it (see new_stage_name), so the tables of the processes that are still
+    running (e.g. the other -j workers) are kept. This assumes the bags are parsed on one machine.
+    Query: SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename LIKE 'stage\_%'
+    '''
+    def drop_orphaned_stages(self):
         try:
             cursor = self.cursor
             conn = self.conn
-            
+
+            cursor.execute("""SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename LIKE 'stage\\_%';""")
+
+            dropped = 0
+            for (stage_name,) in cursor.fetchall():
+                pid = stage_name.split("_")[1]
+                if (pid.isdigit() and process_is_running(int(pid))):
+                    continue
+                cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(stage_name)))
+                dropped += 1
+
+            conn.commit()
+            if (dropped > 0):
+                print(f"Dropped {dropped} staging table(s) left by a previous run.")
+
+        except psycopg2.Error as e:
+            print(f"\t - Unable to drop the staging tables of a previous run: {e}")
+            conn.rollback()
+
+    '''
+    Wait for the uploads of the pool, then move the rows of each staging table into its table and drop the staging table,
+    in the transaction of the main connection. Returns False if an upload failed.
+    Query: INSERT INTO table_name (db_col_lst) SELECT db_col_lst FROM stage_name; DROP TABLE stage_name;
+    '''
+    def merge_staged_dfs(self):
+        cursor = self.cursor
+        uploaded = True
+
+        for future, stage_name, table_name, db_col_lst, bag_file_db_id in self.uploads:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"\t - Unable to upload the data frame of {table_name}: {e}")
+                uploaded = False
+
+        if (uploaded == False):
+            return False
+
+        for future, stage_name, table_name, db_col_lst, bag_file_db_id in self.uploads:
+            rows = self.merge_stage(stage_name, table_name, db_col_lst)
+            self.count_ingest(table_name, bag_file_db_id, rows)
+
+        return True
+
+    '''
+    Move the rows of a staging table into its table and drop the staging table. Returns the number of rows inserted.
+    With idempotent, the rows whose ingest key (see add_ingest_keys) is already in the table are skipped, so merging the
+    data of a bag a second time inserts nothing:
+    Query: INSERT INTO table_name (db_col_lst) SELECT db_col_lst FROM stage_name ON CONFLICT (bag_file_db_id, ingest_seq) DO NOTHING;
+           DROP TABLE stage_name;
+    '''
+    def merge_stage(self, stage_name, table_name, db_col_lst):
+        cursor = self.cursor
+        columns = sql.SQL(', ').join(map(sql.Identifier, db_col_lst))
+        query = sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {} s").format(
+            sql.Identifier(table_name), columns, columns, sql.Identifier(stage_name)
+        )
+
+        if (self.idempotent and self.get_ingest_key(table_name)):
+            query = query + sql.SQL(" ON CONFLICT (bag_file_db_id, ingest_seq) DO NOTHING")
+
+        cursor.execute(query)
+        rows = cursor.rowcount
+        cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(stage_name)))
+
+        return rows
+
+    '''
+    Check whether a table has the ingest key made by add_ingest_keys. Only read from the database, the key is never made
+    during an ingest.
+    '''
+    def get_ingest_key(self, table_name):
+        if table_name not in self.ingest_keys:
+            self.cursor.execute("""SELECT 1 FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s AND indexname = %s;""",
+                                (table_name, f"{table_name}_ingest_key"))
+            self.ingest_keys[table_name] = (self.cursor.fetchone() is not None)
+
+        return self.ingest_keys[table_name]
+
+    '''
+    Drop the staging tables that are left after a failed commit (after a successful commit they are already dropped).
+    '''
+    def drop_staged_dfs(self):
+        if (len(self.uploads) == 0):
+            return
+
+        conn = self.pool.getconn()
+        try:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            for future, stage_name, table_name, db_col_lst, bag_file_db_id in self.uploads:
+                future.exception()   # Wait for the upload to end
+                cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(stage_name)))
+            cursor.close()
+
+        except psycopg2.Error as e:
+            print(f"\t - Unable to drop the staging tables: {e}")
+
+        finally:
+            conn.autocommit = False
+            self.pool.putconn(conn)
+            self.uploads = []
+
+    def db_to_df (self, bag_id, table):
+        try:
             # For each topic, create a data frame based off of the bag_file id - will create a data frame of all the data from 
             # the same bag file id
             # table_name, mapping_dict, db_col_lst = get_table_info(table)
@@ -268,11 +626,9 @@ class Database:
                 sql.Identifier(table)
             )
 
-            cursor.execute(query, (bag_id,))
-            
-            df = pd.DataFrame(cursor.fetchall(), columns = [col[0] for col in cursor.description])
+            df = self.read_query_df(query, (bag_id,))
             
-            if (df.empty):
+            if (df.is_empty()):
                 print("Error creating data frame.\n")
                 return None
             
@@ -285,7 +641,7 @@ class Database:
 
         except psycopg2.Error as e:
             print(f"\nError creating dataframe: {e}")
-            conn.rollback()
+            self.conn.rollback()
 
     '''
     Used for reading from the database. Select multiple rows from a table where the bag file has a certain name.
@@ -294,26 +650,15 @@ class Database:
     '''
     def select_multiple(self, table_name, col, val):
         try:
-            cursor = self.cursor
             conn = self.conn
 
-            # Build and execute query
+            # Build the query
             select_query = sql.SQL("SELECT * FROM {} WHERE {} = %s").format(
                 sql.Identifier(table_name),
                 sql.Identifier(col)
             )
             
-            cursor.execute(select_query, (val,))
-
-            # Create rows of data out of the selected items
-            rows = cursor.fetchall()
-
-            # Create a list of columns using the cursor.description
-            columns = [header[0] for header in cursor.description]
-
-            # Create a Pandas data frame out of the above. Then transform it into a Polars data frame
-            pd_df = pd.DataFrame(rows, columns = columns)
-            df = pl.from_pandas(pd_df)
+            df = self.read_query_df(select_query, (val,))
 
         except psycopg2.Error as e:
             df = pl.DataFrame()
@@ -321,50 +666,304 @@ class Database:
             conn.rollback()
 
         return df   # Return the data frame
+
+    '''
+    Read the result of a query into one polars data frame: the chunks of stream_query are concatenated, so only the
+    rows of one chunk are held as python rows at a time, next to the data frame. Use stream_query directly to go
+    through a large result without holding all of it.
+    '''
+    def read_query_df(self, query, params = None, chunk_rows = 100000):
+        dfs = list(self.stream_query(query, params, chunk_rows))
+
+        if (len(dfs) == 0):
+            # No rows: get the columns of the query without reading any row
+            cursor = self.cursor
+            cursor.execute(sql.SQL("SELECT * FROM ({}) AS q LIMIT 0").format(sql.SQL(cursor.mogrify(query, params).decode())))
+            return pl.DataFrame(schema = [(col.name, PG_OID_TYPES.get(col.type_code, pl.Utf8)) for col in cursor.description])
+
+        return pl.concat(dfs, how = "vertical_relaxed", rechunk = True)
+
+    '''
+    Read the result of a query as polars data frames of at most chunk_rows rows, with a named (server-side) cursor,
+    so that only one chunk is in memory at a time. For example:
+        for df in db.stream_query(sql.SQL("SELECT * FROM {} WHERE bag_file_db_id = %s").format(sql.Identifier(table)), (bag_id,)):
+            ...
+    Use read_query_df to get the whole result as one data frame instead.
+    '''
+    def stream_query(self, query, params = None, chunk_rows = 100000):
+        self.stream_count += 1
+        cursor = self.conn.cursor(name = f"stream_{os.getpid()}_{self.stream_count}")
+        psycopg2.extensions.register_type(NUMERIC_AS_FLOAT, cursor)
+        try:
+            cursor.itersize = chunk_rows
+            cursor.execute(query, params)
+
+            schema = None
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+
+                # The description of a named cursor is known once rows have been fetched
+                if (schema is None and cursor.description is not None):
+                    schema = [(col.name, PG_OID_TYPES.get(col.type_code)) for col in cursor.description]
+
+                if (len(rows) == 0):
+                    break
+
+                yield pl.DataFrame(rows, schema = schema, orient = "row")
+
+        finally:
+            cursor.close()
+
+    '''
+    Get the rows of each table whose time (ros_header_time or written_to_bag_time, in nanoseconds) is between t_start_ns
+    and t_end_ns, across all bags. With the time indexes of add_time_indexes, only the blocks of the tables in that time
+    range are read. Returns a dictionary of table : polars data frame sorted by time.
+
+    With asof, the data frames are joined into one instead: each row of the first table gets the latest row of each
+    other table at or before its time (polars join_asof). The columns of the other tables are prefixed with the table name.
+    Query: SELECT * FROM table WHERE time_column BETWEEN t_start_ns AND t_end_ns ORDER BY time_column
+    '''
+    def query_time_range(self, tables, t_start_ns, t_end_ns, time_column = "ros_header_time", asof = False):
+        dfs = {}
+        try:
+            for table in tables:
+                if (self.get_column_types(table, [time_column])[0] is None):
+                    print(f"\t - '{table}' has no '{time_column}' column, it is skipped.")
+                    continue
+
+                query = sql.SQL("SELECT * FROM {} WHERE {} BETWEEN %s AND %s ORDER BY {}").format(
+                    sql.Identifier(table), sql.Identifier(time_column), sql.Identifier(time_column)
+                )
+                dfs[table] = self.read_query_df(query, (int(t_start_ns), int(t_end_ns)))
+
+        except psycopg2.Error as e:
+            print(f"\t - Unable to select the time range from the database: {e}")
+            self.conn.rollback()
+
+        if (asof == False or len(dfs) == 0):
+            return dfs
+
+        # Join the other tables onto the first one by time
+        table_names = list(dfs.keys())
+        df = dfs[table_names[0]].with_columns(pl.col(time_column).cast(pl.Int64))
+        for table in table_names[1:]:
+            other_df = dfs[table].with_columns(pl.col(time_column).cast(pl.Int64))
+            other_df = other_df.rename({col : f"{table}.{col}" for col in other_df.columns if col != time_column})
+            df = df.join_asof(other_df, on = time_column, strategy = "backward")
+
+        return df
+
+    '''
+    Schema migration: add an index on the time columns (ros_header_time and written_to_bag_time) of every table that has
+    them, for query_time_range. BRIN indexes are used by default: the rows are written in time order, so a BRIN index
+    (the range of times of each block of the table) is tiny and enough to find the blocks of a time range. Use
+    index_type = "btree" for exact row lookups instead. On a table partitioned by bag, the index is made on every partition.
+    Query: CREATE INDEX IF NOT EXISTS table_column_brin ON table USING brin (column)
+    '''
+    def add_time_indexes(self, tables = None, index_type = "brin"):
+        try:
+            cursor = self.cursor
+            conn = self.conn
+
+            if (tables is None):
+                tables = self.get_tables(0)
+
+            for table in tables:
+                for time_column in ["ros_header_time", "written_to_bag_time"]:
+                    if (self.get_column_types(table, [time_column])[0] is None):
+                        continue
+
+                    cursor.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} USING {} ({})").format(
+                        sql.Identifier(f"{table}_{time_column}_{index_type}"),
+                        sql.Identifier(table),
+                        sql.SQL(index_type),
+                        sql.Identifier(time_column)
+                    ))
+                    print(f"\t + {index_type} index on '{table}' ({time_column})")
+
+            conn.commit()
+
+        except psycopg2.Error as e:
+            print(f"\t - Unable to add the time indexes: {e}")
+            conn.rollback()
+
+    '''
+    Schema migration: add the ingest key to every table with a bag_file_db_id column, for the idempotent ingest. The key
+    is (bag_file_db_id, ingest_seq), where ingest_seq is the position of the row among the rows of its bag in the table,
+    so two messages of a bag with the same time are still different rows. The rows already in a table are numbered in
+    the order they were inserted (by id), after the rows of their bag that are already numbered. Each table is committed
+    on its own; run this while nothing is being written into the tables.
+    Query: ALTER TABLE table ADD COLUMN IF NOT EXISTS ingest_seq bigint;
+           UPDATE table SET ingest_seq = ... WHERE ingest_seq IS NULL;
+           CREATE UNIQUE INDEX IF NOT EXISTS table_ingest_key ON table (bag_file_db_id, ingest_seq)
+    '''
+    def add_ingest_keys(self, tables = None):
+        cursor = self.cursor
+        conn = self.conn
+
+        if (tables is None):
+            tables = self.get_tables(0)
+
+        for table in tables:
+            try:
+                if (self.get_column_types(table, ["bag_file_db_id"])[0] is None):
+                    continue
+
+                cursor.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS ingest_seq bigint").format(sql.Identifier(table)))
+                cursor.execute(sql.SQL("""
+                    UPDATE {table} t SET ingest_seq = s.ingest_seq
+                    FROM (SELECT n.id, COALESCE(m.max_seq + 1, 0) + row_number() OVER (PARTITION BY n.bag_file_db_id ORDER BY n.id) - 1 AS ingest_seq
+                          FROM {table} n
+                          LEFT JOIN (SELECT bag_file_db_id, max(ingest_seq) AS max_seq FROM {table} GROUP BY bag_file_db_id) m
+                          ON m.bag_file_db_id = n.bag_file_db_id
+                          WHERE n.ingest_seq IS NULL) s
+                    WHERE t.id = s.id
+                """).format(table = sql.Identifier(table)))
+                numbered = cursor.rowcount
+
+                cursor.execute(sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} (bag_file_db_id, ingest_seq)").format(
+                    sql.Identifier(f"{table}_ingest_key"),
+                    sql.Identifier(table)
+                ))
+                conn.commit()
+                print(f"\t + Ingest key on '{table}' ({numbered} rows numbered)")
+
+            except psycopg2.Error as e:
+                print(f"\t - Unable to add the ingest key to '{table}': {e}")
+                conn.rollback()
+
+        # The tables have a new column and index
+        self.column_types.clear()
+        self.ingest_keys.clear()
+
+    '''
+    Stream the rows of one bag file in a table as polars data frames of at most chunk_rows rows (see stream_query).
+    '''
+    def stream_bag_table(self, bag_id, table, chunk_rows = 100000):
+        query = sql.SQL("""SELECT * FROM {} WHERE bag_file_db_id = %s""").format(
+            sql.Identifier(table)
+        )
+        return self.stream_query(query, (bag_id,), chunk_rows)
     
-    def check_and_commit(self, db_name):
+    '''
+    Commit the data of a bag as a whole. Returns False (and rolls back) if any part of the bag couldn't be written.
+    '''
+    def check_and_commit(self, db_name, approximate_totals = True):
         try:
             cursor = self.cursor
             conn = self.conn
 
-            db_size_bytes, db_size_mb = self.get_db_size(db_name)
-            print(f"The database is currently {db_size_bytes} bytes ({db_size_mb} MB).")
-            tables = self.get_tables(1)
-            print("-" * 150)
+            # A data frame of this bag failed and was rolled back, so don't commit the rest of the bag without it
+            if (self.transaction_failed):
+                print("\t - Error commiting: a data frame of the bag failed, the bag is rolled back")
+                conn.rollback()
+                self.forget_transaction()
+                return False
+
+            # With a pool, wait for the uploads of this bag and move them into their tables before committing
+            if (self.merge_staged_dfs() == False):
+                print("\t - Error commiting: an upload failed, the bag is rolled back")
+                conn.rollback()
+                self.forget_transaction()
+                return False
+
+            # Save the rows written for each bag and table in the same transaction as the rows themselves
+            self.save_ingest_statistics()
 
             conn.commit()
+            self.uploads = []   # The staging tables were dropped in the committed transaction
+
+            # Report what was written, without counting the rows of the tables
+            self.report_ingest_statistics(approximate_totals)
+            self.ingest_rows = {}
+            self.ingest_seqs = {}
+            print("-" * 150)
+            return True
 
         except psycopg2.Error as e:
             print(f"\t - Error commiting: {e}")
             conn.rollback()
+            self.forget_transaction()
+            return False
+
+        finally:
+            self.drop_staged_dfs()
 
     '''
-    Method to delete a row from a table.
-    Query: DELETE FROM table_name WHERE id = id;
+    Count the rows of a bag written into a table, for the ingest statistics.
+    '''
+    def count_ingest(self, table_name, bag_file_db_id, rows):
+        key = (bag_file_db_id, table_name)
+        self.ingest_rows[key] = self.ingest_rows.get(key, 0) + rows
+
+    '''
+    Add the rows written since the last commit to the ingest_statistics table, which keeps the number of rows of each bag
+    in each table (created the first time it is needed).
+    Query: INSERT INTO ingest_statistics (bag_file_db_id, table_name, row_count) VALUES ...
+           ON CONFLICT (bag_file_db_id, table_name) DO UPDATE SET row_count = ingest_statistics.row_count + EXCLUDED.row_count
+    '''
+    def save_ingest_statistics(self):
+        cursor = self.cursor
+        rows = [(bag_file_db_id, table_name, row_count) for (bag_file_db_id, table_name), row_count in self.ingest_rows.items()
+                if bag_file_db_id is not None]
+
+        if (len(rows) == 0):
+            return
+
+        if (self.ingest_table_made == False):
+            cursor.execute("""CREATE TABLE IF NOT EXISTS ingest_statistics (
+                                bag_file_db_id INTEGER NOT NULL,
+                                table_name TEXT NOT NULL,
+                                row_count BIGINT NOT NULL,
+                                last_ingested TIMESTAMPTZ NOT NULL DEFAULT now(),
+                                PRIMARY KEY (bag_file_db_id, table_name))""")
+            self.ingest_table_made = True
+
+        psycopg2.extras.execute_values(cursor, """INSERT INTO ingest_statistics (bag_file_db_id, table_name, row_count) VALUES %s
+                                                  ON CONFLICT (bag_file_db_id, table_name) DO UPDATE
+                                                  SET row_count = ingest_statistics.row_count + EXCLUDED.row_count, last_ingested = now()""", rows)
+
+    '''
+    Print the rows written into each table since the last commit. With approximate_totals, also print the number of rows
+    of each table estimated by Postgres (pg_class.reltuples, kept up to date by VACUUM and ANALYZE), which is read in one
+    query instead of a COUNT(*) of every table.
+    '''
+    def report_ingest_statistics(self, approximate_totals = True):
+        cursor = self.cursor
+
+        table_rows = {}
+        for (bag_file_db_id, table_name), row_count in self.ingest_rows.items():
+            table_rows[table_name] = table_rows.get(table_name, 0) + row_count
+
+        totals = {}
+        if (approximate_totals and len(table_rows) > 0):
+            try:
+                cursor.execute("SELECT relname, reltuples::bigint FROM pg_class WHERE relkind IN ('r', 'p') AND relname = ANY(%s)",
+                               (list(table_rows.keys()),))
+                totals = dict(cursor.fetchall())
+                self.conn.commit()   # End the read-only transaction
+
+            except psycopg2.Error as e:
+                print(f"\t - Unable to read the table estimates: {e}")
+                self.conn.rollback()
+
+        print(f"Rows written into {len(table_rows)} table(s):")
+        for table_name, row_count in table_rows.items():
+            total = totals.get(table_name)
+            total_string = f" (about {total} rows in the table)" if (total is not None and total >= 0) else ""
+            print(f"\t'{table_name}': {row_count}{total_string}")
+
+    '''
+    Method to delete a bag file and all of its data. In the tables partitioned by bag, the partition of the bag is dropped
+    instead of deleting its rows (see delete_bag_rows).
+    Query: DELETE FROM table_name WHERE bag_file_db_id = id; DELETE FROM bag_files WHERE id = id;
     '''
     def delete(self, id):
         try:
             cursor = self.cursor
             conn = self.conn
 
-            tables = self.get_tables(0)
-            
-            for table in tables:
-                column_check_query = """
-                    SELECT column_name
-                    FROM information_schema.columns
-                    WHERE table_name = %s AND column_name = %s
-                """
-                cursor.execute(column_check_query, (table, "bag_file_db_id"))
-                result = cursor.fetchone()
-
-                if result:
-                    delete_query = sql.SQL("DELETE FROM {} WHERE bag_file_db_id = %s").format(
-                        sql.Identifier(table)
-                    )
-                    
-                    cursor.execute(delete_query, (id,))
-                    # print(f"\t\tDeleting rows from '{table}' where bag file id = {id}")
+            self.delete_bag_rows(id)
                 
             cursor.execute("""DELETE FROM bag_files WHERE id = %s""", (id,))
             
@@ -374,6 +973,168 @@ class Database:
         except psycopg2.Error as e:
             print(f"\t - Unable to delete from the database: {e}")
             conn.rollback()
+            self.forget_transaction()
+
+    '''
+    Delete the data of a bag from every table with a bag_file_db_id column, but keep its bag_files row, without committing.
+    Used by delete and to parse a bag again. The partition of the bag is dropped in the tables partitioned by bag, which
+    takes the same time however large the table is and leaves no dead rows to vacuum.
+    Query: DROP TABLE IF EXISTS table_name_bag_id;   or   DELETE FROM table_name WHERE bag_file_db_id = id;
+    '''
+    def delete_bag_rows(self, id):
+        cursor = self.cursor
+        tables = self.get_tables(0)
+        partitioned_tables = self.get_partitioned_tables()
+        
+        for table in tables:
+            if table in partitioned_tables:
+                cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(bag_partition_name(table, id))))
+                self.bag_partitions.discard((table, id))
+                continue
+
+            column_check_query = """
+                SELECT column_name
+                FROM information_schema.columns
+                WHERE table_name = %s AND column_name = %s
+            """
+            cursor.execute(column_check_query, (table, "bag_file_db_id"))
+            result = cursor.fetchone()
+
+            if result:
+                delete_query = sql.SQL("DELETE FROM {} WHERE bag_file_db_id = %s").format(
+                    sql.Identifier(table)
+                )
+                
+                cursor.execute(delete_query, (id,))
+                # print(f"\t\tDeleting rows from '{table}' where bag file id = {id}")
+
+    '''
+    Get the set of tables partitioned by bag_file_db_id. Read from the database once.
+    '''
+    def get_partitioned_tables(self):
+        if (self.partitioned_tables is None):
+            if (self.cursor is None):
+                return set()
+
+            self.cursor.execute("""SELECT c.relname FROM pg_partitioned_table p
+                                   JOIN pg_class c ON c.oid = p.partrelid
+                                   JOIN pg_namespace n ON n.oid = c.relnamespace
+                                   WHERE n.nspname = 'public'""")
+            self.partitioned_tables = set(row[0] for row in self.cursor.fetchall())
+
+        return self.partitioned_tables
+
+    '''
+    Create the partition of a bag in a table partitioned by bag, if it doesn't exist yet.
+    Query: CREATE TABLE IF NOT EXISTS table_name_bag_id PARTITION OF table_name FOR VALUES IN (id)
+    '''
+    def make_bag_partition(self, table_name, bag_file_db_id):
+        if (bag_file_db_id is None or (table_name, bag_file_db_id) in self.bag_partitions):
+            return
+
+        self.cursor.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES IN (%s)").format(
+            sql.Identifier(bag_partition_name(table_name, bag_file_db_id)),
+            sql.Identifier(table_name)
+        ), (bag_file_db_id,))
+        self.bag_partitions.add((table_name, bag_file_db_id))
+
+    '''
+    Change a table into a table partitioned by bag_file_db_id, with one partition for each bag (LIST partitioning). This is
+    done once for a table, in one transaction:
+        1. The table is renamed, and a partitioned table with the same columns, defaults, checks and foreign keys is made
+           under its name. The sequences of its serial columns now belong to the new table.
+        2. A partition is made for each bag in the table, the rows are copied into them and the old table is dropped.
+        3. The primary key and indexes of the old table are made again on the partitioned table. A primary key or unique
+           index of a partitioned table must include bag_file_db_id, so it is added to the primary key (e.g. PRIMARY KEY
+           (id, bag_file_db_id)); a unique index without it can't be kept and is left out.
+    Every row must have a bag: the partition key is part of the primary key, so it can't be NULL. A table with rows whose
+    bag_file_db_id is NULL is not changed; those rows have to be deleted or given a bag first.
+    '''
+    def partition_by_bag(self, table_name):
+        try:
+            cursor = self.cursor
+            conn = self.conn
+            old_name = f"{table_name}_unpartitioned"
+
+            cursor.execute(sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE").format(sql.Identifier(table_name)))
+
+            cursor.execute(sql.SQL("SELECT count(*) FROM {} WHERE bag_file_db_id IS NULL").format(sql.Identifier(table_name)))
+            null_rows = cursor.fetchone()[0]
+            if (null_rows > 0):
+                print(f"\t - '{table_name}' has {null_rows} row(s) without a bag_file_db_id, it can't be partitioned by bag file.")
+                conn.rollback()
+                return
+
+            # The primary key and the other indexes, to make again once the old table is dropped (their names are taken until then)
+            cursor.execute("""SELECT c.conname, array_agg(a.attname ORDER BY array_position(i.indkey::int2[], a.attnum))
+                              FROM pg_constraint c
+                              JOIN pg_index i ON i.indexrelid = c.conindid
+                              JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+                              WHERE c.conrelid = %s::regclass AND c.contype = 'p'
+                              GROUP BY c.conname""", (table_name,))
+            primary_key = cursor.fetchone()
+
+            cursor.execute("""SELECT c.relname, i.indisunique, substring(pg_get_indexdef(i.indexrelid) from ' USING .*$'),
+                                     (SELECT attnum FROM pg_attribute WHERE attrelid = i.indrelid AND attname = 'bag_file_db_id') = ANY(i.indkey)
+                              FROM pg_index i
+                              JOIN pg_class c ON c.oid = i.indexrelid
+                              WHERE i.indrelid = %s::regclass AND NOT i.indisprimary""", (table_name,))
+            indexes = cursor.fetchall()
+
+            cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(sql.Identifier(table_name), sql.Identifier(old_name)))
+            cursor.execute(sql.SQL("""CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE)
+                                      PARTITION BY LIST (bag_file_db_id)""").format(sql.Identifier(table_name), sql.Identifier(old_name)))
+
+            # Keep the sequences of the serial columns (dropped with the old table otherwise)
+            cursor.execute("""SELECT attname, pg_get_serial_sequence(%s, attname) FROM pg_attribute
+                              WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped""", (old_name, old_name))
+            for column, sequence in cursor.fetchall():
+                if sequence is not None:
+                    cursor.execute(sql.SQL("ALTER SEQUENCE {} OWNED BY {}.{}").format(
+                        sql.SQL(sequence), sql.Identifier(table_name), sql.Identifier(column)))
+
+            # Copy the foreign keys
+            cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'", (old_name,))
+            for constraint_name, constraint_def in cursor.fetchall():
+                cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} {}").format(
+                    sql.Identifier(table_name), sql.Identifier(f"{constraint_name}_by_bag"), sql.SQL(constraint_def)))
+
+            # One partition for each bag already in the table, then move the rows
+            cursor.execute(sql.SQL("SELECT DISTINCT bag_file_db_id FROM {}").format(sql.Identifier(old_name)))
+            bag_ids = [row[0] for row in cursor.fetchall()]
+            for bag_file_db_id in bag_ids:
+                cursor.execute(sql.SQL("CREATE TABLE {} PARTITION OF {} FOR VALUES IN (%s)").format(
+                    sql.Identifier(bag_partition_name(table_name, bag_file_db_id)), sql.Identifier(table_name)), (bag_file_db_id,))
+
+            cursor.execute(sql.SQL("INSERT INTO {} SELECT * FROM {}").format(sql.Identifier(table_name), sql.Identifier(old_name)))
+            cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(old_name)))
+
+            # Make the primary key and indexes after the rows are in, which is faster than keeping them up to date row by row
+            if (primary_key is not None):
+                constraint_name, key_columns = primary_key
+                if ("bag_file_db_id" not in key_columns):
+                    key_columns = key_columns + ["bag_file_db_id"]
+
+                cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} PRIMARY KEY ({})").format(
+                    sql.Identifier(table_name), sql.Identifier(constraint_name), sql.SQL(', ').join(map(sql.Identifier, key_columns))))
+
+            for index_name, is_unique, index_method, has_bag_column in indexes:
+                if (is_unique and not has_bag_column):
+                    print(f"\t - The unique index '{index_name}' doesn't include bag_file_db_id, it is not kept.")
+                    continue
+
+                cursor.execute(sql.SQL("CREATE {} INDEX {} ON {} {}").format(
+                    sql.SQL("UNIQUE" if is_unique else ""), sql.Identifier(index_name), sql.Identifier(table_name), sql.SQL(index_method)))
+
+            conn.commit()
+            print(f"'{table_name}' is now partitioned by bag file, with {len(bag_ids)} partition(s).")
+
+            self.partitioned_tables = None
+            self.bag_partitions.update((table_name, bag_file_db_id) for bag_file_db_id in bag_ids)
+
+        except psycopg2.Error as e:
+            print(f"\t - Unable to partition '{table_name}' by bag file: {e}")
+            conn.rollback()
     
     '''
     Disconnect from the database by closing the cursor, committing the connection, and closing the connection.
@@ -382,11 +1143,39 @@ class Database:
         cursor = self.cursor
         conn = self.conn
 
+        # Stop the upload pool, dropping the staging tables of data frames that were never committed
+        if (self.pool is not None):
+            self.drop_staged_dfs()
+            self.upload_executor.shutdown(wait = True)
+            self.pool.closeall()
+
         cursor.close()
         conn.commit()
         conn.close()
         print("PostgreSQL connection is closed.")
 
+''' Check whether a process with the given id is running on this machine '''
+def process_is_running(pid):
+    if (pid == os.getpid()):
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True   # The process exists, but belongs to another user
+    return True
+
+''' Name of the partition of a bag in a table partitioned by bag '''
+def bag_partition_name(table_name, bag_file_db_id):
+    return f"{table_name}_bag_{bag_file_db_id}"
+
+''' The data frames are made for one bag at a time, so the bag of a data frame is the bag_file_db_id of its first row '''
+def get_df_bag_id(df):
+    if ("bag_file_db_id" in df.columns and df.height > 0):
+        return int(df.get_column("bag_file_db_id")[0])
+    return None
+
 def check_bag_name_id(db):
     bag_id = 0
             
@@ -427,7 +1216,10 @@ def main():
     # Try connecting to the database. The script will end if connection fails
     try:
         db_name = input("Please enter the name of the database you'd like to connect to: ")
-        db = Database(to_db, db_username, db_password, db_server, db_port, db_name)
+
+        # Design the Postgres URL: postgresql://<username>:<password>@<host>:<port>/<database name>
+        db_url = f"postgresql://{db_username}:{db_password}@{db_server}:{db_port}/{db_name}"
+        db = Database(to_db, db_url)
     
     except:
         print("Error connecting to the database. Please check database connection parameters.")
@@ -441,7 +1233,11 @@ def main():
         5. Delete all data from a specific bag file
         6. Display the current database size
         7. Display the current tables and table entry counts
-        8. Disconnect and end session\n"""
+        8. Partition a table by bag file
+        9. Add time indexes to the tables
+        10. Select the data of the tables between two times
+        11. Add ingest keys to the tables (needed for the idempotent ingest)
+        12. Disconnect and end session\n"""
         
     while True:
         print(menu)
@@ -501,6 +1297,32 @@ def main():
             db_tables = db.get_tables(1)
         
         elif (user_input == "8"):
+            table_name = input("Enter the name of the table you'd like to partition by bag file: ")
+            db_tables = db.get_tables(0)
+            
+            if (table_name not in db_tables):
+                print("Error, table does not exist.\n")
+            
+            else:
+                db.partition_by_bag(table_name)
+        
+        elif (user_input == "9"):
+            db.add_time_indexes()
+        
+        elif (user_input == "10"):
+            table_names = input("Enter the names of the tables, separated by commas: ")
+            t_start_ns = int(input("Enter the start time (ros_header_time, nanoseconds): "))
+            t_end_ns = int(input("Enter the end time (ros_header_time, nanoseconds): "))
+            
+            dfs = db.query_time_range([name.strip() for name in table_names.split(",")], t_start_ns, t_end_ns)
+            for table_name, df in dfs.items():
+                print(f"\n'{table_name}': {df.shape}")
+                print(df.head(3))
+        
+        elif (user_input == "11"):
+            db.add_ingest_keys()
+        
+        elif (user_input == "12"):
             print("Exiting session.\n")
             db.disconnect()
             break
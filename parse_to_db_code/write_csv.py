@@ -13,6 +13,9 @@ Usage:
 
 Method(s): write_csv(folder, topic, df)
     Write a CSV file for a given topic from a corresponding data frame.
+Method(s): write_columnar(folder, topic, df, output_format)
+    Write a Parquet (zstd) or Arrow IPC file for a given topic straight from the polars
+    data frame, keeping the column types of the data frame (see update_df).
 '''
 
 from io import StringIO 
@@ -24,6 +27,7 @@ import pandas as pd
 import polars as pl
 import pdb
 
+
 def write_csv(folder, topic, df):
     '''
     # Determine the file name, skip if it is sick_lms or velodyne_points
@@ -53,4 +57,22 @@ def write_csv(folder, topic, df):
         else:
             pd_df = df.to_pandas()   # Convert the data frame to Pandas to be easier to write
             pd_df.to_csv(filename, index = False, header = True)   # Write the CSV file
-            print(f"\t + '{filename}' has been successfully written with {df.shape[0]} rows and {df.shape[1]} columns.")
\ No newline at end of file
+            print(f"\t + '{filename}' has been successfully written with {df.shape[0]} rows and {df.shape[1]} columns.")
+
+def write_columnar(folder, topic, df, output_format = "parquet"):
+    # Determine the file name, Arrow IPC files use the .arrow extension
+    extension = ".parquet" if output_format == "parquet" else ".arrow"
+    filename = f"{folder}/{topic.replace('/', '_slash_')}{extension}"
+
+    if not os.path.exists(filename):     # Make sure the same file hasn't been written already
+        print(f"\nWriting a {output_format} file for '{topic}':")
+        if df.is_empty():            # If the data frame is empty, there must be an error
+            print(f"\t - The {filename} data frame is empty. {output_format} file was not written.")
+
+        else:
+            # The data frame already has the types of update_df (e.g. Int64 times and ids), so it is written as it is
+            if (output_format == "parquet"):
+                df.write_parquet(filename, compression = "zstd")
+            else:
+                df.write_ipc(filename)
+            print(f"\t + '{filename}' has been successfully written with {df.shape[0]} rows and {df.shape[1]} columns.")